@@ -0,0 +1,238 @@
+import asyncio
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from typing import Optional
+from app.settings import get_settings
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def make_cache_key(
+    model: str, messages: list, max_tokens: int, temperature: float
+) -> str:
+    # Whitespace-only differences should hit the same entry
+    normalized = {
+        "model": model,
+        "messages": [
+            {
+                "role": message["role"],
+                "content": _WHITESPACE.sub(" ", message["content"]).strip(),
+            }
+            for message in messages
+        ],
+        "max_tokens": max_tokens,
+        "temperature": round(float(temperature), 4),
+    }
+    payload = json.dumps(normalized, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+
+    def as_dict(self) -> dict:
+        stats = asdict(self)
+        lookups = self.hits + self.misses
+        stats["hit_ratio"] = self.hits / lookups if lookups else 0.0
+        return stats
+
+
+class LRUCache:
+    # Bounded in-memory backend; entries expire after their own TTL
+    def __init__(self, max_entries: Optional[int] = None):
+        if max_entries is None:
+            max_entries = get_settings().cache_max_entries
+        self.max_entries = max_entries
+        self.evictions = 0
+        self._entries: OrderedDict = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    async def get(self, key: str) -> Optional[dict]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+
+        self._entries.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: dict, ttl: int):
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    async def clear(self):
+        self._entries.clear()
+
+    async def aclose(self):
+        pass
+
+
+class RedisCache:
+    # Shared backend; expiry and eviction are left to the Redis server
+    def __init__(self, client, prefix: str = "ask:"):
+        self.client = client
+        self.prefix = prefix
+        self.evictions = 0
+
+    @classmethod
+    def from_url(cls, url: str) -> "RedisCache":
+        import redis.asyncio as redis
+
+        return cls(redis.from_url(url))
+
+    async def get(self, key: str) -> Optional[dict]:
+        raw = await self.client.get(self.prefix + key)
+        if raw is None:
+            return None
+        return json.loads(raw)
+
+    async def set(self, key: str, value: dict, ttl: int):
+        await self.client.set(self.prefix + key, json.dumps(value), ex=ttl)
+
+    async def clear(self):
+        async for key in self.client.scan_iter(match=self.prefix + "*"):
+            await self.client.delete(key)
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+class SQLiteCache:
+    # Shared backend for the worker processes of one host. Queries run in a
+    # thread so a worker waiting on another's write never stalls the event
+    # loop. Entries are trimmed to max_entries, soonest to expire first,
+    # every TRIM_EVERY writes, so the table can briefly run over by that many
+    # per worker.
+    TRIM_EVERY = 64
+
+    def __init__(self, path: str, max_entries: Optional[int] = None):
+        if max_entries is None:
+            max_entries = get_settings().cache_max_entries
+        self.max_entries = max_entries
+        self.evictions = 0
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            path, timeout=30, isolation_level=None, check_same_thread=False
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS cache_entries (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_cache_entries_expires_at
+                ON cache_entries (expires_at);
+            """)
+
+    def __len__(self) -> int:
+        with self._lock:
+            row = self._conn.execute("SELECT COUNT(*) FROM cache_entries").fetchone()
+        return row[0]
+
+    def _get(self, key: str) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM cache_entries WHERE key = ? AND expires_at > ?",
+                (key, time.time()),
+            ).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def _set(self, key: str, value: dict, ttl: int):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache_entries (key, value, expires_at) "
+                "VALUES (?, ?, ?)",
+                (key, json.dumps(value), time.time() + ttl),
+            )
+            self._writes += 1
+            if self._writes % self.TRIM_EVERY == 0:
+                self._trim()
+
+    def _trim(self):
+        self._conn.execute(
+            "DELETE FROM cache_entries WHERE expires_at <= ?", (time.time(),)
+        )
+        self.evictions += self._conn.execute(
+            "DELETE FROM cache_entries WHERE key IN (SELECT key FROM cache_entries "
+            "ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        ).rowcount
+
+    def _clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM cache_entries")
+
+    async def get(self, key: str) -> Optional[dict]:
+        return await asyncio.to_thread(self._get, key)
+
+    async def set(self, key: str, value: dict, ttl: int):
+        await asyncio.to_thread(self._set, key, value, ttl)
+
+    async def clear(self):
+        await asyncio.to_thread(self._clear)
+
+    async def aclose(self):
+        with self._lock:
+            self._conn.close()
+
+
+class ResponseCache:
+    def __init__(self, backend, ttl: Optional[int] = None):
+        self.backend = backend
+        self.ttl = get_settings().cache_ttl if ttl is None else ttl
+        self._stats = CacheStats()
+
+    @property
+    def stats(self) -> CacheStats:
+        self._stats.evictions = self.backend.evictions
+        return self._stats
+
+    async def get(self, key: str) -> Optional[dict]:
+        value = await self.backend.get(key)
+        if value is None:
+            self._stats.misses += 1
+        else:
+            self._stats.hits += 1
+        return value
+
+    async def set(self, key: str, value: dict):
+        await self.backend.set(key, value, self.ttl)
+
+    async def clear(self):
+        await self.backend.clear()
+
+    async def aclose(self):
+        await self.backend.aclose()
+
+
+def create_response_cache() -> Optional[ResponseCache]:
+    settings = get_settings()
+    if not settings.cache_enabled:
+        return None
+    if settings.redis_url:
+        return ResponseCache(RedisCache.from_url(settings.redis_url))
+    if settings.shared_state_path:
+        return ResponseCache(SQLiteCache(settings.shared_state_path))
+    return ResponseCache(LRUCache())
@@ -0,0 +1,111 @@
+import threading
+from typing import Callable, Dict
+from app.cache import create_response_cache
+from app.files import create_file_store
+from app.hedging import create_hedger
+from app.ingest import IngestPipeline
+from app.jobs import JobQueue, create_job_store
+from app.openai_client import OpenAIClient
+from app.retrieval import DocumentRetriever
+from app.settings import get_settings
+from app.storage import create_question_store
+
+
+def build_openai_client() -> OpenAIClient:
+    client = OpenAIClient(cache=create_response_cache(), hedger=create_hedger())
+    if get_settings().semantic_cache_enabled:
+        # Pulls in numpy, so only when the semantic cache is on
+        from app.semantic_cache import create_semantic_cache
+
+        client.semantic_cache = create_semantic_cache(client)
+    return client
+
+
+def build_ingest_pipeline() -> IngestPipeline:
+    return IngestPipeline(registry.get("file_store"))
+
+
+def build_retriever() -> DocumentRetriever:
+    return DocumentRetriever(registry.get("file_store"))
+
+
+def build_job_queue() -> JobQueue:
+    # The handler answers like POST /ask, so it lives with the controllers
+    from app.controllers.jobs import job_handler
+
+    handler = job_handler(get_openai_client, get_question_store, get_retriever)
+    return JobQueue(create_job_store(), handler)
+
+
+# Process-wide home for upstream clients so they are built once and reused
+class ClientRegistry:
+    def __init__(self):
+        self._factories: Dict[str, Callable[[], object]] = {
+            "openai": build_openai_client,
+            "question_store": create_question_store,
+            "file_store": create_file_store,
+            "ingest_pipeline": build_ingest_pipeline,
+            "retriever": build_retriever,
+            "job_queue": build_job_queue,
+        }
+        self._clients: Dict[str, object] = {}
+        # Reentrant so a factory can resolve the clients it depends on
+        self._lock = threading.RLock()
+
+    def register(self, name: str, factory: Callable[[], object]):
+        self._factories[name] = factory
+
+    def get(self, name: str):
+        client = self._clients.get(name)
+        if client is None:
+            with self._lock:
+                client = self._clients.get(name)
+                if client is None:
+                    client = self._factories[name]()
+                    self._clients[name] = client
+        return client
+
+    def startup(self):
+        # Builds every client now rather than on first use
+        for name in self._factories:
+            self.get(name)
+
+    async def aclose(self):
+        with self._lock:
+            clients = list(self._clients.values())
+            self._clients.clear()
+        # Dependents were built after what they use, so close them first
+        for client in reversed(clients):
+            await client.aclose()
+
+
+registry = ClientRegistry()
+
+
+def warm_up():
+    # What the first upstream call would otherwise wait for
+    registry.get("openai").warm_up()
+
+
+def get_openai_client() -> OpenAIClient:
+    return registry.get("openai")
+
+
+def get_question_store():
+    return registry.get("question_store")
+
+
+def get_file_store():
+    return registry.get("file_store")
+
+
+def get_ingest_pipeline():
+    return registry.get("ingest_pipeline")
+
+
+def get_retriever():
+    return registry.get("retriever")
+
+
+def get_job_queue():
+    return registry.get("job_queue")
@@ -1,4 +1,24 @@
+from .batch import ask_batch
+from .cache import get_cache_stats
 from .core import root, health
-from .questions import ask_question, get_questions
+from .metrics import get_metrics
+from .upstream import get_upstream_stats
+from .questions import (
+    ask_question,
+    ask_question_stream,
+    get_questions,
+    search_questions,
+)
 
-__all__ = ["root", "health", "ask_question", "get_questions"]
+__all__ = [
+    "root",
+    "health",
+    "get_metrics",
+    "ask_question",
+    "ask_question_stream",
+    "ask_batch",
+    "get_questions",
+    "search_questions",
+    "get_cache_stats",
+    "get_upstream_stats",
+]
@@ -0,0 +1,125 @@
+import asyncio
+from typing import Dict, List, Optional, Tuple
+from fastapi import Depends, HTTPException, Request
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, TypeAdapter, ValidationError
+from app.clients import get_openai_client, get_question_store, get_retriever
+from app.controllers.questions import QuestionRequest, resolve_context
+from app.openai_client import OpenAIClient
+from app.retrieval import DocumentRetriever
+from app.settings import get_settings
+
+_batch_adapter = TypeAdapter(List[QuestionRequest])
+
+
+# Response model
+class BatchItemResult(BaseModel):
+    index: int
+    question: str
+    answer: Optional[str] = None
+    model: Optional[str] = None
+    cached: bool = False
+    error: Optional[str] = None
+
+
+def _parse_batch(body: bytes, content_type: str) -> List[QuestionRequest]:
+    try:
+        # NDJSON: one QuestionRequest object per line
+        if "ndjson" in content_type or "jsonl" in content_type:
+            return [
+                QuestionRequest.model_validate_json(line)
+                for line in body.splitlines()
+                if line.strip()
+            ]
+        return _batch_adapter.validate_json(body)
+    except ValidationError as e:
+        raise RequestValidationError(e.errors(include_url=False))
+
+
+def _start_batch(
+    items: List[QuestionRequest],
+    openai_client: OpenAIClient,
+    store,
+    concurrency: int,
+    retriever: Optional[DocumentRetriever] = None,
+) -> List[asyncio.Task]:
+    semaphore = asyncio.Semaphore(concurrency)
+    unique: Dict[Tuple[str, Optional[str], Optional[str]], asyncio.Task] = {}
+
+    async def answer(item: QuestionRequest):
+        async with semaphore:
+            context = await resolve_context(item, retriever)
+            return await openai_client.acomplete(prompt=item.question, context=context)
+
+    async def resolve(index: int, item: QuestionRequest) -> BatchItemResult:
+        if not item.question.strip():
+            return BatchItemResult(
+                index=index, question=item.question, error="Question cannot be empty"
+            )
+
+        try:
+            completion = await unique[(item.question, item.context, item.file_id)]
+        except HTTPException as e:
+            return BatchItemResult(index=index, question=item.question, error=e.detail)
+        except Exception as e:
+            return BatchItemResult(
+                index=index,
+                question=item.question,
+                error=f"Failed to generate AI response: {str(e)}",
+            )
+
+        store.add(item.question, completion.text, item.context)
+        return BatchItemResult(
+            index=index,
+            question=item.question,
+            answer=completion.text,
+            model=completion.model,
+            cached=completion.cached,
+        )
+
+    # Identical items inside a batch share one upstream call
+    for item in items:
+        key = (item.question, item.context, item.file_id)
+        if item.question.strip() and key not in unique:
+            unique[key] = asyncio.ensure_future(answer(item))
+
+    return [asyncio.ensure_future(resolve(i, item)) for i, item in enumerate(items)]
+
+
+async def ask_batch(
+    http_request: Request,
+    stream: bool = False,
+    openai_client: OpenAIClient = Depends(get_openai_client),
+    store=Depends(get_question_store),
+    retriever: DocumentRetriever = Depends(get_retriever),
+):
+    content_type = http_request.headers.get("content-type", "")
+    items = _parse_batch(await http_request.body(), content_type)
+
+    settings = get_settings()
+    if not items:
+        raise HTTPException(status_code=400, detail="Batch cannot be empty")
+    if len(items) > settings.batch_max_items:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Batch exceeds the {settings.batch_max_items} question limit",
+        )
+
+    tasks = _start_batch(
+        items, openai_client, store, settings.batch_concurrency, retriever
+    )
+
+    if not stream:
+        return await asyncio.gather(*tasks)
+
+    async def lines():
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                result = await next_done
+                yield result.model_dump_json() + "\n"
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
@@ -0,0 +1,14 @@
+from fastapi import Depends
+from app.clients import get_openai_client
+from app.openai_client import OpenAIClient
+
+
+async def get_cache_stats(openai_client: OpenAIClient = Depends(get_openai_client)):
+    if openai_client.cache is None:
+        stats = {"enabled": False}
+    else:
+        stats = {"enabled": True, **openai_client.cache.stats.as_dict()}
+
+    if openai_client.semantic_cache is not None:
+        stats["semantic"] = openai_client.semantic_cache.stats()
+    return stats
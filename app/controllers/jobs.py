@@ -0,0 +1,70 @@
+from typing import Awaitable, Callable, Optional
+from fastapi import Depends, HTTPException, Response
+from pydantic import BaseModel, Field
+from app.clients import get_job_queue
+from app.controllers.questions import QuestionRequest, QuestionResponse, ask_question
+from app.jobs import JobFailed, JobQueue, JobQueueFull
+
+
+# Request/Response models
+class JobRequest(QuestionRequest):
+    # Higher runs first
+    priority: int = Field(0, ge=0, le=9)
+
+
+class JobResponse(BaseModel):
+    id: str
+    status: str
+    priority: int
+    request: QuestionRequest
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    result: Optional[QuestionResponse] = None
+    error: Optional[str] = None
+
+
+def job_handler(
+    openai_client: Callable, store: Callable, retriever: Callable
+) -> Callable[[dict], Awaitable[dict]]:
+    # Answers a queued QuestionRequest exactly as POST /ask would; clients
+    # are looked up per job, and an HTTP error becomes the job's error
+    async def answer(request: dict) -> dict:
+        item = QuestionRequest.model_validate(request)
+        try:
+            response = await ask_question(item, openai_client(), store(), retriever())
+        except HTTPException as e:
+            raise JobFailed(e.detail) from None
+        return response.model_dump()
+
+    return answer
+
+
+async def submit_job(
+    request: JobRequest,
+    response: Response,
+    queue: JobQueue = Depends(get_job_queue),
+) -> JobResponse:
+    if not request.question.strip():
+        raise HTTPException(status_code=400, detail="Question cannot be empty")
+
+    try:
+        job = await queue.submit(
+            request.model_dump(exclude={"priority"}), request.priority
+        )
+    except JobQueueFull:
+        raise HTTPException(
+            status_code=503,
+            detail="Job queue is full, try again later",
+            headers={"Retry-After": "5"},
+        )
+
+    response.headers["Location"] = f"/api/v1/jobs/{job.id}"
+    return JobResponse(**job.as_dict())
+
+
+async def get_job(job_id: str, queue: JobQueue = Depends(get_job_queue)) -> JobResponse:
+    job = await queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return JobResponse(**job.as_dict())
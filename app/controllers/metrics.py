@@ -0,0 +1,67 @@
+from fastapi import Depends
+from fastapi.responses import PlainTextResponse
+from app.clients import get_openai_client
+from app.metrics import CONTENT_TYPE, REGISTRY, render_family
+from app.openai_client import OpenAIClient
+
+
+def _client_families(openai_client: OpenAIClient) -> str:
+    # Read from the counters the client already keeps, at scrape time
+    caches = []
+    if openai_client.cache is not None:
+        caches.append(("exact", openai_client.cache.stats.as_dict()))
+    if openai_client.semantic_cache is not None:
+        caches.append(("semantic", openai_client.semantic_cache.stats()))
+
+    limiter = openai_client.limiter.stats()
+    breaker = openai_client.resilience.breaker
+    return "".join(
+        [
+            render_family(
+                "cache_lookups_total",
+                "counter",
+                "Response cache lookups",
+                [
+                    (
+                        "cache_lookups_total",
+                        {"cache": name, "result": result},
+                        stats[key],
+                    )
+                    for name, stats in caches
+                    for result, key in (("hit", "hits"), ("miss", "misses"))
+                ],
+            ),
+            render_family(
+                "cache_hit_ratio",
+                "gauge",
+                "Share of response cache lookups that hit",
+                [
+                    ("cache_hit_ratio", {"cache": name}, stats["hit_ratio"])
+                    for name, stats in caches
+                ],
+            ),
+            render_family(
+                "upstream_in_flight",
+                "gauge",
+                "Upstream LLM calls holding a limiter slot",
+                [("upstream_in_flight", {}, limiter["in_flight"])],
+            ),
+            render_family(
+                "upstream_queued",
+                "gauge",
+                "Upstream LLM calls waiting for a limiter slot",
+                [("upstream_queued", {}, limiter["queued"])],
+            ),
+            render_family(
+                "upstream_circuit_open",
+                "gauge",
+                "1 while the upstream circuit breaker is failing fast",
+                [("upstream_circuit_open", {}, int(breaker.state != "closed"))],
+            ),
+        ]
+    )
+
+
+async def get_metrics(openai_client: OpenAIClient = Depends(get_openai_client)):
+    body = REGISTRY.render() + _client_families(openai_client)
+    return PlainTextResponse(body, media_type=CONTENT_TYPE)
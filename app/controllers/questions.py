@@ -1,50 +1,246 @@
-from fastapi import HTTPException
+import hashlib
+import json
+from datetime import datetime
+from fastapi import Depends, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import Optional
+from app import tracing
+from app.clients import get_openai_client, get_question_store, get_retriever
 from app.openai_client import OpenAIClient
+from app.resilience import UpstreamError
+from app.retrieval import DocumentRetriever, format_excerpts
+from app.tokens import PromptTooLarge, TokenUsage
 
 
 # Request/Response models
 class QuestionRequest(BaseModel):
     question: str
     context: Optional[str] = None
+    file_id: Optional[str] = None
 
 
 class QuestionResponse(BaseModel):
     question: str
     answer: str
-    model: str = "gpt-3.5-turbo"
+    # The model that actually answered, which depends on the backend used
+    model: str
+    cached: bool = False
+    usage: Optional[TokenUsage] = None
 
 
-# In-memory storage for demo
-questions_db = []
+def upstream_http_error(error: UpstreamError) -> HTTPException:
+    # Timeouts, open circuits and upstream rate limits keep their own status
+    headers = None
+    if error.retry_after is not None:
+        headers = {"Retry-After": str(max(1, round(error.retry_after)))}
+    return HTTPException(
+        status_code=error.status_code,
+        detail=f"Failed to generate AI response: {str(error)}",
+        headers=headers,
+    )
 
 
-async def ask_question(request: QuestionRequest):
-    if not request.question.strip():
-        raise HTTPException(status_code=400, detail="Question cannot be empty")
+async def resolve_context(
+    request: QuestionRequest, retriever: DocumentRetriever
+) -> Optional[str]:
+    # Only the most relevant chunks of an uploaded PDF are sent upstream,
+    # so prompt size stays flat however long the document is
+    if not request.file_id:
+        return request.context
 
-    try:
-        openai_client = OpenAIClient()
+    info = await run_in_threadpool(retriever.file_store.get, request.file_id)
+    if info is None:
+        raise HTTPException(status_code=404, detail="File not found")
 
-        ai_response = openai_client.generate_response(
-            prompt=request.question, context=request.context
+    chunks = await run_in_threadpool(
+        retriever.retrieve, info["sha256"], request.question
+    )
+    if chunks is None:
+        raise HTTPException(
+            status_code=409, detail="PDF text extraction has not finished yet"
         )
 
-        question_data = {
-            "question": request.question,
-            "answer": ai_response,
-            "context": request.context,
-        }
-        questions_db.append(question_data)
+    parts = [request.context] if request.context else []
+    if chunks:
+        parts.append(format_excerpts(info["filename"], chunks))
+    return "\n\n".join(parts) or None
+
+
+async def ask_question(
+    request: QuestionRequest,
+    openai_client: OpenAIClient = Depends(get_openai_client),
+    store=Depends(get_question_store),
+    retriever: DocumentRetriever = Depends(get_retriever),
+):
+    with tracing.span("ask_question") as span:
+        if not request.question.strip():
+            raise HTTPException(status_code=400, detail="Question cannot be empty")
+        span.set_attribute("question.length", len(request.question))
+        span.set_attribute("question.has_file", request.file_id is not None)
+
+        with tracing.span("resolve_context"):
+            context = await resolve_context(request, retriever)
+
+        try:
+            completion = await openai_client.acomplete(
+                prompt=request.question, context=context
+            )
+            span.set_attribute("llm.cached", completion.cached)
+
+            with tracing.span("questions.store"):
+                store.add(request.question, completion.text, request.context)
 
-        return QuestionResponse(question=request.question, answer=ai_response)
+            return QuestionResponse(
+                question=request.question,
+                answer=completion.text,
+                model=completion.model,
+                cached=completion.cached,
+                usage=completion.usage,
+            )
 
+        except PromptTooLarge as e:
+            raise HTTPException(status_code=413, detail=str(e))
+        except UpstreamError as e:
+            raise upstream_http_error(e)
+        except Exception as e:
+            raise HTTPException(
+                status_code=500, detail=f"Failed to generate AI response: {str(e)}"
+            )
+
+
+def _sse(data: dict, event: Optional[str] = None) -> str:
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+
+async def ask_question_stream(
+    request: QuestionRequest,
+    openai_client: OpenAIClient = Depends(get_openai_client),
+    store=Depends(get_question_store),
+    retriever: DocumentRetriever = Depends(get_retriever),
+):
+    if not request.question.strip():
+        raise HTTPException(status_code=400, detail="Question cannot be empty")
+
+    context = await resolve_context(request, retriever)
+    stream = openai_client.astream(prompt=request.question, context=context)
+
+    # Wait for the first delta so upstream failures still surface as a 500
+    try:
+        first_item = await anext(stream, None)
+    except PromptTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except UpstreamError as e:
+        raise upstream_http_error(e)
     except Exception as e:
         raise HTTPException(
             status_code=500, detail=f"Failed to generate AI response: {str(e)}"
         )
 
+    async def items():
+        if first_item is not None:
+            yield first_item
+        async for item in stream:
+            yield item
+
+    async def events():
+        parts = []
+        model, cached, usage = openai_client.model, False, None
+        try:
+            async for item in items():
+                if not isinstance(item, str):
+                    # The closing Completion reports who actually answered
+                    model, cached, usage = item.model, item.cached, item.usage
+                    continue
+                parts.append(item)
+                yield _sse({"delta": item})
+
+        except Exception as e:
+            yield _sse(
+                {"detail": f"Failed to generate AI response: {str(e)}"}, event="error"
+            )
+            return
+
+        answer = "".join(parts).strip()
+        store.add(request.question, answer, request.context)
+        response = QuestionResponse(
+            question=request.question,
+            answer=answer,
+            model=model,
+            cached=cached,
+            usage=usage,
+        )
+        yield _sse(response.model_dump(), event="done")
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+QUESTION_FIELDS = ("id", "question", "answer", "context", "created_at")
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
+
+
+async def get_questions(
+    http_request: Request,
+    limit: int = Query(100, ge=1, le=1000),
+    after: Optional[int] = Query(None, description="Cursor: id of the last row seen"),
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    context: Optional[str] = None,
+    fields: Optional[str] = Query(None, description="Comma-separated field names"),
+    store=Depends(get_question_store),
+):
+    projection = None
+    if fields:
+        projection = [name.strip() for name in fields.split(",") if name.strip()]
+        unknown = set(projection) - set(QUESTION_FIELDS)
+        if unknown:
+            raise HTTPException(
+                status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}"
+            )
+
+    # One extra row tells us whether there is a next page
+    rows = await run_in_threadpool(
+        store.list_questions,
+        limit=limit + 1,
+        after=after,
+        since=since.timestamp() if since else None,
+        until=until.timestamp() if until else None,
+        context=context,
+    )
+
+    headers = {}
+    if len(rows) > limit:
+        rows = rows[:limit]
+        headers["X-Next-Cursor"] = str(rows[-1]["id"])
+
+    if projection:
+        rows = [{name: row[name] for name in projection} for row in rows]
+
+    body = json.dumps(rows, separators=(",", ":")).encode("utf-8")
+    etag = f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+    headers["ETag"] = etag
+
+    if _etag_matches(http_request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
 
-async def get_questions():
-    return questions_db
+async def search_questions(
+    q: str = Query(..., min_length=1, max_length=500),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0, le=10000),
+    store=Depends(get_question_store),
+):
+    return await run_in_threadpool(store.search, q, limit=limit, offset=offset)
@@ -1,8 +1,17 @@
+import hashlib
 import os
+import time
 import uuid
 from typing import Optional
-from fastapi import HTTPException, UploadFile, File
+from fastapi import Depends, HTTPException, UploadFile, File
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
+from app import tracing
+from app.clients import get_file_store, get_ingest_pipeline
+from app.files import FileStore
+from app.ingest import IngestPipeline, IngestQueueFull
+from app.metrics import UPLOAD_BYTES, UPLOAD_DURATION
+from app.settings import get_settings
 
 
 # Response model
@@ -10,38 +19,163 @@ class PDFUploadResponse(BaseModel):
     file_id: str
     filename: str
     message: str
+    size: Optional[int] = None
+    sha256: Optional[str] = None
+    deduplicated: bool = False
+    status: Optional[str] = None
 
 
-# Create uploads directory if it doesn't exist
-UPLOAD_DIR = "uploads"
-os.makedirs(UPLOAD_DIR, exist_ok=True)
+class UploadStatusResponse(BaseModel):
+    file_id: str
+    filename: str
+    status: str
+    pages_done: int = 0
+    pages_total: Optional[int] = None
+    error: Optional[str] = None
+
+
+MAX_UPLOAD_SIZE = 10 * 1024 * 1024  # 10MB
+
 
+def _write_chunk(out, chunk: bytes):
+    out.write(chunk)
 
-async def upload_pdf(file: UploadFile = File(...)) -> PDFUploadResponse:
-    if not file.filename.lower().endswith(".pdf"):
-        raise HTTPException(status_code=400, detail="Only PDF files are allowed")
 
-    max_size = 10 * 1024 * 1024  # 10MB
-    if file.size and file.size > max_size:
-        raise HTTPException(status_code=400, detail="File size exceeds 10MB limit")
+def _discard(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+async def _hash_upload(file: UploadFile, max_size: int):
+    # hashlib releases the GIL for large buffers, so hashing runs off the loop
+    chunk_size = get_settings().upload_chunk_size
+    digest = hashlib.sha256()
+    size = 0
+    while chunk := await file.read(chunk_size):
+        size += len(chunk)
+        if size > max_size:
+            raise HTTPException(status_code=400, detail="File size exceeds 10MB limit")
+        await run_in_threadpool(digest.update, chunk)
+    return digest.hexdigest(), size
+
 
+async def _copy_upload(file: UploadFile, temp_path: str):
+    chunk_size = get_settings().upload_chunk_size
+    out = await run_in_threadpool(open, temp_path, "wb")
     try:
-        content = await file.read()
+        while chunk := await file.read(chunk_size):
+            await run_in_threadpool(_write_chunk, out, chunk)
+    finally:
+        await run_in_threadpool(out.close)
 
-        if len(content) > max_size:
+
+def _queue_full() -> HTTPException:
+    return HTTPException(
+        status_code=503,
+        detail="PDF processing queue is full, try again later",
+        headers={"Retry-After": "5"},
+    )
+
+
+async def upload_pdf(
+    file: UploadFile = File(...),
+    file_store: FileStore = Depends(get_file_store),
+    pipeline: IngestPipeline = Depends(get_ingest_pipeline),
+) -> PDFUploadResponse:
+    with tracing.span("upload_pdf") as span:
+        if not file.filename.lower().endswith(".pdf"):
+            raise HTTPException(status_code=400, detail="Only PDF files are allowed")
+
+        # Shed load before reading the body when extraction is backed up
+        if pipeline.full():
+            raise _queue_full()
+
+        max_size = MAX_UPLOAD_SIZE
+        if file.size and file.size > max_size:
             raise HTTPException(status_code=400, detail="File size exceeds 10MB limit")
 
         file_id = str(uuid.uuid4())
+        temp_path = None
+        size = None
+        outcome = "error"
+        start = time.perf_counter()
+
+        try:
+            # Hash first: content that is already stored is never written again
+            with tracing.span("upload.hash"):
+                sha256, size = await _hash_upload(file, max_size)
+            span.set_attribute("upload.size", size)
+            deduplicated = await run_in_threadpool(
+                file_store.link, file_id, file.filename, sha256, size
+            )
+
+            if not deduplicated:
+                with tracing.span("upload.store"):
+                    temp_path = file_store.temp_path()
+                    await file.seek(0)
+                    await _copy_upload(file, temp_path)
+                    await run_in_threadpool(
+                        file_store.add, file_id, file.filename, sha256, size, temp_path
+                    )
+
+            try:
+                job = await run_in_threadpool(
+                    pipeline.submit, sha256, get_settings().ingest_submit_timeout
+                )
+            except IngestQueueFull:
+                await run_in_threadpool(file_store.remove, file_id)
+                raise _queue_full()
+
+            outcome = "deduplicated" if deduplicated else "stored"
+            return PDFUploadResponse(
+                file_id=file_id,
+                filename=file.filename,
+                message="PDF uploaded successfully",
+                size=size,
+                sha256=sha256,
+                deduplicated=deduplicated,
+                status=job.status,
+            )
+
+        except HTTPException:
+            outcome = "rejected"
+            raise
+        except Exception as e:
+            if temp_path:
+                await run_in_threadpool(_discard, temp_path)
+            raise HTTPException(
+                status_code=500, detail=f"Error uploading PDF: {str(e)}"
+            )
+        finally:
+            span.set_attribute("upload.outcome", outcome)
+            UPLOAD_DURATION.labels(outcome).observe(time.perf_counter() - start)
+            if size is not None:
+                UPLOAD_BYTES.observe(size)
 
-        filename = f"{file_id}_{file.filename}"
-        file_path = os.path.join(UPLOAD_DIR, filename)
 
-        with open(file_path, "wb") as f:
-            f.write(content)
+async def get_upload_status(
+    file_id: str,
+    file_store: FileStore = Depends(get_file_store),
+    pipeline: IngestPipeline = Depends(get_ingest_pipeline),
+) -> UploadStatusResponse:
+    info = await run_in_threadpool(file_store.get, file_id)
+    if info is None:
+        raise HTTPException(status_code=404, detail="File not found")
 
-        return PDFUploadResponse(
-            file_id=file_id, filename=file.filename, message="PDF uploaded successfully"
+    job = await run_in_threadpool(pipeline.status, info["sha256"])
+    if job is None:
+        # Stored, but its extraction was dropped (e.g. by a restart)
+        return UploadStatusResponse(
+            file_id=file_id, filename=info["filename"], status="pending"
         )
 
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error uploading PDF: {str(e)}")
+    return UploadStatusResponse(
+        file_id=file_id,
+        filename=info["filename"],
+        status=job.status,
+        pages_done=job.pages_done,
+        pages_total=job.pages_total,
+        error=job.error,
+    )
@@ -0,0 +1,18 @@
+from fastapi import Depends
+from app.clients import get_openai_client
+from app.openai_client import OpenAIClient
+
+
+async def get_upstream_stats(
+    openai_client: OpenAIClient = Depends(get_openai_client),
+):
+    stats = {
+        "resilience": openai_client.resilience.stats(),
+        "limiter": openai_client.limiter.stats(),
+        "routing": openai_client.router.stats(),
+    }
+    if openai_client.hedger is None:
+        stats["hedging"] = {"enabled": False}
+    else:
+        stats["hedging"] = openai_client.hedger.stats()
+    return stats
@@ -0,0 +1,216 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import List, Optional
+from app.settings import get_settings
+
+
+class FileStore:
+    # Content-addressed blobs under objects/ab/cd/<sha256>.pdf, so identical
+    # uploads share one file and no directory grows past a few hundred
+    # entries. SQLite maps each file_id to its hash and counts references.
+    def __init__(self, root: str):
+        self.root = root
+        self.objects_dir = os.path.join(root, "objects")
+        self.tmp_dir = os.path.join(root, "tmp")
+        os.makedirs(self.objects_dir, exist_ok=True)
+        os.makedirs(self.tmp_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            os.path.join(root, "files.db"), check_same_thread=False
+        )
+        self._conn.row_factory = sqlite3.Row
+        with self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS blobs (
+                    sha256 TEXT PRIMARY KEY,
+                    size INTEGER NOT NULL,
+                    refcount INTEGER NOT NULL,
+                    pages INTEGER
+                );
+                CREATE TABLE IF NOT EXISTS files (
+                    file_id TEXT PRIMARY KEY,
+                    filename TEXT NOT NULL,
+                    sha256 TEXT NOT NULL REFERENCES blobs (sha256),
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_files_sha256 ON files (sha256);
+                """)
+            columns = {
+                row["name"] for row in self._conn.execute("PRAGMA table_info(blobs)")
+            }
+            if "pages" not in columns:
+                self._conn.execute("ALTER TABLE blobs ADD COLUMN pages INTEGER")
+
+    def object_path(self, sha256: str) -> str:
+        return os.path.join(self.objects_dir, sha256[:2], sha256[2:4], f"{sha256}.pdf")
+
+    def text_path(self, sha256: str) -> str:
+        return os.path.join(
+            self.objects_dir, sha256[:2], sha256[2:4], f"{sha256}.pages.json"
+        )
+
+    def temp_path(self) -> str:
+        # Same filesystem as objects/, so publishing a blob is an atomic rename
+        return os.path.join(self.tmp_dir, f"{uuid.uuid4().hex}.part")
+
+    def link(self, file_id: str, filename: str, sha256: str, size: int) -> bool:
+        # Records a new file_id for content that is already stored; returns
+        # False when the blob is unknown and has to be written with add()
+        with self._lock, self._conn:
+            updated = self._conn.execute(
+                "UPDATE blobs SET refcount = refcount + 1 WHERE sha256 = ?",
+                (sha256,),
+            ).rowcount
+            if not updated:
+                return False
+            self._insert_file(file_id, filename, sha256, size)
+        return True
+
+    def add(self, file_id: str, filename: str, sha256: str, size: int, source: str):
+        # Publishes source as the blob for sha256 unless a concurrent upload
+        # of the same content got there first, in which case source is dropped
+        with self._lock, self._conn:
+            updated = self._conn.execute(
+                "UPDATE blobs SET refcount = refcount + 1 WHERE sha256 = ?",
+                (sha256,),
+            ).rowcount
+            if updated:
+                os.remove(source)
+            else:
+                path = self.object_path(sha256)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(source, path)
+                self._conn.execute(
+                    "INSERT INTO blobs (sha256, size, refcount) VALUES (?, ?, 1)",
+                    (sha256, size),
+                )
+            self._insert_file(file_id, filename, sha256, size)
+
+    def _insert_file(self, file_id: str, filename: str, sha256: str, size: int):
+        self._conn.execute(
+            "INSERT INTO files (file_id, filename, sha256, size, created_at) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (file_id, filename, sha256, size, time.time()),
+        )
+
+    def get(self, file_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT file_id, filename, sha256, size, created_at "
+                "FROM files WHERE file_id = ?",
+                (file_id,),
+            ).fetchone()
+        return dict(row) if row else None
+
+    def path(self, file_id: str) -> Optional[str]:
+        info = self.get(file_id)
+        return self.object_path(info["sha256"]) if info else None
+
+    def refcount(self, sha256: str) -> int:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT refcount FROM blobs WHERE sha256 = ?", (sha256,)
+            ).fetchone()
+        return row["refcount"] if row else 0
+
+    def save_text(
+        self, sha256: str, pages: List[str], chunks: Optional[List[dict]] = None
+    ):
+        # Extracted text is content-addressed too, so duplicates parse once
+        temp_path = self.temp_path()
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump({"pages": pages, "chunks": chunks}, f)
+        os.replace(temp_path, self.text_path(sha256))
+        self._set_page_count(sha256, len(pages))
+
+    def _set_page_count(self, sha256: str, pages: int):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE blobs SET pages = ? WHERE sha256 = ?", (pages, sha256)
+            )
+
+    def _load_extracted(self, sha256: str) -> Optional[dict]:
+        try:
+            with open(self.text_path(sha256), encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def load_text(self, sha256: str) -> Optional[List[str]]:
+        extracted = self._load_extracted(sha256)
+        return extracted["pages"] if extracted else None
+
+    def load_chunks(self, sha256: str) -> Optional[List[dict]]:
+        extracted = self._load_extracted(sha256)
+        if extracted is None:
+            return None
+        if extracted.get("chunks") is None:
+            # Extracted before retrieval chunks were stored alongside the text
+            from app.retrieval import chunk_pages
+
+            return chunk_pages(extracted["pages"])
+        return extracted["chunks"]
+
+    def page_count(self, sha256: str) -> Optional[int]:
+        # Status polls read the count from the blobs row instead of parsing
+        # the extracted text; None means the text has not been saved yet
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT pages FROM blobs WHERE sha256 = ?", (sha256,)
+            ).fetchone()
+        if row is not None and row["pages"] is not None:
+            return row["pages"]
+
+        # Text extracted before page counts were recorded
+        pages = self.load_text(sha256)
+        if pages is None:
+            return None
+        self._set_page_count(sha256, len(pages))
+        return len(pages)
+
+    def has_text(self, sha256: str) -> bool:
+        return os.path.exists(self.text_path(sha256))
+
+    def remove(self, file_id: str) -> bool:
+        # The blob is deleted once its last file_id is gone
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT sha256 FROM files WHERE file_id = ?", (file_id,)
+            ).fetchone()
+            if row is None:
+                return False
+            sha256 = row["sha256"]
+            self._conn.execute("DELETE FROM files WHERE file_id = ?", (file_id,))
+            self._conn.execute(
+                "UPDATE blobs SET refcount = refcount - 1 WHERE sha256 = ?", (sha256,)
+            )
+            remaining = self._conn.execute(
+                "SELECT refcount FROM blobs WHERE sha256 = ?", (sha256,)
+            ).fetchone()["refcount"]
+            if remaining <= 0:
+                self._conn.execute("DELETE FROM blobs WHERE sha256 = ?", (sha256,))
+                for path in (self.object_path(sha256), self.text_path(sha256)):
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+        return True
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    async def aclose(self):
+        await asyncio.to_thread(self.close)
+
+
+def create_file_store() -> FileStore:
+    return FileStore(get_settings().upload_dir)
@@ -0,0 +1,156 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from typing import Awaitable, Callable, Optional, TypeVar
+from app.settings import get_settings
+
+# Unused hedge credit saved up for bursts of slow calls
+HEDGE_MAX_CREDIT = 10.0
+# Samples between percentile recomputations
+PERCENTILE_REFRESH = 32
+
+T = TypeVar("T")
+
+
+class LatencyTracker:
+    # Sliding window of recent call latencies; the percentile is recomputed
+    # every PERCENTILE_REFRESH samples rather than sorted on every call
+    def __init__(self, window: Optional[int] = None):
+        window = get_settings().hedge_window if window is None else window
+        self._samples = deque(maxlen=window)
+        self._since_refresh = 0
+        self._cached: dict = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+            self._since_refresh += 1
+            if self._since_refresh >= PERCENTILE_REFRESH:
+                self._cached.clear()
+                self._since_refresh = 0
+
+    def percentile(self, pct: float) -> Optional[float]:
+        with self._lock:
+            if not self._samples:
+                return None
+            value = self._cached.get(pct)
+            if value is None:
+                ordered = sorted(self._samples)
+                index = min(len(ordered) - 1, int(len(ordered) * pct / 100))
+                value = self._cached[pct] = ordered[index]
+            return value
+
+
+class Hedger:
+    # Fires a duplicate call when the first has not answered within the
+    # given percentile of recent latency and keeps whichever finishes first.
+    # Hedges are paid for from a credit that grows by `budget` per call, so
+    # they add at most that fraction of extra upstream requests.
+    def __init__(
+        self,
+        percentile: Optional[float] = None,
+        budget: Optional[float] = None,
+        min_delay: Optional[float] = None,
+        min_samples: Optional[int] = None,
+        tracker: Optional[LatencyTracker] = None,
+    ):
+        settings = get_settings()
+        self.percentile = (
+            settings.hedge_percentile if percentile is None else percentile
+        )
+        self.budget = settings.hedge_budget if budget is None else budget
+        self.min_delay = settings.hedge_min_delay if min_delay is None else min_delay
+        self.min_samples = (
+            settings.hedge_min_samples if min_samples is None else min_samples
+        )
+        self.tracker = tracker or LatencyTracker()
+        self.calls = 0
+        self.fired = 0
+        self.won = 0
+        self.over_budget = 0
+        self._credit = 0.0
+
+    def delay(self) -> Optional[float]:
+        # None until enough calls have been seen to know what "slow" means
+        if len(self.tracker) < self.min_samples:
+            return None
+        return max(self.min_delay, self.tracker.percentile(self.percentile))
+
+    def _spend(self) -> bool:
+        if self._credit < 1:
+            self.over_budget += 1
+            return False
+        self._credit -= 1
+        return True
+
+    async def run(self, call: Callable[[], Awaitable[T]]) -> T:
+        self.calls += 1
+        self._credit = min(HEDGE_MAX_CREDIT, self._credit + self.budget)
+        delay = self.delay()
+
+        start = time.monotonic()
+        primary = asyncio.ensure_future(call())
+        pending = {primary}
+        try:
+            if delay is not None:
+                done, _ = await asyncio.wait(pending, timeout=delay)
+                if not done and self._spend():
+                    self.fired += 1
+                    hedge_start = time.monotonic()
+                    hedge = asyncio.ensure_future(call())
+                    pending.add(hedge)
+                    return await self._race(primary, hedge, start, hedge_start)
+
+            result = await primary
+            self.tracker.record(time.monotonic() - start)
+            return result
+        finally:
+            for task in pending:
+                if not task.done():
+                    task.cancel()
+
+    async def _race(self, primary, hedge, start: float, hedge_start: float):
+        started = {primary: start, hedge: hedge_start}
+        pending = {primary, hedge}
+        error = None
+        while pending:
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                if task.exception() is not None:
+                    error = error or task.exception()
+                    continue
+                now = time.monotonic()
+                self.tracker.record(now - started[task])
+                # The loser is cancelled, so its latency is only known to be
+                # at least this long; recording that keeps the tail honest
+                for loser in pending:
+                    self.tracker.record(now - started[loser])
+                if task is hedge:
+                    self.won += 1
+                return task.result()
+        raise error
+
+    def stats(self) -> dict:
+        return {
+            "enabled": True,
+            "calls": self.calls,
+            "fired": self.fired,
+            "won": self.won,
+            "over_budget": self.over_budget,
+            "fire_rate": self.fired / self.calls if self.calls else 0.0,
+            "win_rate": self.won / self.fired if self.fired else 0.0,
+            "delay": self.delay(),
+        }
+
+
+def create_hedger() -> Optional[Hedger]:
+    if not get_settings().hedge_enabled:
+        return None
+    return Hedger()
@@ -0,0 +1,167 @@
+import asyncio
+import multiprocessing
+import queue
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor
+from dataclasses import asdict, dataclass
+from typing import Dict, List, Optional
+from app.files import FileStore
+from app.retrieval import chunk_pages
+from app.settings import get_settings
+
+_STOP = object()
+
+
+# Run inside the worker processes; pypdf is only imported there
+def count_pages(path: str) -> int:
+    from pypdf import PdfReader
+
+    return len(PdfReader(path).pages)
+
+
+def extract_pages(path: str, start: int, stop: int) -> List[str]:
+    from pypdf import PdfReader
+
+    reader = PdfReader(path)
+    return [reader.pages[i].extract_text() or "" for i in range(start, stop)]
+
+
+@dataclass
+class IngestJob:
+    sha256: str
+    status: str = "queued"
+    pages_done: int = 0
+    pages_total: Optional[int] = None
+    error: Optional[str] = None
+
+    def as_dict(self) -> dict:
+        return asdict(self)
+
+
+class IngestQueueFull(Exception):
+    pass
+
+
+class IngestPipeline:
+    # Dispatcher threads take jobs off a bounded queue and farm page ranges
+    # out to a process pool, so parsing never holds the API's GIL or loop.
+    # Jobs are keyed by content hash: duplicate uploads share one extraction.
+    def __init__(
+        self,
+        file_store: FileStore,
+        workers: Optional[int] = None,
+        queue_size: Optional[int] = None,
+        pages_per_task: Optional[int] = None,
+        executor: Optional[Executor] = None,
+    ):
+        settings = get_settings()
+        workers = settings.ingest_workers if workers is None else workers
+        if queue_size is None:
+            queue_size = settings.ingest_queue_size
+        if pages_per_task is None:
+            pages_per_task = settings.ingest_pages_per_task
+        self.file_store = file_store
+        self.workers = workers
+        self.pages_per_task = pages_per_task
+        self._owns_executor = executor is None
+        self._executor = executor or ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+        )
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._jobs: Dict[str, IngestJob] = {}
+        self._lock = threading.Lock()
+        self._threads = [
+            threading.Thread(target=self._work_loop, daemon=True)
+            for _ in range(workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def full(self) -> bool:
+        return self._queue.full()
+
+    def submit(self, sha256: str, timeout: Optional[float] = None) -> IngestJob:
+        # Waits up to timeout for queue space, then raises IngestQueueFull
+        with self._lock:
+            job = self._jobs.get(sha256)
+            if job is not None and job.status != "failed":
+                return job
+            if self.file_store.has_text(sha256):
+                return IngestJob(sha256, status="done")
+            job = self._jobs[sha256] = IngestJob(sha256)
+
+        try:
+            self._queue.put(job, timeout=timeout)
+        except queue.Full:
+            with self._lock:
+                self._jobs.pop(sha256, None)
+            raise IngestQueueFull("Ingestion queue is full")
+        return job
+
+    def status(self, sha256: str) -> Optional[IngestJob]:
+        with self._lock:
+            job = self._jobs.get(sha256)
+        if job is not None:
+            return job
+        pages = self.file_store.page_count(sha256)
+        if pages is None:
+            return None
+        return IngestJob(sha256, status="done", pages_done=pages, pages_total=pages)
+
+    def join(self):
+        # Blocks until every queued job has finished
+        self._queue.join()
+
+    def _work_loop(self):
+        while True:
+            job = self._queue.get()
+            try:
+                if job is _STOP:
+                    return
+                self._process(job)
+            except Exception as e:
+                job.status = "failed"
+                job.error = str(e)
+            else:
+                # Finished text lives on disk; status() reads it from there
+                with self._lock:
+                    self._jobs.pop(job.sha256, None)
+            finally:
+                self._queue.task_done()
+
+    def _process(self, job: IngestJob):
+        path = self.file_store.object_path(job.sha256)
+        job.status = "processing"
+        job.pages_total = self._executor.submit(count_pages, path).result()
+
+        pages: List[str] = []
+        for start in range(0, job.pages_total, self.pages_per_task):
+            stop = min(start + self.pages_per_task, job.pages_total)
+            pages.extend(
+                self._executor.submit(extract_pages, path, start, stop).result()
+            )
+            job.pages_done = len(pages)
+
+        # Retrieval chunks are precomputed so questions never re-chunk
+        self.file_store.save_text(job.sha256, pages, chunk_pages(pages))
+        job.status = "done"
+
+    def close(self):
+        # Pending jobs are dropped; their uploads can be resubmitted later
+        while True:
+            try:
+                job = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            with self._lock:
+                self._jobs.pop(job.sha256, None)
+            self._queue.task_done()
+        for _ in self._threads:
+            self._queue.put(_STOP)
+        for thread in self._threads:
+            thread.join()
+        if self._owns_executor:
+            self._executor.shutdown(cancel_futures=True)
+
+    async def aclose(self):
+        await asyncio.to_thread(self.close)
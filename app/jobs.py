@@ -0,0 +1,359 @@
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from dataclasses import asdict, dataclass
+from typing import TYPE_CHECKING, Awaitable, Callable, List, Optional, Set
+from app.limiter import current_client
+from app.settings import get_settings
+from app.storage import sqlite_path
+
+if TYPE_CHECKING:
+    import httpx
+
+# How often idle workers look for jobs queued by other processes or left
+# behind by one that died
+POLL_INTERVAL = 1.0
+# A claimed job is handed to another worker this long after its timeout
+LEASE_MARGIN = 30.0
+# Runs before a job whose worker keeps dying is given up on
+MAX_ATTEMPTS = 3
+
+WEBHOOK_TIMEOUT = 10.0
+WEBHOOK_ATTEMPTS = 3
+# Doubled after each failed delivery
+WEBHOOK_BACKOFF = 1.0
+
+
+@dataclass
+class Job:
+    id: str
+    request: dict
+    priority: int = 0
+    status: str = "queued"
+    client: str = "anonymous"
+    attempts: int = 0
+    created_at: float = 0.0
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    result: Optional[dict] = None
+    error: Optional[str] = None
+
+    def as_dict(self) -> dict:
+        # What the API and the webhook report
+        job = asdict(self)
+        del job["client"], job["attempts"]
+        return job
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+class JobFailed(Exception):
+    # Raised by a handler; the message becomes the job's error
+    pass
+
+
+class JobStore:
+    # Jobs in SQLite: in memory, or in a file that several worker processes
+    # share. A single UPDATE claims the next job, so no two workers ever run
+    # the same one.
+    _COLUMNS = (
+        "id, request, priority, status, client, attempts, created_at, "
+        "started_at, finished_at, result, error"
+    )
+
+    def __init__(self, path: str = ":memory:"):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            path, timeout=30, isolation_level=None, check_same_thread=False
+        )
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                request TEXT NOT NULL,
+                priority INTEGER NOT NULL,
+                status TEXT NOT NULL,
+                client TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL,
+                lease_until REAL,
+                result TEXT,
+                error TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_jobs_queue
+                ON jobs (status, priority DESC, created_at);
+            """)
+
+    @staticmethod
+    def _job(row: Optional[sqlite3.Row]) -> Optional[Job]:
+        if row is None:
+            return None
+        job = Job(**{key: row[key] for key in row.keys()})
+        job.request = json.loads(job.request)
+        if job.result is not None:
+            job.result = json.loads(job.result)
+        return job
+
+    def add(self, request: dict, priority: int, client: str, limit: int) -> Job:
+        job = Job(
+            id=uuid.uuid4().hex,
+            request=request,
+            priority=priority,
+            client=client,
+            created_at=time.time(),
+        )
+        with self._lock:
+            # Immediate, so the count and the insert see the same queue
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                (queued,) = self._conn.execute(
+                    "SELECT COUNT(*) FROM jobs WHERE status = 'queued'"
+                ).fetchone()
+                if queued >= limit:
+                    raise JobQueueFull("Job queue is full")
+                self._conn.execute(
+                    "INSERT INTO jobs (id, request, priority, status, client, "
+                    "created_at) VALUES (?, ?, ?, 'queued', ?, ?)",
+                    (job.id, json.dumps(request), priority, client, job.created_at),
+                )
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {self._COLUMNS} FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        return self._job(row)
+
+    def claim(self, lease: float) -> Optional[Job]:
+        # Highest priority first, oldest first within a priority
+        now = time.time()
+        with self._lock:
+            rows = self._conn.execute(
+                "UPDATE jobs SET status = 'running', attempts = attempts + 1, "
+                "started_at = ?, lease_until = ? WHERE id = ("
+                "SELECT id FROM jobs WHERE status = 'queued' "
+                "ORDER BY priority DESC, created_at LIMIT 1"
+                f") RETURNING {self._COLUMNS}",
+                (now, now + lease),
+            ).fetchall()
+        return self._job(rows[0] if rows else None)
+
+    def finish(
+        self, job_id: str, result: Optional[dict] = None, error: Optional[str] = None
+    ) -> Optional[Job]:
+        with self._lock:
+            rows = self._conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, "
+                "finished_at = ?, lease_until = NULL WHERE id = ? "
+                f"RETURNING {self._COLUMNS}",
+                (
+                    "failed" if error is not None else "done",
+                    json.dumps(result) if result is not None else None,
+                    error,
+                    time.time(),
+                    job_id,
+                ),
+            ).fetchall()
+        return self._job(rows[0] if rows else None)
+
+    def release(self, job_id: str):
+        # Back to the queue without counting the run, e.g. on shutdown
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = 'queued', attempts = attempts - 1, "
+                "started_at = NULL, lease_until = NULL "
+                "WHERE id = ? AND status = 'running'",
+                (job_id,),
+            )
+
+    def requeue_expired(self) -> List[Job]:
+        # Jobs whose worker died mid-run go back to the queue, or fail once
+        # they have used up their attempts; the failed ones are returned
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = 'queued', started_at = NULL, "
+                "lease_until = NULL WHERE status = 'running' AND lease_until < ? "
+                "AND attempts < ?",
+                (now, MAX_ATTEMPTS),
+            )
+            rows = self._conn.execute(
+                "UPDATE jobs SET status = 'failed', error = ?, finished_at = ?, "
+                "lease_until = NULL WHERE status = 'running' AND lease_until < ? "
+                f"RETURNING {self._COLUMNS}",
+                (f"Abandoned after {MAX_ATTEMPTS} attempts", now, now),
+            ).fetchall()
+        return [self._job(row) for row in rows]
+
+    def count(self, status: str) -> int:
+        with self._lock:
+            (count,) = self._conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = ?", (status,)
+            ).fetchone()
+        return count
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class JobQueue:
+    # A bounded pool of asyncio workers running jobs from a JobStore. Each
+    # finished job is POSTed to the webhook, when one is set. Workers start
+    # with the first submitted job, or at startup when jobs are persisted.
+    def __init__(
+        self,
+        store: JobStore,
+        handler: Callable[[dict], Awaitable[dict]],
+        workers: Optional[int] = None,
+        queue_size: Optional[int] = None,
+        timeout: Optional[float] = None,
+        webhook_url: Optional[str] = None,
+    ):
+        # Unset options come from settings; an empty webhook_url turns it off
+        settings = get_settings()
+        self.store = store
+        self.handler = handler
+        self.workers = settings.job_workers if workers is None else workers
+        self.queue_size = settings.job_queue_size if queue_size is None else queue_size
+        self.timeout = settings.job_timeout if timeout is None else timeout
+        self.webhook_url = settings.webhook_url if webhook_url is None else webhook_url
+        self.delivered = 0
+        self.undelivered = 0
+        self._closing = False
+        self._tasks: List[asyncio.Task] = []
+        self._deliveries: Set[asyncio.Task] = set()
+        self._wake: Optional[asyncio.Event] = None
+        self._reaped = 0.0
+        self._http: Optional["httpx.AsyncClient"] = None
+
+    def start(self):
+        if self._tasks:
+            return
+        self._wake = asyncio.Event()
+        self._tasks = [
+            asyncio.create_task(self._work()) for _ in range(max(self.workers, 1))
+        ]
+
+    async def submit(self, request: dict, priority: int = 0) -> Job:
+        job = await asyncio.to_thread(
+            self.store.add, request, priority, current_client.get(), self.queue_size
+        )
+        self.start()
+        self._wake.set()
+        return job
+
+    async def get(self, job_id: str) -> Optional[Job]:
+        return await asyncio.to_thread(self.store.get, job_id)
+
+    async def _work(self):
+        # Checked as well as cancelled: wait_for can swallow a cancellation
+        # that lands just as the job it waits on finishes
+        while not self._closing:
+            # Cleared before looking, so a job submitted meanwhile still wakes
+            # this worker
+            self._wake.clear()
+            job = await asyncio.to_thread(self.store.claim, self.timeout + LEASE_MARGIN)
+            if job is not None:
+                await self._run(job)
+                continue
+            try:
+                await asyncio.wait_for(self._wake.wait(), POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                await self._reap()
+
+    async def _reap(self):
+        # One sweep per interval, whichever idle worker gets there first
+        now = time.monotonic()
+        if now - self._reaped < POLL_INTERVAL:
+            return
+        self._reaped = now
+        for job in await asyncio.to_thread(self.store.requeue_expired):
+            self._notify(job)
+
+    async def _run(self, job: Job):
+        current_client.set(job.client)
+        result = error = None
+        try:
+            result = await asyncio.wait_for(self.handler(job.request), self.timeout)
+        except asyncio.CancelledError:
+            # Shutting down: another run (or this one, restarted) picks it up
+            await asyncio.shield(asyncio.to_thread(self.store.release, job.id))
+            raise
+        except asyncio.TimeoutError:
+            error = f"Timed out after {self.timeout:g}s"
+        except JobFailed as e:
+            error = str(e)
+        except Exception as e:
+            error = f"Job failed: {e}"
+        finished = await asyncio.to_thread(self.store.finish, job.id, result, error)
+        self._notify(finished)
+
+    def _notify(self, job: Job):
+        if not self.webhook_url:
+            return
+        delivery = asyncio.create_task(self._deliver(job))
+        self._deliveries.add(delivery)
+        delivery.add_done_callback(self._deliveries.discard)
+
+    async def _deliver(self, job: Job):
+        # Retried on connection errors and 5xx; a 4xx will not get better
+        import httpx
+
+        if self._http is None:
+            self._http = httpx.AsyncClient(timeout=WEBHOOK_TIMEOUT)
+        for attempt in range(WEBHOOK_ATTEMPTS):
+            if attempt:
+                await asyncio.sleep(WEBHOOK_BACKOFF * 2 ** (attempt - 1))
+            try:
+                response = await self._http.post(self.webhook_url, json=job.as_dict())
+            except httpx.HTTPError:
+                continue
+            if response.status_code < 500:
+                break
+        else:
+            self.undelivered += 1
+            return
+        if response.is_success:
+            self.delivered += 1
+        else:
+            self.undelivered += 1
+
+    async def aclose(self):
+        self._closing = True
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._deliveries:
+            # Finished jobs get a last chance to be reported
+            await asyncio.wait(self._deliveries, timeout=WEBHOOK_TIMEOUT)
+            for delivery in list(self._deliveries):
+                delivery.cancel()
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+        await asyncio.to_thread(self.store.close)
+
+
+def create_job_store() -> JobStore:
+    # Jobs live next to the question history, so they are persisted and
+    # shared by workers exactly when the history is
+    database_url = get_settings().database_url
+    if not database_url:
+        return JobStore()
+    return JobStore(sqlite_path(database_url))
@@ -0,0 +1,409 @@
+import asyncio
+import contextvars
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass, field
+from typing import Callable, Deque, Optional
+from fastapi import Request
+from app import tracing
+from app.resilience import UpstreamError
+from app.settings import get_settings
+
+CLIENT_ID_HEADER = "X-Client-Id"
+
+# Which API client the current request belongs to, for fair queueing
+current_client: contextvars.ContextVar[str] = contextvars.ContextVar(
+    "current_client", default="anonymous"
+)
+
+
+async def identify_client(request: Request):
+    # Async so the context variable is set in the endpoint's own context
+    client_id = request.headers.get(CLIENT_ID_HEADER)
+    if not client_id and request.client is not None:
+        client_id = request.client.host
+    current_client.set(client_id or "anonymous")
+
+
+class RateLimited(UpstreamError):
+    def __init__(self, retry_after: float, message: str):
+        super().__init__(message, status_code=429, retry_after=retry_after)
+
+
+class TokenBucket:
+    # Holds up to `capacity` units and refills at capacity / window per
+    # second. An amount larger than the bucket waits for a full bucket and
+    # leaves it in debt, so oversized requests are slowed rather than refused.
+    def __init__(
+        self,
+        capacity: float,
+        window: float,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.capacity = capacity
+        self.rate = capacity / window
+        self.clock = clock
+        self.level = float(capacity)
+        self._updated = clock()
+
+    def _refill(self):
+        now = self.clock()
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount: float) -> float:
+        self._refill()
+        missing = min(amount, self.capacity) - self.level
+        return max(missing, 0.0) / self.rate
+
+    def take(self, amount: float):
+        self._refill()
+        self.level -= amount
+
+    def refund(self, amount: float):
+        self._refill()
+        self.level = min(self.capacity, self.level + amount)
+
+
+class SharedTokenBucket:
+    # TokenBucket whose level lives in a SQLite row, so every worker process
+    # on the host draws from one budget. Each call is a single UPDATE; a
+    # check and the take after it are not atomic across processes, so
+    # workers racing for the last units can overdraw by a request each, and
+    # the debt then slows the next callers. The clock has to be the same in
+    # every process (time.monotonic is system-wide on Linux).
+    #
+    # The limiter calls this on the event loop, so a locked file is not
+    # waited out: after BUSY_TIMEOUT the bucket fails open on its last known
+    # level, and the amount is carried over to the next update that gets in.
+    BUSY_TIMEOUT = 0.05
+
+    def __init__(
+        self,
+        path: str,
+        name: str,
+        capacity: float,
+        window: float,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.name = name
+        self.capacity = capacity
+        self.rate = capacity / window
+        self.clock = clock
+        self.contended = 0
+        self._lock = threading.Lock()
+        self._level = float(capacity)
+        self._seen = clock()
+        self._pending = 0.0
+        # Setup may wait as long as it needs; it runs before serving
+        self._conn = sqlite3.connect(
+            path, timeout=30, isolation_level=None, check_same_thread=False
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS token_buckets (
+                name TEXT PRIMARY KEY,
+                level REAL NOT NULL,
+                updated REAL NOT NULL
+            )
+            """)
+        self._conn.execute(
+            "INSERT OR IGNORE INTO token_buckets (name, level, updated) "
+            "VALUES (?, ?, ?)",
+            (name, float(capacity), clock()),
+        )
+        self._conn.execute(f"PRAGMA busy_timeout = {int(self.BUSY_TIMEOUT * 1000)}")
+
+    def _update(self, amount: float) -> float:
+        # Refills, takes amount (a refund is negative) and returns the level
+        with self._lock:
+            now = self.clock()
+            amount += self._pending
+            try:
+                # fetchall steps the UPDATE to completion, ending its write
+                ((level,),) = self._conn.execute(
+                    "UPDATE token_buckets SET "
+                    "level = min(:capacity, "
+                    "min(:capacity, level + max(:now - updated, 0) * :rate) "
+                    "- :amount), "
+                    "updated = :now WHERE name = :name RETURNING level",
+                    {
+                        "capacity": self.capacity,
+                        "now": now,
+                        "rate": self.rate,
+                        "amount": amount,
+                        "name": self.name,
+                    },
+                ).fetchall()
+            except sqlite3.OperationalError:
+                self.contended += 1
+                self._pending = amount
+                refilled = self._level + max(now - self._seen, 0) * self.rate
+                return min(self.capacity, refilled) - amount
+            self._pending = 0.0
+            self._level, self._seen = level, now
+        return level
+
+    @property
+    def level(self) -> float:
+        return self._update(0)
+
+    def wait_time(self, amount: float) -> float:
+        missing = min(amount, self.capacity) - self._update(0)
+        return max(missing, 0.0) / self.rate
+
+    def take(self, amount: float):
+        self._update(amount)
+
+    def refund(self, amount: float):
+        self._update(-amount)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def _bucket(
+    shared_path: Optional[str],
+    name: str,
+    capacity: float,
+    window: float,
+    clock: Callable[[], float],
+):
+    if shared_path:
+        return SharedTokenBucket(shared_path, name, capacity, window, clock)
+    return TokenBucket(capacity, window, clock)
+
+
+@dataclass
+class Reservation:
+    tokens: int = 0
+    # Set to the tokens actually used so the unused estimate is refunded
+    used: Optional[int] = None
+    # Requests sent under this slot so far, and how many are still running
+    sent: int = 0
+    active: int = 0
+
+
+@dataclass
+class _Waiter:
+    tokens: int
+    future: asyncio.Future = field(repr=False)
+
+
+class UpstreamLimiter:
+    # Admits upstream calls while under the in-flight cap and the
+    # requests/tokens per window buckets. Everything else waits in a bounded
+    # queue served round-robin per API client, so one busy client cannot
+    # starve the rest.
+    def __init__(
+        self,
+        max_in_flight: Optional[int] = None,
+        requests_per_window: Optional[int] = None,
+        tokens_per_window: Optional[int] = None,
+        window: Optional[float] = None,
+        queue_size: Optional[int] = None,
+        queue_timeout: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        # Unset limits come from settings; 0 turns a limit off
+        settings = get_settings()
+        if max_in_flight is None:
+            max_in_flight = settings.upstream_max_in_flight
+        if requests_per_window is None:
+            requests_per_window = settings.rate_limit_requests
+        if tokens_per_window is None:
+            tokens_per_window = settings.rate_limit_tokens
+        window = settings.rate_limit_window if window is None else window
+        queue_size = settings.limiter_queue_size if queue_size is None else queue_size
+        if queue_timeout is None:
+            queue_timeout = settings.limiter_queue_timeout
+        self.max_in_flight = max_in_flight
+        # With several worker processes the buckets are shared through
+        # SHARED_STATE_PATH; the in-flight cap and the queue stay per process
+        shared_path = settings.shared_state_path
+        self.requests = None
+        if requests_per_window:
+            self.requests = _bucket(
+                shared_path, "requests", requests_per_window, window, clock
+            )
+        self.tokens = None
+        if tokens_per_window:
+            self.tokens = _bucket(
+                shared_path, "tokens", tokens_per_window, window, clock
+            )
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self.admitted = 0
+        self.waited = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.extra = 0
+        self._queues: "OrderedDict[str, Deque[_Waiter]]" = OrderedDict()
+        self._queued = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    @property
+    def counts_tokens(self) -> bool:
+        return self.tokens is not None
+
+    def _wait_time(self, tokens: int) -> float:
+        wait = 0.0
+        if self.requests is not None:
+            wait = self.requests.wait_time(1)
+        if self.tokens is not None and tokens:
+            wait = max(wait, self.tokens.wait_time(tokens))
+        return wait
+
+    def _has_slot(self) -> bool:
+        return not self.max_in_flight or self.in_flight < self.max_in_flight
+
+    def _grant(self, tokens: int):
+        self.in_flight += 1
+        self.admitted += 1
+        if self.requests is not None:
+            self.requests.take(1)
+        if self.tokens is not None:
+            self.tokens.take(tokens)
+
+    def _retry_after(self) -> float:
+        # Roughly when the queue ahead will have drained through the buckets
+        wait = 0.0
+        if self.requests is not None:
+            wait = self.requests.wait_time(self._queued + 1)
+        return max(1.0, wait)
+
+    async def acquire(self, tokens: int = 0):
+        # Jumping the queue would defeat fairness, so the fast path is only
+        # taken when nobody is waiting
+        if not self._queued and self._has_slot() and not self._wait_time(tokens):
+            self._grant(tokens)
+            return
+
+        if self._queued >= self.queue_size:
+            self.rejected += 1
+            raise RateLimited(
+                self._retry_after(), "Too many requests waiting for the upstream"
+            )
+
+        client = current_client.get()
+        waiter = _Waiter(tokens, asyncio.get_running_loop().create_future())
+        self._queues.setdefault(client, deque()).append(waiter)
+        self._queued += 1
+        self.waited += 1
+        self._dispatch()
+
+        try:
+            # Only waits get a span; the fast path above stays untouched
+            with tracing.span("limiter.wait", attributes={"limiter.client": client}):
+                await asyncio.wait_for(waiter.future, self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._drop(client, waiter)
+            self.timed_out += 1
+            raise RateLimited(
+                self._retry_after(), "Timed out waiting for an upstream slot"
+            )
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # Granted just as the caller went away
+                self.release()
+            else:
+                self._drop(client, waiter)
+            raise
+
+    def release(self):
+        self.in_flight -= 1
+        self._dispatch()
+
+    def _drop(self, client: str, waiter: _Waiter):
+        queue = self._queues.get(client)
+        if queue is None or waiter not in queue:
+            return
+        queue.remove(waiter)
+        self._queued -= 1
+        if not queue:
+            del self._queues[client]
+
+    def _dispatch(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        while self._queues and self._has_slot():
+            client, queue = next(iter(self._queues.items()))
+            waiter = queue[0]
+            if waiter.future.done():
+                # Timed out or cancelled, and about to be dropped by its caller
+                self._drop(client, waiter)
+                continue
+            wait = self._wait_time(waiter.tokens)
+            if wait > 0:
+                loop = asyncio.get_running_loop()
+                self._timer = loop.call_later(wait, self._dispatch)
+                return
+
+            queue.popleft()
+            self._queued -= 1
+            if queue:
+                self._queues.move_to_end(client)
+            else:
+                del self._queues[client]
+            self._grant(waiter.tokens)
+            waiter.future.set_result(None)
+
+    @asynccontextmanager
+    async def slot(self, tokens: int = 0):
+        await self.acquire(tokens)
+        reservation = Reservation(tokens)
+        try:
+            yield reservation
+        finally:
+            if self.tokens is not None and reservation.used is not None:
+                self.tokens.refund(max(tokens - reservation.used, 0))
+            self.release()
+
+    @contextmanager
+    def send(self, reservation: Reservation):
+        # Wraps each request actually sent upstream under a slot. The slot
+        # paid for the first one; retries, hedges and failovers are charged
+        # here without waiting, and the debt they leave holds back the next
+        # callers. One running alongside another also takes an in-flight place.
+        charged = reservation.sent > 0
+        concurrent = reservation.active > 0
+        reservation.sent += 1
+        reservation.active += 1
+        if charged:
+            self.extra += 1
+            if self.requests is not None:
+                self.requests.take(1)
+            if self.tokens is not None:
+                self.tokens.take(reservation.tokens)
+        if concurrent:
+            self.in_flight += 1
+        try:
+            yield
+        finally:
+            reservation.active -= 1
+            if concurrent:
+                self.release()
+
+    def close(self):
+        for bucket in (self.requests, self.tokens):
+            if isinstance(bucket, SharedTokenBucket):
+                bucket.close()
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": self.in_flight,
+            "queued": self._queued,
+            "admitted": self.admitted,
+            "waited": self.waited,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "extra": self.extra,
+        }
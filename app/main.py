@@ -1,12 +1,55 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from app.clients import registry, warm_up
+from app.metrics import MetricsMiddleware
 from app.router import router, root_router
+from app.settings import get_settings
+from app.tracing import TracingMiddleware
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    settings = get_settings()
+    settings.require_openai_api_key()
+    app.title = settings.app_name
+    app.description = settings.app_description
+    app.version = settings.app_version
+
+    warmup = None
+    if settings.startup_preload:
+        # Everything is built before the first request is accepted
+        registry.startup()
+        warm_up()
+    else:
+        # Ready at once: clients are built on first use, and the upstream
+        # client is warmed in the background so the first call rarely waits
+        warmup = asyncio.create_task(asyncio.to_thread(warm_up))
+    if settings.database_url:
+        # Jobs left queued by an earlier run, or by another worker
+        registry.get("job_queue").start()
+    try:
+        yield
+    finally:
+        if warmup is not None:
+            # A failed warm-up fails again, visibly, on the first request
+            await asyncio.gather(warmup, return_exceptions=True)
+        # Clients (and their connection pools) are shared by every request
+        await registry.aclose()
+
 
 app = FastAPI(
     title="Simple AI Question API",
     description="A simple FastAPI app for handling AI questions",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
+# Per-route latency and in-flight metrics, served at /metrics
+app.add_middleware(MetricsMiddleware, routers=[root_router, router])
+# Outermost, so the server span covers everything else
+app.add_middleware(TracingMiddleware, routers=[root_router, router])
+
 # Include the routers
 app.include_router(root_router)  # Root and health endpoints
 app.include_router(router)  # API v1 endpoints
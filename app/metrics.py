@@ -0,0 +1,309 @@
+import bisect
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+from starlette.routing import Match
+
+LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+)  # fmt: skip
+TOKEN_BUCKETS = (16, 64, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768)
+BYTE_BUCKETS = tuple(1024 * 4**i for i in range(8))  # 1KB .. 16MB
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class _Shards:
+    # One list of values per thread, summed at scrape time. Each list is only
+    # written by its own thread, so recording needs no lock and loses no
+    # updates; the lock is taken once per thread and on scrape.
+    def __init__(self, size: int):
+        self._size = size
+        self._local = threading.local()
+        self._shards: List[List[float]] = []
+        self._lock = threading.Lock()
+
+    def mine(self) -> List[float]:
+        try:
+            return self._local.values
+        except AttributeError:
+            values = [0.0] * self._size
+            with self._lock:
+                self._shards.append(values)
+            self._local.values = values
+            return values
+
+    def total(self) -> List[float]:
+        with self._lock:
+            shards = list(self._shards)
+        totals = [0.0] * self._size
+        for shard in shards:
+            for i, value in enumerate(shard):
+                totals[i] += value
+        return totals
+
+
+class _Value:
+    def __init__(self):
+        self._shards = _Shards(1)
+
+    def inc(self, amount: float = 1.0):
+        self._shards.mine()[0] += amount
+
+    def dec(self, amount: float = 1.0):
+        self._shards.mine()[0] -= amount
+
+    def value(self) -> float:
+        return self._shards.total()[0]
+
+
+class _HistogramValue:
+    def __init__(self, bounds: Sequence[float]):
+        self.bounds = bounds
+        # One slot per bucket, one for +Inf, then the running sum
+        self._shards = _Shards(len(bounds) + 2)
+
+    def observe(self, value: float):
+        values = self._shards.mine()
+        values[bisect.bisect_left(self.bounds, value)] += 1
+        values[-1] += value
+
+    def time(self) -> "_Timer":
+        return _Timer(self)
+
+    def snapshot(self) -> Tuple[List[float], float]:
+        totals = self._shards.total()
+        return totals[:-1], totals[-1]
+
+
+class _Timer:
+    def __init__(self, histogram: _HistogramValue):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.start)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        registry: Optional["MetricsRegistry"] = None,
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[tuple, object] = {}
+        self._lock = threading.Lock()
+        (registry or REGISTRY).register(self)
+
+    def _child(self):
+        raise NotImplementedError
+
+    def labels(self, *values):
+        key = tuple(str(value) for value in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} takes labels {self.labelnames}")
+            with self._lock:
+                child = self._children.setdefault(key, self._child())
+        return child
+
+    def _items(self):
+        with self._lock:
+            return list(self._children.items())
+
+    def samples(self) -> Iterable[Tuple[str, dict, float]]:
+        for key, child in self._items():
+            yield self.name, dict(zip(self.labelnames, key)), child.value()
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _child(self):
+        return _Value()
+
+    def inc(self, amount: float = 1.0):
+        self.labels().inc(amount)
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _child(self):
+        return _Value()
+
+    def inc(self, amount: float = 1.0):
+        self.labels().inc(amount)
+
+    def dec(self, amount: float = 1.0):
+        self.labels().dec(amount)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, *args, buckets: Sequence[float] = LATENCY_BUCKETS, **kwargs):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(*args, **kwargs)
+
+    def _child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def time(self) -> _Timer:
+        return self.labels().time()
+
+    def samples(self) -> Iterable[Tuple[str, dict, float]]:
+        for key, child in self._items():
+            labels = dict(zip(self.labelnames, key))
+            counts, total = child.snapshot()
+            cumulative = 0.0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else _format(bound)
+                yield f"{self.name}_bucket", {**labels, "le": le}, cumulative
+            yield f"{self.name}_sum", labels, total
+            yield f"{self.name}_count", labels, cumulative
+
+
+def _format(value: float) -> str:
+    if value == int(value):
+        return str(int(value))
+    return repr(value)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", r"\\").replace("\n", r"\n").replace('"', r"\"")
+
+
+def render_family(
+    name: str,
+    kind: str,
+    documentation: str,
+    samples: Iterable[Tuple[str, dict, float]],
+) -> str:
+    # Prometheus text exposition format, version 0.0.4
+    lines = [f"# HELP {name} {documentation}", f"# TYPE {name} {kind}"]
+    for sample_name, labels, value in samples:
+        if labels:
+            pairs = ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+            lines.append(f"{sample_name}{{{pairs}}} {_format(value)}")
+        else:
+            lines.append(f"{sample_name} {_format(value)}")
+    return "\n".join(lines) + "\n"
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric):
+        self._metrics.append(metric)
+
+    def render(self) -> str:
+        return "".join(
+            render_family(m.name, m.kind, m.documentation, m.samples())
+            for m in self._metrics
+        )
+
+
+REGISTRY = MetricsRegistry()
+
+HTTP_REQUESTS = Counter(
+    "http_requests_total", "HTTP requests served", ["method", "route", "status"]
+)
+HTTP_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "Time to serve an HTTP request, including streamed bodies",
+    ["method", "route"],
+)
+HTTP_IN_FLIGHT = Gauge(
+    "http_requests_in_flight", "HTTP requests being served", ["route"]
+)
+LLM_DURATION = Histogram(
+    "llm_request_duration_seconds",
+    "Upstream LLM call latency (time to the full answer, or to open a stream)",
+    ["backend", "model", "outcome"],
+)
+LLM_TIME_TO_FIRST_TOKEN = Histogram(
+    "llm_time_to_first_token_seconds",
+    "Time from sending a streamed request to its first answer token",
+    ["backend", "model"],
+)
+LLM_TOKENS = Histogram(
+    "llm_tokens",
+    "Tokens per upstream LLM call",
+    ["type"],
+    buckets=TOKEN_BUCKETS,
+)
+UPLOAD_BYTES = Histogram(
+    "pdf_upload_bytes", "Size of uploaded PDFs", buckets=BYTE_BUCKETS
+)
+UPLOAD_DURATION = Histogram(
+    "pdf_upload_duration_seconds",
+    "Time to receive, hash and store an uploaded PDF",
+    ["outcome"],
+)
+
+
+def record_usage(usage):
+    LLM_TOKENS.labels("prompt").observe(usage.prompt_tokens)
+    LLM_TOKENS.labels("completion").observe(usage.completion_tokens)
+
+
+def route_template(routers: Sequence, scope) -> str:
+    # The path template of the route that will serve the request, e.g.
+    # /api/v1/upload/{file_id}/status, or "unmatched"
+    for router in routers:
+        for route in router.routes:
+            match, _ = route.matches(scope)
+            if match != Match.NONE:
+                return route.path
+    return "unmatched"
+
+
+class MetricsMiddleware:
+    # Plain ASGI rather than BaseHTTPMiddleware, which adds a task and a
+    # memory stream per request. Requests are labelled with the path template
+    # of the matching route in `routers`, so label values stay bounded.
+    def __init__(self, app, routers: Sequence):
+        self.app = app
+        self.routers = routers
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        route = route_template(self.routers, scope)
+        method = scope["method"]
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        in_flight = HTTP_IN_FLIGHT.labels(route)
+        in_flight.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            in_flight.dec()
+            HTTP_DURATION.labels(method, route).observe(time.perf_counter() - start)
+            HTTP_REQUESTS.labels(method, route, status).inc()
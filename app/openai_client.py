@@ -1,37 +1,353 @@
-import os
-from typing import Optional
-from openai import OpenAI
-from dotenv import load_dotenv
+import asyncio
+import threading
+import time
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, AsyncIterator, Optional, Tuple, Union
+from app import tracing
+from app.cache import ResponseCache, make_cache_key
+from app.hedging import Hedger
+from app.limiter import UpstreamLimiter
+from app.metrics import LLM_DURATION, LLM_TIME_TO_FIRST_TOKEN, record_usage
+from app.providers import Backend, BackendRouter, create_router
+from app.resilience import ResiliencePolicy, as_upstream_error
+from app.settings import get_settings
+from app.singleflight import SingleFlight
+from app.tokens import TokenBudget, TokenUsage
 
-# Load environment variables from .env file
-load_dotenv()
+# The SDK and numpy (behind the semantic cache) are only imported once a
+# client or cache is actually built, which keeps them off the startup path
+if TYPE_CHECKING:
+    import httpx
+    from openai import AsyncOpenAI, OpenAI
+    from app.semantic_cache import SemanticCache
 
-# Get OpenAI API key from environment variables
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
-if not OPENAI_API_KEY:
-    raise ValueError("OPENAI_API_KEY environment variable is required but not set")
+def pool_limits() -> "httpx.Limits":
+    import httpx
+
+    settings = get_settings()
+    return httpx.Limits(
+        max_connections=settings.openai_max_connections,
+        max_keepalive_connections=settings.openai_max_keepalive_connections,
+        keepalive_expiry=settings.openai_keepalive_expiry,
+    )
+
+
+@dataclass
+class Completion:
+    text: str
+    model: str
+    cached: bool = False
+    usage: Optional[TokenUsage] = None
 
 
 class OpenAIClient:
-    def __init__(self):
-        self.client = OpenAI(api_key=OPENAI_API_KEY)
-        self.model = "gpt-3.5-turbo"
+    def __init__(
+        self,
+        cache: Optional[ResponseCache] = None,
+        semantic_cache: Optional["SemanticCache"] = None,
+        resilience: Optional[ResiliencePolicy] = None,
+        hedger: Optional[Hedger] = None,
+        limiter: Optional[UpstreamLimiter] = None,
+        router: Optional[BackendRouter] = None,
+    ):
+        settings = get_settings()
+        self.api_key = settings.require_openai_api_key()
+        self.model = settings.openai_model
+        self.max_tokens = settings.openai_max_tokens
+        self.temperature = settings.openai_temperature
+        self.trim_strategy = settings.context_trim_strategy
+        self.cache = cache
+        self.semantic_cache = semantic_cache
+        self.singleflight = SingleFlight()
+        self.resilience = resilience or ResiliencePolicy()
+        self.hedger = hedger
+        self.limiter = limiter or UpstreamLimiter()
+        self._client: Optional["OpenAI"] = None
+        self._async_client: Optional["AsyncOpenAI"] = None
+        # warm_up() may build the async client on another thread
+        self._lock = threading.Lock()
+        # Without LLM_BACKENDS the only backend is this client's own pool
+        default = Backend(
+            "openai", self.model, client_factory=lambda: self.async_client
+        )
+        self.router = router or create_router(default, pool_limits())
+
+    @property
+    def client(self) -> "OpenAI":
+        if self._client is None:
+            from openai import OpenAI
+
+            # The blocking client can't use the async policy; the SDK's own
+            # retry loop (which also honors Retry-After) gets the same limits
+            self._client = OpenAI(
+                api_key=self.api_key,
+                timeout=self.resilience.attempt_timeout,
+                max_retries=self.resilience.max_retries,
+            )
+        return self._client
+
+    @property
+    def async_client(self) -> "AsyncOpenAI":
+        # Built lazily so sync-only callers never open a pool
+        if self._async_client is None:
+            with self._lock:
+                if self._async_client is None:
+                    from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+                    http_client = DefaultAsyncHttpxClient(limits=pool_limits())
+                    # Retries and deadlines come from self.resilience, not the SDK
+                    self._async_client = AsyncOpenAI(
+                        api_key=self.api_key, http_client=http_client, max_retries=0
+                    )
+        return self._async_client
+
+    def warm_up(self):
+        # Pays for the SDK import and the pool's TLS setup ahead of the first
+        # call; safe to run off the event loop
+        self.async_client
+
+    def budget(self) -> TokenBudget:
+        # Cheap to build: encoders are cached per model
+        return TokenBudget(self.model, self.max_tokens, self.trim_strategy)
+
+    def _prepare(
+        self, prompt: str, context: Optional[str]
+    ) -> Tuple[Optional[str], list, int]:
+        # Oversized context is trimmed here instead of failing upstream after
+        # a full round trip; raises PromptTooLarge when nothing fits. The
+        # prompt is counted once, for the reservation and for usage when the
+        # upstream reports none. Tokenizing a large context is CPU-bound, so
+        # async callers run this in a thread.
+        budget = self.budget()
+        context = budget.fit(prompt, context)
+        messages = self._build_messages(prompt, context)
+        return context, messages, budget.count_messages(messages)
+
+    def _usage(self, response, prompt_tokens: int, text: str) -> TokenUsage:
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            return TokenUsage(usage.prompt_tokens, usage.completion_tokens)
+        return TokenUsage(prompt_tokens, self.budget().count(text))
+
+    def _reserve_tokens(self, prompt_tokens: int) -> int:
+        # Prompt plus the largest answer allowed; refunded once usage is known
+        if not self.limiter.counts_tokens:
+            return 0
+        return prompt_tokens + self.max_tokens
+
+    def _build_messages(self, prompt: str, context: Optional[str] = None) -> list:
+        messages = []
+
+        if context:
+            messages.append({"role": "system", "content": f"Context: {context}"})
+
+        messages.append({"role": "user", "content": prompt})
+        return messages
 
     def generate_response(self, prompt: str, context: Optional[str] = None) -> str:
+        _, messages, prompt_tokens = self._prepare(prompt, context)
+        attributes = {
+            "gen_ai.operation.name": "chat",
+            "gen_ai.request.model": self.model,
+            "llm.backend": "openai",
+        }
+        start = time.monotonic()
         try:
-            messages = []
+            with tracing.span(f"chat {self.model}", "client", attributes) as span:
+                response = self.client.chat.completions.create(
+                    model=self.model,
+                    messages=messages,
+                    max_tokens=self.max_tokens,
+                    temperature=self.temperature,
+                    **tracing.upstream_headers(),
+                )
 
-            if context:
-                messages.append({"role": "system", "content": f"Context: {context}"})
+                text = response.choices[0].message.content.strip()
+                usage = self._usage(response, prompt_tokens, text)
+                span.set_attribute("gen_ai.usage.input_tokens", usage.prompt_tokens)
+                span.set_attribute(
+                    "gen_ai.usage.output_tokens", usage.completion_tokens
+                )
 
-            messages.append({"role": "user", "content": prompt})
-
-            response = self.client.chat.completions.create(
-                model=self.model, messages=messages, max_tokens=1000, temperature=0.7
+        except Exception as e:
+            LLM_DURATION.labels("openai", self.model, "error").observe(
+                time.monotonic() - start
             )
+            raise Exception(f"OpenAI API error: {str(e)}")
+
+        LLM_DURATION.labels("openai", self.model, "ok").observe(
+            time.monotonic() - start
+        )
+        record_usage(usage)
+        return text
+
+    async def _lookup(
+        self, key: str, prompt: str, context: Optional[str]
+    ) -> Optional[Completion]:
+        hit = None
+        with tracing.span("cache.lookup") as span:
+            if self.cache is not None:
+                hit = await self.cache.get(key)
+                span.set_attribute("cache.exact_hit", hit is not None)
+            if hit is None and self.semantic_cache is not None:
+                hit = await self.semantic_cache.get(self.model, prompt, context)
+                span.set_attribute("cache.semantic_hit", hit is not None)
+        if hit is None:
+            return None
+        return Completion(
+            text=hit["text"], model=hit["model"], cached=True, usage=TokenUsage()
+        )
 
-            return response.choices[0].message.content.strip()
+    async def _store(
+        self, key: str, prompt: str, context: Optional[str], text: str, model: str
+    ):
+        value = {"text": text, "model": model}
+        if self.cache is not None:
+            await self.cache.set(key, value)
+        if self.semantic_cache is not None:
+            await self.semantic_cache.set(self.model, prompt, context, value)
+
+    async def acomplete(self, prompt: str, context: Optional[str] = None) -> Completion:
+        context, messages, prompt_tokens = await asyncio.to_thread(
+            self._prepare, prompt, context
+        )
+        key = make_cache_key(self.model, messages, self.max_tokens, self.temperature)
+
+        cached = await self._lookup(key, prompt, context)
+        if cached is not None:
+            return cached
+
+        return await self.singleflight.do(
+            key, lambda: self._fetch(key, messages, prompt_tokens, prompt, context)
+        )
+
+    async def _fetch(
+        self,
+        key: str,
+        messages: list,
+        prompt_tokens: int,
+        prompt: str,
+        context: Optional[str],
+    ) -> Completion:
+        try:
+            with tracing.span("llm.complete") as span:
+                async with self.limiter.slot(
+                    self._reserve_tokens(prompt_tokens)
+                ) as slot:
+
+                    async def send(backend: Backend):
+                        with self.limiter.send(slot):
+                            return await backend.client.chat.completions.create(
+                                model=backend.model,
+                                messages=messages,
+                                max_tokens=self.max_tokens,
+                                temperature=self.temperature,
+                                **tracing.upstream_headers(),
+                            )
+
+                    def create():
+                        return self.router.call(send)
+
+                    # Hedging happens inside each attempt, so a hedged pair
+                    # counts as one call for retries, deadlines and the breaker
+                    if self.hedger is not None:
+                        response, backend = await self.resilience.run(
+                            lambda: self.hedger.run(create)
+                        )
+                    else:
+                        response, backend = await self.resilience.run(create)
+                    text = response.choices[0].message.content.strip()
+                    usage = self._usage(response, prompt_tokens, text)
+                    slot.used = usage.total_tokens
+                    record_usage(usage)
+                span.set_attribute("llm.backend", backend.name)
+                span.set_attribute("gen_ai.response.model", backend.model)
+                span.set_attribute("gen_ai.usage.input_tokens", usage.prompt_tokens)
+                span.set_attribute(
+                    "gen_ai.usage.output_tokens", usage.completion_tokens
+                )
 
         except Exception as e:
-            raise Exception(f"OpenAI API error: {str(e)}")
+            raise as_upstream_error(e) from e
+
+        await self._store(key, prompt, context, text, backend.model)
+        return Completion(text=text, model=backend.model, usage=usage)
+
+    async def astream(
+        self, prompt: str, context: Optional[str] = None
+    ) -> AsyncIterator[Union[str, Completion]]:
+        # Yields answer text deltas as they arrive, then one Completion that
+        # says which model answered and whether it came from cache; a cache
+        # hit is a single delta
+        context, messages, prompt_tokens = await asyncio.to_thread(
+            self._prepare, prompt, context
+        )
+        key = make_cache_key(self.model, messages, self.max_tokens, self.temperature)
+
+        cached = await self._lookup(key, prompt, context)
+        if cached is not None:
+            yield cached.text
+            yield cached
+            return
+
+        parts = []
+        try:
+            # The slot is held until the stream ends
+            async with self.limiter.slot(self._reserve_tokens(prompt_tokens)) as slot:
+                # Only opening the stream is retried and routed; once deltas
+                # have been sent the answer cannot be restarted elsewhere
+                async def send(backend: Backend):
+                    with self.limiter.send(slot):
+                        return await backend.client.chat.completions.create(
+                            model=backend.model,
+                            messages=messages,
+                            max_tokens=self.max_tokens,
+                            temperature=self.temperature,
+                            stream=True,
+                            **tracing.upstream_headers(),
+                        )
+
+                start = time.monotonic()
+                stream, backend = await self.resilience.run(
+                    lambda: self.router.call(send)
+                )
+                async for chunk in stream:
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta.content
+                    if delta:
+                        if not parts:
+                            LLM_TIME_TO_FIRST_TOKEN.labels(
+                                backend.name, backend.model
+                            ).observe(time.monotonic() - start)
+                        parts.append(delta)
+                        yield delta
+                text = "".join(parts).strip()
+                usage = self._usage(None, prompt_tokens, text)
+                slot.used = usage.total_tokens
+                record_usage(usage)
+
+        except Exception as e:
+            raise as_upstream_error(e) from e
+
+        await self._store(key, prompt, context, text, backend.model)
+        yield Completion(text=text, model=backend.model, usage=usage)
+
+    async def agenerate_response(
+        self, prompt: str, context: Optional[str] = None
+    ) -> str:
+        completion = await self.acomplete(prompt, context)
+        return completion.text
+
+    async def aclose(self):
+        await self.router.aclose()
+        self.limiter.close()
+        if self._async_client is not None:
+            await self._async_client.close()
+            self._async_client = None
+        if self.cache is not None:
+            await self.cache.aclose()
+        if self._client is not None:
+            self._client.close()
+            self._client = None
@@ -0,0 +1,290 @@
+import asyncio
+import json
+import os
+import random
+import time
+from typing import TYPE_CHECKING, Awaitable, Callable, List, Optional, Tuple, TypeVar
+from app import tracing
+from app.metrics import LLM_DURATION
+from app.resilience import is_retryable
+from app.settings import get_settings
+
+# The SDK (and httpx under it) take a good share of startup time, so they
+# are imported when the first client is built
+if TYPE_CHECKING:
+    import httpx
+    from openai import AsyncOpenAI
+
+BACKEND_KINDS = ("openai", "azure", "local")
+DEFAULT_AZURE_API_VERSION = "2024-06-01"
+
+T = TypeVar("T")
+
+
+class BackendHealth:
+    # EWMAs of latency and error rate, plus ejection after consecutive
+    # failures so a sick backend stops taking traffic for a while
+    def __init__(
+        self,
+        alpha: Optional[float] = None,
+        error_penalty: Optional[float] = None,
+        eject_failures: Optional[int] = None,
+        eject_seconds: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        settings = get_settings()
+        alpha = settings.router_ewma_alpha if alpha is None else alpha
+        if error_penalty is None:
+            error_penalty = settings.router_error_penalty
+        if eject_failures is None:
+            eject_failures = settings.router_eject_failures
+        if eject_seconds is None:
+            eject_seconds = settings.router_eject_seconds
+        self.alpha = alpha
+        self.error_penalty = error_penalty
+        self.eject_failures = eject_failures
+        self.eject_seconds = eject_seconds
+        self.clock = clock
+        self.latency: Optional[float] = None
+        self.error_rate = 0.0
+        self.failures = 0
+        self.ejected_until = 0.0
+        self.calls = 0
+        self.errors = 0
+
+    def record_latency(self, seconds: float):
+        if self.latency is None:
+            self.latency = seconds
+        else:
+            self.latency += self.alpha * (seconds - self.latency)
+
+    def record_success(self, seconds: float):
+        self.calls += 1
+        self.record_latency(seconds)
+        self.error_rate -= self.alpha * self.error_rate
+        self.failures = 0
+
+    def record_failure(self):
+        self.calls += 1
+        self.errors += 1
+        self.error_rate += self.alpha * (1 - self.error_rate)
+        self.failures += 1
+        if self.failures >= self.eject_failures:
+            self.ejected_until = self.clock() + self.eject_seconds
+            self.failures = 0
+
+    def available(self) -> bool:
+        return self.clock() >= self.ejected_until
+
+    def score(self) -> float:
+        # Unmeasured backends score 0 so each gets tried early on
+        return (self.latency or 0.0) * (1 + self.error_penalty * self.error_rate)
+
+
+def build_async_client(
+    kind: str,
+    api_key: str,
+    base_url: Optional[str] = None,
+    api_version: Optional[str] = None,
+    limits: Optional["httpx.Limits"] = None,
+) -> "AsyncOpenAI":
+    from openai import AsyncAzureOpenAI, AsyncOpenAI, DefaultAsyncHttpxClient
+
+    http_client = DefaultAsyncHttpxClient(limits=limits) if limits else None
+    # Retries are the resilience policy's job, not the SDK's
+    if kind == "azure":
+        return AsyncAzureOpenAI(
+            api_key=api_key,
+            azure_endpoint=base_url,
+            api_version=api_version or DEFAULT_AZURE_API_VERSION,
+            http_client=http_client,
+            max_retries=0,
+        )
+    return AsyncOpenAI(
+        api_key=api_key, base_url=base_url, http_client=http_client, max_retries=0
+    )
+
+
+class Backend:
+    # One deployment that can answer chat completions. For Azure, `model` is
+    # the deployment name.
+    def __init__(
+        self,
+        name: str,
+        model: str,
+        kind: str = "openai",
+        base_url: Optional[str] = None,
+        api_key: Optional[str] = None,
+        api_version: Optional[str] = None,
+        client_factory: Optional[Callable[[], "AsyncOpenAI"]] = None,
+        limits: Optional["httpx.Limits"] = None,
+        health: Optional[BackendHealth] = None,
+    ):
+        if kind not in BACKEND_KINDS:
+            raise ValueError(f"Unknown backend kind for {name}: {kind}")
+        if kind == "azure" and not base_url:
+            raise ValueError(f"Azure backend {name} needs a base_url")
+
+        self.name = name
+        self.model = model
+        self.kind = kind
+        self.base_url = base_url
+        self.api_key = api_key
+        self.api_version = api_version
+        self.limits = limits
+        self.health = health or BackendHealth()
+        # A factory means someone else owns (and closes) the client
+        self._client_factory = client_factory
+        self._client: Optional["AsyncOpenAI"] = None
+
+    @property
+    def client(self) -> "AsyncOpenAI":
+        if self._client_factory is not None:
+            return self._client_factory()
+        if self._client is None:
+            self._client = build_async_client(
+                self.kind, self.api_key, self.base_url, self.api_version, self.limits
+            )
+        return self._client
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
+
+    def stats(self) -> dict:
+        health = self.health
+        return {
+            "name": self.name,
+            "kind": self.kind,
+            "model": self.model,
+            "available": health.available(),
+            "latency_ms": None if health.latency is None else health.latency * 1000,
+            "error_rate": health.error_rate,
+            "calls": health.calls,
+            "errors": health.errors,
+        }
+
+
+class BackendRouter:
+    # Sends each call to the healthy backend with the best latency/error
+    # score and fails over down the list on retryable errors. Ejected
+    # backends are only tried once every healthy one has failed.
+    def __init__(
+        self,
+        backends: List[Backend],
+        explore_rate: Optional[float] = None,
+        rng: Optional[random.Random] = None,
+    ):
+        if not backends:
+            raise ValueError("At least one LLM backend is required")
+        if explore_rate is None:
+            explore_rate = get_settings().router_explore_rate
+        self.backends = backends
+        self.explore_rate = explore_rate
+        self.rng = rng or random.Random()
+        self.failovers = 0
+
+    def candidates(self) -> List[Backend]:
+        healthy = [b for b in self.backends if b.health.available()]
+        sick = [b for b in self.backends if not b.health.available()]
+        healthy.sort(key=lambda b: b.health.score())
+        # Now and then give a slower backend a call so its score can recover
+        if len(healthy) > 1 and self.rng.random() < self.explore_rate:
+            healthy.insert(0, healthy.pop(self.rng.randrange(1, len(healthy))))
+        sick.sort(key=lambda b: b.health.ejected_until)
+        return healthy + sick
+
+    async def call(self, fn: Callable[[Backend], Awaitable[T]]) -> Tuple[T, Backend]:
+        error: Optional[Exception] = None
+        for backend in self.candidates():
+            if error is not None:
+                self.failovers += 1
+            start = time.monotonic()
+            attributes = {
+                "gen_ai.operation.name": "chat",
+                "gen_ai.request.model": backend.model,
+                "llm.backend": backend.name,
+            }
+            try:
+                with tracing.span(f"chat {backend.model}", "client", attributes):
+                    result = await fn(backend)
+            except asyncio.CancelledError:
+                # Usually a deadline: the backend was at least this slow
+                elapsed = time.monotonic() - start
+                backend.health.record_latency(elapsed)
+                self._observe(backend, "cancelled", elapsed)
+                raise
+            except Exception as e:
+                self._observe(backend, "error", time.monotonic() - start)
+                if not is_retryable(e):
+                    raise
+                backend.health.record_failure()
+                error = e
+                continue
+            elapsed = time.monotonic() - start
+            backend.health.record_success(elapsed)
+            self._observe(backend, "ok", elapsed)
+            return result, backend
+        raise error
+
+    def _observe(self, backend: Backend, outcome: str, seconds: float):
+        LLM_DURATION.labels(backend.name, backend.model, outcome).observe(seconds)
+
+    async def aclose(self):
+        for backend in self.backends:
+            await backend.aclose()
+
+    def stats(self) -> dict:
+        return {
+            "failovers": self.failovers,
+            "backends": [backend.stats() for backend in self.backends],
+        }
+
+
+def load_backends(
+    config: str, limits: Optional["httpx.Limits"] = None
+) -> List[Backend]:
+    # LLM_BACKENDS is a JSON list of {"name", "model", "kind", "base_url",
+    # "api_key_env", "api_version"}; keys are read from the named env var
+    try:
+        entries = json.loads(config)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"LLM_BACKENDS is not valid JSON: {e}")
+    if not isinstance(entries, list):
+        raise ValueError("LLM_BACKENDS must be a JSON list")
+
+    backends = []
+    for i, entry in enumerate(entries):
+        kind = entry.get("kind", "openai")
+        name = entry.get("name", f"{kind}-{i}")
+        if "model" not in entry:
+            raise ValueError(f"LLM backend {name} needs a model")
+        key_env = entry.get("api_key_env", "OPENAI_API_KEY")
+        api_key = os.environ.get(key_env)
+        if not api_key:
+            if kind != "local":
+                raise ValueError(f"LLM backend {name}: {key_env} is not set")
+            # Local OpenAI-compatible servers usually ignore the key
+            api_key = "not-needed"
+        backends.append(
+            Backend(
+                name=name,
+                model=entry["model"],
+                kind=kind,
+                base_url=entry.get("base_url"),
+                api_key=api_key,
+                api_version=entry.get("api_version"),
+                limits=limits,
+            )
+        )
+    return backends
+
+
+def create_router(
+    default: Backend, limits: Optional["httpx.Limits"] = None
+) -> BackendRouter:
+    config = get_settings().llm_backends
+    if not config:
+        return BackendRouter([default])
+    return BackendRouter(load_backends(config, limits))
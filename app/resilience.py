@@ -0,0 +1,240 @@
+import asyncio
+import email.utils
+import random
+import sys
+import threading
+import time
+from typing import Awaitable, Callable, Optional, TypeVar
+from app.settings import get_settings
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+T = TypeVar("T")
+
+
+class UpstreamError(Exception):
+    # Carries the HTTP status the API should answer with
+    def __init__(
+        self, message: str, status_code: int = 502, retry_after: Optional[float] = None
+    ):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class UpstreamTimeout(UpstreamError):
+    def __init__(self, message: str):
+        super().__init__(message, status_code=504)
+
+
+class CircuitOpen(UpstreamError):
+    def __init__(self, retry_after: float):
+        super().__init__(
+            "OpenAI API error: upstream is unavailable, failing fast",
+            status_code=503,
+            retry_after=retry_after,
+        )
+
+
+def _status(error: Exception) -> Optional[int]:
+    return getattr(error, "status_code", None)
+
+
+def is_retryable(error: Exception) -> bool:
+    # httpx and the SDK are imported with the first client; until then none
+    # of their errors can have been raised
+    httpx = sys.modules.get("httpx")
+    if httpx is not None and isinstance(error, httpx.TransportError):
+        return True
+    openai = sys.modules.get("openai")
+    if openai is not None and isinstance(error, openai.APIConnectionError):
+        return True
+    return _status(error) in RETRYABLE_STATUS
+
+
+def retry_after(error: Exception) -> Optional[float]:
+    # Honors Retry-After (seconds or an HTTP date) and OpenAI's retry-after-ms
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return max(float(value) / 1000, 0.0)
+        except ValueError:
+            pass
+
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(when.timestamp() - time.time(), 0.0)
+
+
+def as_upstream_error(error: Exception) -> UpstreamError:
+    if isinstance(error, UpstreamError):
+        return error
+    status = _status(error)
+    if status == 429:
+        return UpstreamError(
+            f"OpenAI API error: {error}",
+            status_code=429,
+            retry_after=retry_after(error),
+        )
+    return UpstreamError(f"OpenAI API error: {error}")
+
+
+class CircuitBreaker:
+    # closed -> open after failure_threshold consecutive failures; after
+    # reset_timeout one probe call is let through (half-open) and its
+    # outcome closes or re-opens the circuit
+    def __init__(
+        self,
+        failure_threshold: Optional[int] = None,
+        reset_timeout: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        settings = get_settings()
+        if failure_threshold is None:
+            failure_threshold = settings.breaker_failure_threshold
+        if reset_timeout is None:
+            reset_timeout = settings.breaker_reset_timeout
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.state = "closed"
+        self.failures = 0
+        self.opened = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        with self._lock:
+            if self.state == "closed":
+                return
+            remaining = self._opened_at + self.reset_timeout - self.clock()
+            if self.state == "open" and remaining <= 0:
+                self.state = "half_open"
+            if self.state == "half_open" and not self._probing:
+                self._probing = True
+                return
+            raise CircuitOpen(max(remaining, 1.0))
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self._probing = False
+
+    def release(self):
+        # A probe that was cancelled proved nothing; let the next one through
+        with self._lock:
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                if self.state != "open":
+                    self.opened += 1
+                self.state = "open"
+                self._opened_at = self.clock()
+
+
+class ResiliencePolicy:
+    # Per-attempt and total deadlines, retries with exponential backoff and
+    # full jitter (or the upstream's Retry-After), behind a circuit breaker
+    def __init__(
+        self,
+        attempt_timeout: Optional[float] = None,
+        total_timeout: Optional[float] = None,
+        max_retries: Optional[int] = None,
+        backoff_base: Optional[float] = None,
+        backoff_max: Optional[float] = None,
+        breaker: Optional[CircuitBreaker] = None,
+    ):
+        settings = get_settings()
+        if attempt_timeout is None:
+            attempt_timeout = settings.upstream_attempt_timeout
+        if total_timeout is None:
+            total_timeout = settings.upstream_total_timeout
+        if max_retries is None:
+            max_retries = settings.upstream_max_retries
+        if backoff_base is None:
+            backoff_base = settings.upstream_backoff_base
+        if backoff_max is None:
+            backoff_max = settings.upstream_backoff_max
+        self.attempt_timeout = attempt_timeout
+        self.total_timeout = total_timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = breaker or CircuitBreaker()
+        self.retries = 0
+        self.timeouts = 0
+
+    def backoff(self, attempt: int) -> float:
+        ceiling = min(self.backoff_max, self.backoff_base * 2**attempt)
+        return random.uniform(0, ceiling)
+
+    async def run(self, call: Callable[[], Awaitable[T]]) -> T:
+        deadline = time.monotonic() + self.total_timeout
+        attempt = 0
+        while True:
+            self.breaker.before_call()
+            timeout = min(self.attempt_timeout, deadline - time.monotonic())
+
+            try:
+                result = await asyncio.wait_for(call(), timeout)
+            except asyncio.CancelledError:
+                self.breaker.release()
+                raise
+            except asyncio.TimeoutError:
+                self.timeouts += 1
+                self.breaker.record_failure()
+                error: Exception = UpstreamTimeout(
+                    f"OpenAI API error: no response within {timeout:.1f}s"
+                )
+                delay = self.backoff(attempt)
+            except Exception as e:
+                if not is_retryable(e):
+                    # A 4xx answer says the upstream is up; anything else
+                    # says nothing about its health
+                    if _status(e) is not None:
+                        self.breaker.record_success()
+                    else:
+                        self.breaker.release()
+                    raise
+                self.breaker.record_failure()
+                error = e
+                delay = retry_after(e)
+                if delay is None:
+                    delay = self.backoff(attempt)
+            else:
+                self.breaker.record_success()
+                return result
+
+            if attempt == self.max_retries or time.monotonic() + delay >= deadline:
+                raise error
+            self.retries += 1
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    def stats(self) -> dict:
+        return {
+            "retries": self.retries,
+            "timeouts": self.timeouts,
+            "breaker_state": self.breaker.state,
+            "breaker_opened": self.breaker.opened,
+        }
@@ -0,0 +1,94 @@
+import threading
+from collections import OrderedDict
+from typing import List, Optional
+from app.files import FileStore
+from app.search import InvertedIndex
+from app.settings import get_settings
+
+
+def chunk_pages(
+    pages: List[str],
+    chunk_words: Optional[int] = None,
+    overlap: Optional[int] = None,
+) -> List[dict]:
+    # Overlapping word windows that never cross a page, so every chunk
+    # can be cited by page number
+    settings = get_settings()
+    if chunk_words is None:
+        chunk_words = settings.retrieval_chunk_words
+    overlap = settings.retrieval_chunk_overlap if overlap is None else overlap
+    step = max(chunk_words - overlap, 1)
+    chunks = []
+    for number, text in enumerate(pages, 1):
+        words = text.split()
+        for start in range(0, len(words), step):
+            chunks.append(
+                {"page": number, "text": " ".join(words[start : start + chunk_words])}
+            )
+            if start + chunk_words >= len(words):
+                break
+    return chunks
+
+
+class DocumentIndex:
+    def __init__(self, chunks: List[dict]):
+        self.chunks = chunks
+        self._index = InvertedIndex()
+        for i, chunk in enumerate(chunks):
+            self._index.add(i, chunk["text"])
+
+    def top_k(self, query: str, k: Optional[int] = None) -> List[dict]:
+        k = get_settings().retrieval_top_k if k is None else k
+        hits = self._index.search(query, limit=k, match_all=False)
+        # Hand chunks to the model in document order, not score order
+        return [
+            {**self.chunks[i], "score": score}
+            for i, score in sorted(hits, key=lambda hit: hit[0])
+        ]
+
+
+class DocumentRetriever:
+    # Builds each document's BM25 index from its stored chunks on first use
+    # and keeps the most recently used ones in memory
+    def __init__(self, file_store: FileStore, max_documents: Optional[int] = None):
+        self.file_store = file_store
+        if max_documents is None:
+            max_documents = get_settings().retrieval_max_documents
+        self.max_documents = max_documents
+        self._indexes: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def index(self, sha256: str) -> Optional[DocumentIndex]:
+        with self._lock:
+            index = self._indexes.get(sha256)
+            if index is not None:
+                self._indexes.move_to_end(sha256)
+                return index
+
+        chunks = self.file_store.load_chunks(sha256)
+        if chunks is None:
+            return None
+        index = DocumentIndex(chunks)
+
+        with self._lock:
+            self._indexes[sha256] = index
+            while len(self._indexes) > self.max_documents:
+                self._indexes.popitem(last=False)
+        return index
+
+    def retrieve(
+        self, sha256: str, query: str, k: Optional[int] = None
+    ) -> Optional[List[dict]]:
+        # None means the document has not been extracted yet
+        index = self.index(sha256)
+        return index.top_k(query, k) if index is not None else None
+
+    async def aclose(self):
+        with self._lock:
+            self._indexes.clear()
+
+
+def format_excerpts(filename: str, chunks: List[dict]) -> str:
+    lines = [f"Excerpts from {filename}:"]
+    lines.extend(f"[page {chunk['page']}] {chunk['text']}" for chunk in chunks)
+    return "\n\n".join(lines)
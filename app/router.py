@@ -1,19 +1,95 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Depends
+from app.controllers.batch import ask_batch
+from app.controllers.cache import get_cache_stats
 from app.controllers.core import root, health
-from app.controllers.questions import ask_question, get_questions
-from app.controllers.upload import upload_pdf
+from app.controllers.jobs import get_job, submit_job
+from app.controllers.metrics import get_metrics
+from app.controllers.questions import (
+    ask_question,
+    ask_question_stream,
+    get_questions,
+    search_questions,
+)
+from app.controllers.upload import get_upload_status, upload_pdf
+from app.controllers.upstream import get_upstream_stats
+from app.limiter import identify_client
 
 # Main router for API v1 endpoints
 router = APIRouter(prefix="/api/v1")
 
-# AI question endpoints
-router.add_api_route("/ask", ask_question, methods=["POST"], tags=["AI Questions"])
+# AI question endpoints; callers are identified for fair upstream queueing
+upstream_dependencies = [Depends(identify_client)]
+router.add_api_route(
+    "/ask",
+    ask_question,
+    methods=["POST"],
+    tags=["AI Questions"],
+    dependencies=upstream_dependencies,
+)
+router.add_api_route(
+    "/ask/stream",
+    ask_question_stream,
+    methods=["POST"],
+    tags=["AI Questions"],
+    dependencies=upstream_dependencies,
+)
+router.add_api_route(
+    "/ask/batch",
+    ask_batch,
+    methods=["POST"],
+    tags=["AI Questions"],
+    dependencies=upstream_dependencies,
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                "application/json": {
+                    "schema": {
+                        "type": "array",
+                        "items": {"$ref": "#/components/schemas/QuestionRequest"},
+                    }
+                },
+                "application/x-ndjson": {"schema": {"type": "string"}},
+            },
+        }
+    },
+)
 router.add_api_route(
     "/questions", get_questions, methods=["GET"], tags=["AI Questions"]
 )
+router.add_api_route(
+    "/questions/search", search_questions, methods=["GET"], tags=["AI Questions"]
+)
+
+# Background jobs for long-running questions
+router.add_api_route(
+    "/jobs",
+    submit_job,
+    methods=["POST"],
+    status_code=202,
+    tags=["Jobs"],
+    dependencies=upstream_dependencies,
+)
+router.add_api_route("/jobs/{job_id}", get_job, methods=["GET"], tags=["Jobs"])
+
+# Response cache endpoints
+router.add_api_route(
+    "/cache/stats", get_cache_stats, methods=["GET"], tags=["AI Questions"]
+)
+
+# Upstream retry, circuit-breaker and hedging counters
+router.add_api_route(
+    "/upstream/stats", get_upstream_stats, methods=["GET"], tags=["AI Questions"]
+)
 
 # PDF upload endpoint
 router.add_api_route("/upload/pdf", upload_pdf, methods=["POST"], tags=["PDF Upload"])
+router.add_api_route(
+    "/upload/{file_id}/status",
+    get_upload_status,
+    methods=["GET"],
+    tags=["PDF Upload"],
+)
 
 # Root router for basic endpoints (no prefix)
 root_router = APIRouter()
@@ -21,3 +97,4 @@ root_router = APIRouter()
 # Root and health endpoints
 root_router.add_api_route("/", root, methods=["GET"], tags=["Basic"])
 root_router.add_api_route("/health", health, methods=["GET"], tags=["Basic"])
+root_router.add_api_route("/metrics", get_metrics, methods=["GET"], tags=["Basic"])
@@ -0,0 +1,103 @@
+import heapq
+import math
+import re
+from collections import Counter, defaultdict
+from typing import Dict, List, Tuple
+
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN.findall(text.lower()) if text else []
+
+
+def fts5_query(query: str) -> str:
+    # Quote every token so user input can never be parsed as FTS5 syntax
+    return " ".join(f'"{token}"' for token in tokenize(query))
+
+
+class InvertedIndex:
+    # Incremental BM25 index; by default every query term must match (like
+    # FTS5), with match_all=False any term will do
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[str, Dict[int, int]] = defaultdict(dict)
+        self._doc_terms: Dict[int, Counter] = {}
+        self._lengths: Dict[int, int] = {}
+        self._total_length = 0
+
+    def __len__(self) -> int:
+        return len(self._doc_terms)
+
+    def add(self, doc_id: int, text: str):
+        terms = Counter(tokenize(text))
+        self._doc_terms[doc_id] = terms
+        self._lengths[doc_id] = sum(terms.values())
+        self._total_length += self._lengths[doc_id]
+        for term, frequency in terms.items():
+            self._postings[term][doc_id] = frequency
+
+    def remove(self, doc_id: int):
+        terms = self._doc_terms.pop(doc_id, None)
+        if terms is None:
+            return
+        self._total_length -= self._lengths.pop(doc_id)
+        for term in terms:
+            postings = self._postings[term]
+            postings.pop(doc_id, None)
+            if not postings:
+                del self._postings[term]
+
+    def clear(self):
+        self._postings.clear()
+        self._doc_terms.clear()
+        self._lengths.clear()
+        self._total_length = 0
+
+    def search(
+        self, query: str, limit: int = 20, offset: int = 0, match_all: bool = True
+    ) -> List[Tuple[int, float]]:
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms or not self._doc_terms:
+            return []
+
+        postings = [self._postings.get(term) for term in terms]
+        if match_all and not all(postings):
+            return []
+        postings = [p for p in postings if p]
+        if not postings:
+            return []
+
+        if match_all:
+            # Intersect starting from the rarest term
+            postings.sort(key=len)
+            candidates = set(postings[0])
+            for other in postings[1:]:
+                candidates.intersection_update(other)
+                if not candidates:
+                    return []
+        else:
+            candidates = set().union(*postings)
+
+        doc_count = len(self._doc_terms)
+        average_length = self._total_length / doc_count
+        idf = [
+            math.log(1 + (doc_count - len(p) + 0.5) / (len(p) + 0.5)) for p in postings
+        ]
+
+        def score(doc_id: int) -> float:
+            length = self._lengths[doc_id]
+            norm = self.k1 * (1 - self.b + self.b * length / average_length)
+            return sum(
+                weight * p[doc_id] * (self.k1 + 1) / (p[doc_id] + norm)
+                for weight, p in zip(idf, postings)
+                if doc_id in p
+            )
+
+        ranked = heapq.nlargest(
+            offset + limit,
+            ((score(doc_id), doc_id) for doc_id in candidates),
+            key=lambda item: (item[0], -item[1]),
+        )
+        return [(doc_id, value) for value, doc_id in ranked[offset:]]
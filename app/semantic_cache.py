@@ -0,0 +1,346 @@
+import hashlib
+import re
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from app.settings import get_settings
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+_CONTRACTIONS = [
+    (re.compile(r"n['’]t\b"), " not"),
+    (re.compile(r"['’]re\b"), " are"),
+    (re.compile(r"['’]s\b"), " is"),
+    (re.compile(r"['’]ll\b"), " will"),
+    (re.compile(r"['’]ve\b"), " have"),
+]
+
+
+class HashingEmbedder:
+    # Deterministic, offline embedder: signed feature hashing of words and
+    # character trigrams, so paraphrases with shared stems land close together
+    def __init__(self, dim: int = 128):
+        self.dim = dim
+
+    def _features(self, text: str) -> List[str]:
+        text = text.lower()
+        for pattern, replacement in _CONTRACTIONS:
+            text = pattern.sub(replacement, text)
+        words = _TOKEN.findall(text)
+        features = [f"w:{word}" for word in words]
+        for word in words:
+            padded = f"#{word}#"
+            features.extend(
+                f"c:{padded[i:i + 3]}" for i in range(max(len(padded) - 2, 1))
+            )
+        return features
+
+    def _embed_one(self, text: str) -> np.ndarray:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for feature in self._features(text):
+            digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+            bucket = int.from_bytes(digest[:4], "little") % self.dim
+            sign = 1.0 if digest[4] & 1 else -1.0
+            vector[bucket] += sign
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        return np.stack([self._embed_one(text) for text in texts])
+
+
+class OpenAIEmbedder:
+    def __init__(self, openai_client, model: Optional[str] = None):
+        self.openai_client = openai_client
+        if model is None:
+            model = get_settings().semantic_cache_embedding_model
+        self.model = model
+        self.dim: Optional[int] = None
+
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        response = await self.openai_client.async_client.embeddings.create(
+            model=self.model, input=texts
+        )
+        vectors = np.array([item.embedding for item in response.data], np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        self.dim = vectors.shape[1]
+        return vectors
+
+
+class VectorIndex:
+    # Fixed-capacity cosine index over unit vectors. "flat" scans every row
+    # with one matrix multiply per chunk; "ivf" trains a coarse k-means
+    # quantizer once enough rows exist and only scans the closest lists.
+    # Each row carries an integer label and searches can be restricted to it.
+    def __init__(
+        self,
+        dim: int,
+        capacity: int,
+        mode: str = "flat",
+        n_lists: int = 256,
+        n_probe: int = 8,
+        train_size: Optional[int] = None,
+        chunk_size: int = 16384,
+    ):
+        if mode not in ("flat", "ivf"):
+            raise ValueError(f"Unknown index mode: {mode}")
+
+        self.dim = dim
+        self.capacity = capacity
+        self.mode = mode
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.train_size = train_size or n_lists * 32
+        self.chunk_size = chunk_size
+
+        self._vectors = np.zeros((capacity, dim), dtype=np.float32)
+        self._last_used = np.zeros(capacity, dtype=np.int64)
+        self._labels = np.zeros(capacity, dtype=np.int64)
+        self._valid = np.zeros(capacity, dtype=bool)
+        self._assign = np.full(capacity, -1, dtype=np.int32)
+        self._centroids: Optional[np.ndarray] = None
+        self._lists: List[np.ndarray] = []
+        self._list_sizes = np.zeros(0, dtype=np.int64)
+        self._list_live = np.zeros(0, dtype=np.int64)
+        self._high_water = 0
+        self._free: List[int] = []
+        self._clock = 0
+
+    def __len__(self) -> int:
+        return self._high_water - len(self._free)
+
+    @property
+    def trained(self) -> bool:
+        return self._centroids is not None
+
+    def add(self, vector: np.ndarray, label: int = 0) -> Tuple[int, Optional[int]]:
+        # Returns (slot, evicted_slot); the least recently used row makes room
+        evicted = None
+        if self._free:
+            slot = self._free.pop()
+        elif self._high_water < self.capacity:
+            slot = self._high_water
+            self._high_water += 1
+        else:
+            slot = int(np.argmin(self._last_used))
+            evicted = slot
+
+        self._vectors[slot] = vector
+        self._labels[slot] = label
+        self._valid[slot] = True
+        self._touch(slot)
+
+        if self.mode == "ivf":
+            if self.trained:
+                self._unassign(slot)
+                self._append(int(np.argmax(self._centroids @ vector)), slot)
+            elif len(self) >= self.train_size:
+                self.train()
+
+        return slot, evicted
+
+    def remove(self, slot: int):
+        if self._valid[slot]:
+            self._valid[slot] = False
+            self._unassign(slot)
+            self._last_used[slot] = 0
+            self._free.append(slot)
+
+    def search(
+        self, queries: np.ndarray, label: Optional[int] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        # Best (slot, score) for each query row; slot is -1 when empty
+        queries = np.atleast_2d(queries).astype(np.float32, copy=False)
+        best_slots = np.full(len(queries), -1, dtype=np.int64)
+        best_scores = np.full(len(queries), -np.inf, dtype=np.float32)
+
+        if len(self) == 0:
+            return best_slots, best_scores
+
+        if self.mode == "ivf" and self.trained:
+            for i, query in enumerate(queries):
+                best_slots[i], best_scores[i] = self._search_ivf(query, label)
+        else:
+            self._search_flat(queries, best_slots, best_scores, label)
+
+        for slot in best_slots[best_slots >= 0]:
+            self._touch(int(slot))
+        return best_slots, best_scores
+
+    def train(self, iterations: int = 10, seed: int = 0):
+        rows = np.flatnonzero(self._valid[: self._high_water])
+        if len(rows) < self.n_lists:
+            return
+
+        rng = np.random.default_rng(seed)
+        sample = self._vectors[
+            rng.choice(rows, size=min(len(rows), self.n_lists * 64), replace=False)
+        ]
+        centroids = sample[rng.choice(len(sample), self.n_lists, replace=False)]
+
+        for _ in range(iterations):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            for k in range(self.n_lists):
+                members = sample[labels == k]
+                if len(members):
+                    centroid = members.sum(axis=0)
+                    centroids[k] = centroid / (np.linalg.norm(centroid) or 1.0)
+
+        self._centroids = centroids
+        labels = self._nearest_lists(self._vectors[rows])
+        self._assign[:] = -1
+        self._assign[rows] = labels
+        self._lists = [rows[labels == k] for k in range(self.n_lists)]
+        self._list_sizes = np.array([len(m) for m in self._lists], dtype=np.int64)
+        self._list_live = self._list_sizes.copy()
+        self.n_probe = min(self.n_probe, self.n_lists)
+
+    def _nearest_lists(self, vectors: np.ndarray) -> np.ndarray:
+        labels = np.empty(len(vectors), dtype=np.int32)
+        for start in range(0, len(vectors), self.chunk_size):
+            chunk = vectors[start : start + self.chunk_size]
+            labels[start : start + len(chunk)] = np.argmax(
+                chunk @ self._centroids.T, axis=1
+            )
+        return labels
+
+    def _search_flat(self, queries, best_slots, best_scores, label=None):
+        for start in range(0, self._high_water, self.chunk_size):
+            stop = min(start + self.chunk_size, self._high_water)
+            scores = queries @ self._vectors[start:stop].T
+            if self._free:
+                scores[:, ~self._valid[start:stop]] = -np.inf
+            if label is not None:
+                scores[:, self._labels[start:stop] != label] = -np.inf
+            chunk_best = np.argmax(scores, axis=1)
+            chunk_scores = scores[np.arange(len(queries)), chunk_best]
+            better = chunk_scores > best_scores
+            best_slots[better] = chunk_best[better] + start
+            best_scores[better] = chunk_scores[better]
+
+    def _append(self, list_id: int, slot: int):
+        members = self._lists[list_id]
+        size = self._list_sizes[list_id]
+        if size == len(members):
+            # Drop entries that moved to another list before growing
+            members = np.unique(members[:size][self._assign[members[:size]] == list_id])
+            size = len(members)
+            grown = np.empty(max(16, size * 2), dtype=np.int64)
+            grown[:size] = members
+            members = self._lists[list_id] = grown
+        members[size] = slot
+        self._list_sizes[list_id] = size + 1
+        self._list_live[list_id] += 1
+        self._assign[slot] = list_id
+
+    def _unassign(self, slot: int):
+        # List entries are removed lazily; search skips stale members
+        list_id = self._assign[slot]
+        if list_id >= 0:
+            self._list_live[list_id] -= 1
+            self._assign[slot] = -1
+
+    def _search_ivf(
+        self, query: np.ndarray, label: Optional[int] = None
+    ) -> Tuple[int, float]:
+        probes = np.argpartition(-(self._centroids @ query), self.n_probe - 1)
+        candidates = []
+        for list_id in probes[: self.n_probe]:
+            members = self._lists[list_id][: self._list_sizes[list_id]]
+            if self._list_live[list_id] != len(members):
+                members = members[self._assign[members] == list_id]
+            candidates.append(members)
+        candidates = np.concatenate(candidates)
+        if label is not None:
+            candidates = candidates[self._labels[candidates] == label]
+        if len(candidates) == 0:
+            return -1, -np.inf
+        scores = self._vectors[candidates] @ query
+        best = int(np.argmax(scores))
+        return int(candidates[best]), float(scores[best])
+
+    def _touch(self, slot: int):
+        self._clock += 1
+        self._last_used[slot] = self._clock
+
+
+class SemanticCache:
+    def __init__(
+        self,
+        embedder,
+        index: Optional[VectorIndex] = None,
+        threshold: Optional[float] = None,
+        max_entries: Optional[int] = None,
+        index_mode: Optional[str] = None,
+    ):
+        settings = get_settings()
+        self.embedder = embedder
+        self.index = index
+        if threshold is None:
+            threshold = settings.semantic_cache_threshold
+        self.threshold = threshold
+        if max_entries is None:
+            max_entries = settings.semantic_cache_max_entries
+        self.max_entries = max_entries
+        if index_mode is None:
+            index_mode = settings.semantic_cache_index
+        self.index_mode = index_mode
+        self.hits = 0
+        self.misses = 0
+        self._values: Dict[int, dict] = {}
+
+    @staticmethod
+    def _partition(model: str, context: Optional[str]) -> int:
+        # Only the question is embedded; model and context must match exactly,
+        # otherwise a long shared context would swamp the question's meaning
+        key = f"{model}\x00{context or ''}".encode("utf-8")
+        digest = hashlib.blake2b(key, digest_size=8).digest()
+        return int.from_bytes(digest, "little") >> 1
+
+    def _ensure_index(self, dim: int) -> VectorIndex:
+        if self.index is None:
+            self.index = VectorIndex(dim, self.max_entries, mode=self.index_mode)
+        return self.index
+
+    async def get(
+        self, model: str, prompt: str, context: Optional[str] = None
+    ) -> Optional[dict]:
+        if self.index is None or len(self.index) == 0:
+            self.misses += 1
+            return None
+
+        query = await self.embedder.embed([prompt])
+        slots, scores = self.index.search(query, self._partition(model, context))
+        value = self._values.get(int(slots[0]))
+
+        if value is None or scores[0] < self.threshold or value["model"] != model:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return value
+
+    async def set(self, model: str, prompt: str, context: Optional[str], value: dict):
+        vector = (await self.embedder.embed([prompt]))[0]
+        slot, evicted = self._ensure_index(len(vector)).add(
+            vector, self._partition(model, context)
+        )
+        if evicted is not None:
+            self._values.pop(evicted, None)
+        self._values[slot] = {**value, "model": model}
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(self.index) if self.index is not None else 0,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
+
+
+def create_semantic_cache(openai_client) -> Optional[SemanticCache]:
+    settings = get_settings()
+    if not settings.semantic_cache_enabled:
+        return None
+    if settings.semantic_cache_embedder == "openai":
+        return SemanticCache(OpenAIEmbedder(openai_client))
+    return SemanticCache(HashingEmbedder())
@@ -0,0 +1,96 @@
+# Multi-process serving. Each worker is a full copy of the app with its own
+# clients and connection pools; what the workers have to agree on (question
+# history, the response cache and the upstream rate limits) goes through
+# SQLite files they all open.
+#
+#   python -m app.server      # WORKERS uvicorn processes
+#   gunicorn app.main:app     # from the repo root, reads gunicorn.conf.py
+import math
+import os
+import shutil
+import tempfile
+from typing import Dict, Optional
+import uvicorn
+from app.settings import Settings, configure, get_settings
+
+# Temporary home of the shared files for the gunicorn master's lifetime
+_state_dir: Optional[str] = None
+
+
+def shared_state_env(settings: Settings, state_dir: str) -> Dict[str, str]:
+    # Points what would otherwise stay inside one process at files in
+    # state_dir; backends that are already configured are left alone
+    env = {}
+    if not settings.database_url:
+        env["DATABASE_URL"] = "sqlite:///" + os.path.join(state_dir, "questions.db")
+    if not settings.shared_state_path:
+        env["SHARED_STATE_PATH"] = os.path.join(state_dir, "shared.db")
+    return env
+
+
+def prepare_shared_state(settings: Settings) -> Optional[str]:
+    # Run in the parent before any worker starts. Workers inherit the
+    # environment whether forked or spawned. The directory only lives as long
+    # as the server, so history stays as short-lived as the in-memory default
+    # it replaces; set DATABASE_URL to keep it.
+    if settings.workers <= 1:
+        return None
+    if settings.database_url and settings.shared_state_path:
+        return None
+    state_dir = tempfile.mkdtemp(prefix="ai-api-")
+    os.environ.update(shared_state_env(settings, state_dir))
+    # Reloaded from the updated environment on next use
+    configure()
+    return state_dir
+
+
+def cleanup_shared_state(state_dir: Optional[str]):
+    if state_dir is not None:
+        shutil.rmtree(state_dir, ignore_errors=True)
+
+
+def gunicorn_options(settings: Settings) -> dict:
+    return {
+        "bind": f"{settings.host}:{settings.port}",
+        "workers": settings.workers,
+        "worker_class": "uvicorn.workers.UvicornWorker",
+        # The app is imported once in the master and shared by the forks
+        "preload_app": True,
+        # Answers already in flight get to finish on shutdown or reload
+        "graceful_timeout": math.ceil(settings.upstream_total_timeout),
+    }
+
+
+def on_starting(server):
+    # gunicorn hook, in the master before the first fork
+    global _state_dir
+    _state_dir = prepare_shared_state(get_settings())
+    # The SDK import is the slowest part of a worker's first request; done
+    # here, every worker inherits it
+    import openai  # noqa: F401
+
+
+def on_exit(server):
+    # gunicorn hook
+    cleanup_shared_state(_state_dir)
+
+
+def main():
+    # uvicorn spawns its workers rather than forking, so each one imports the
+    # app itself; use gunicorn to import it once
+    settings = get_settings()
+    state_dir = prepare_shared_state(settings)
+    try:
+        uvicorn.run(
+            "app.main:app",
+            host=settings.host,
+            port=settings.port,
+            workers=settings.workers,
+            timeout_graceful_shutdown=math.ceil(settings.upstream_total_timeout),
+        )
+    finally:
+        cleanup_shared_state(state_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+import os
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass, fields, replace
+from typing import Iterator, Mapping, Optional, get_type_hints
+
+_TRUE = ("true", "1", "yes", "on")
+_FALSE = ("false", "0", "no", "off")
+
+
+# Every knob the app reads. Each field comes from the env var of the same
+# name upper-cased (see env.template); unset or empty vars keep the default.
+# OPENAI_BASE_URL and the api_key_env keys of LLM_BACKENDS are read by the
+# OpenAI SDK and the backend config, not here. env.template entries for
+# features the app does not have yet (SECRET_KEY, CORS, logging, Sentry,
+# analytics, email) are not read at all.
+@dataclass(frozen=True)
+class Settings:
+    # Application
+    app_name: str = "Simple AI Question API"
+    app_version: str = "1.0.0"
+    app_description: str = "A simple FastAPI app for handling AI questions"
+    debug: bool = False
+    environment: str = "development"
+
+    # Server
+    host: str = "0.0.0.0"
+    port: int = 8000
+    reload: bool = False
+    # Build every client during startup instead of on first use
+    startup_preload: bool = False
+    # Server processes started by app.server / gunicorn.conf.py
+    workers: int = 1
+    # SQLite file holding the response cache and rate limits shared by workers
+    shared_state_path: Optional[str] = None
+
+    # OpenAI
+    openai_api_key: Optional[str] = None
+    openai_model: str = "gpt-3.5-turbo"
+    openai_max_tokens: int = 1000
+    openai_temperature: float = 0.7
+    openai_max_connections: int = 100
+    openai_max_keepalive_connections: int = 20
+    openai_keepalive_expiry: float = 30.0
+
+    # Prompt budgeting
+    openai_context_window: int = 0
+    context_max_tokens: int = 0
+    context_max_chars: int = 200_000
+    context_trim_strategy: str = "relevant"
+
+    # Backend routing
+    llm_backends: str = ""
+    router_ewma_alpha: float = 0.2
+    router_error_penalty: float = 5.0
+    router_eject_failures: int = 3
+    router_eject_seconds: float = 30.0
+    router_explore_rate: float = 0.05
+
+    # Upstream resilience
+    upstream_attempt_timeout: float = 30.0
+    upstream_total_timeout: float = 60.0
+    upstream_max_retries: int = 3
+    upstream_backoff_base: float = 0.5
+    upstream_backoff_max: float = 8.0
+    breaker_failure_threshold: int = 5
+    breaker_reset_timeout: float = 30.0
+
+    # Hedged requests
+    hedge_enabled: bool = False
+    hedge_percentile: float = 95.0
+    hedge_budget: float = 0.05
+    hedge_min_delay: float = 0.05
+    hedge_min_samples: int = 20
+    hedge_window: int = 1000
+
+    # Batch endpoint
+    batch_concurrency: int = 8
+    batch_max_items: int = 10000
+
+    # Background jobs
+    job_workers: int = 4
+    job_queue_size: int = 1000
+    job_timeout: float = 300.0
+    webhook_url: Optional[str] = None
+
+    # Question history
+    database_url: Optional[str] = None
+    store_max_memory_rows: int = 10000
+    store_write_batch_size: int = 500
+
+    # PDF uploads
+    upload_dir: str = "uploads"
+    ingest_workers: int = 2
+    ingest_queue_size: int = 100
+    ingest_pages_per_task: int = 8
+    ingest_submit_timeout: float = 5.0
+    upload_chunk_size: int = 256 * 1024
+    retrieval_top_k: int = 4
+    retrieval_chunk_words: int = 200
+    retrieval_chunk_overlap: int = 40
+    retrieval_max_documents: int = 64
+
+    # Rate limiting
+    upstream_max_in_flight: int = 64
+    rate_limit_requests: int = 0
+    rate_limit_tokens: int = 0
+    rate_limit_window: float = 60.0
+    limiter_queue_size: int = 256
+    limiter_queue_timeout: float = 10.0
+
+    # Caching
+    cache_enabled: bool = True
+    cache_ttl: int = 300
+    cache_max_entries: int = 1024
+    redis_url: Optional[str] = None
+    semantic_cache_enabled: bool = False
+    semantic_cache_threshold: float = 0.9
+    semantic_cache_max_entries: int = 100000
+    semantic_cache_embedder: str = "hashing"
+    semantic_cache_embedding_model: str = "text-embedding-3-small"
+    semantic_cache_index: str = "ivf"
+
+    # Tracing
+    tracing_exporter: str = "none"
+    tracing_sample_rate: float = 1.0
+
+    @classmethod
+    def from_env(cls, environ: Optional[Mapping[str, str]] = None) -> "Settings":
+        environ = os.environ if environ is None else environ
+        hints = get_type_hints(cls)
+        values = {}
+        for field in fields(cls):
+            name = field.name.upper()
+            raw = environ.get(name, "").strip()
+            if not raw:
+                continue
+            try:
+                values[field.name] = _parse(hints[field.name], raw)
+            except ValueError:
+                raise ValueError(f"Invalid value for {name}: {raw!r}") from None
+        return cls(**values)
+
+    def require_openai_api_key(self) -> str:
+        if not self.openai_api_key:
+            raise ValueError(
+                "OPENAI_API_KEY environment variable is required but not set"
+            )
+        return self.openai_api_key
+
+
+def _parse(kind, raw: str):
+    if kind is bool:
+        if raw.lower() in _TRUE:
+            return True
+        if raw.lower() in _FALSE:
+            return False
+        raise ValueError(raw)
+    if kind in (int, float):
+        return kind(raw)
+    return raw
+
+
+_settings: Optional[Settings] = None
+_lock = threading.Lock()
+
+
+def load_settings(env_file: Optional[str] = None) -> Settings:
+    # Values already in the environment win over the .env file; without a
+    # path, .env is searched for from this package upwards
+    from dotenv import load_dotenv
+
+    load_dotenv(env_file)
+    return Settings.from_env()
+
+
+def get_settings() -> Settings:
+    # Loaded on first use rather than at import, so importing the app has no
+    # side effects and a bad value fails with a clear error where it is used
+    global _settings
+    if _settings is None:
+        with _lock:
+            if _settings is None:
+                _settings = load_settings()
+    return _settings
+
+
+def configure(settings: Optional[Settings] = None):
+    # Replaces the process-wide settings; None reloads them on next use
+    global _settings
+    _settings = settings
+
+
+@contextmanager
+def override_settings(**changes) -> Iterator[Settings]:
+    previous = _settings
+    settings = replace(get_settings(), **changes)
+    configure(settings)
+    try:
+        yield settings
+    finally:
+        configure(previous)
@@ -0,0 +1,361 @@
+import asyncio
+import hashlib
+import itertools
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from collections import deque
+from typing import List, Optional
+from app.search import InvertedIndex, fts5_query
+from app.settings import get_settings
+
+_STOP = object()
+
+logger = logging.getLogger(__name__)
+
+
+def question_hash(question: str, context: Optional[str] = None) -> str:
+    normalized = f"{' '.join(question.split()).lower()}\x00{context or ''}"
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+class MemoryQuestionStore:
+    # Keeps only the most recent rows so memory stays bounded. Reads run in
+    # the threadpool while adds happen on the event loop, hence the lock.
+    def __init__(self, max_rows: Optional[int] = None):
+        if max_rows is None:
+            max_rows = get_settings().store_max_memory_rows
+        self._rows: deque = deque(maxlen=max_rows)
+        self._by_id: dict = {}
+        self._ids = itertools.count(1)
+        self._index = InvertedIndex()
+        self._lock = threading.Lock()
+
+    def add(self, question: str, answer: str, context: Optional[str] = None):
+        digest = question_hash(question, context)
+        with self._lock:
+            if len(self._rows) == self._rows.maxlen:
+                oldest = self._rows[0]
+                self._index.remove(oldest["id"])
+                del self._by_id[oldest["id"]]
+
+            row = {
+                "id": next(self._ids),
+                "question": question,
+                "answer": answer,
+                "context": context,
+                "created_at": time.time(),
+                "question_hash": digest,
+            }
+            self._rows.append(row)
+            self._by_id[row["id"]] = row
+            self._index.add(row["id"], f"{question} {answer} {context or ''}")
+
+    def list_questions(
+        self,
+        limit: Optional[int] = None,
+        after: Optional[int] = None,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+        context: Optional[str] = None,
+    ) -> List[dict]:
+        page = []
+        with self._lock:
+            for row in self._rows:
+                if after is not None and row["id"] <= after:
+                    continue
+                if since is not None and row["created_at"] < since:
+                    continue
+                if until is not None and row["created_at"] >= until:
+                    continue
+                if context is not None and row["context"] != context:
+                    continue
+                page.append(self._public(row))
+                if limit is not None and len(page) >= limit:
+                    break
+        return page
+
+    def find(self, question: str, context: Optional[str] = None) -> List[dict]:
+        digest = question_hash(question, context)
+        with self._lock:
+            return [
+                self._public(row)
+                for row in reversed(self._rows)
+                if row["question_hash"] == digest
+            ]
+
+    def search(self, query: str, limit: int = 20, offset: int = 0) -> List[dict]:
+        with self._lock:
+            return [
+                {**self._public(self._by_id[doc_id]), "score": score}
+                for doc_id, score in self._index.search(query, limit, offset)
+            ]
+
+    def count(self) -> int:
+        return len(self._rows)
+
+    def clear(self):
+        with self._lock:
+            self._rows.clear()
+            self._by_id.clear()
+            self._index.clear()
+
+    def flush(self):
+        pass
+
+    async def aclose(self):
+        pass
+
+    @staticmethod
+    def _public(row: dict) -> dict:
+        return {k: v for k, v in row.items() if k != "question_hash"}
+
+
+class SQLiteQuestionStore:
+    # Rows are queued by the request path and written in batches by a single
+    # writer thread; readers use their own WAL connections and never block it
+    _COLUMNS = "id, question, answer, context, created_at"
+
+    def __init__(self, path: str, batch_size: Optional[int] = None):
+        self.path = path
+        if batch_size is None:
+            batch_size = get_settings().store_write_batch_size
+        self.batch_size = batch_size
+        self._local = threading.local()
+        self._queue: queue.Queue = queue.Queue()
+        # Rows that failed to insert, e.g. on a full disk or a locked database
+        self.dropped = 0
+
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            has_fts = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE name = 'questions_fts'"
+            ).fetchone()
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS questions (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    question TEXT NOT NULL,
+                    answer TEXT NOT NULL,
+                    context TEXT,
+                    created_at REAL NOT NULL,
+                    question_hash TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_questions_created_at
+                    ON questions (created_at);
+                CREATE INDEX IF NOT EXISTS idx_questions_hash
+                    ON questions (question_hash);
+                CREATE VIRTUAL TABLE IF NOT EXISTS questions_fts USING fts5(
+                    question, answer, context,
+                    content='questions', content_rowid='id'
+                );
+                CREATE TRIGGER IF NOT EXISTS questions_fts_insert
+                AFTER INSERT ON questions BEGIN
+                    INSERT INTO questions_fts (rowid, question, answer, context)
+                    VALUES (new.id, new.question, new.answer, new.context);
+                END;
+                CREATE TRIGGER IF NOT EXISTS questions_fts_delete
+                AFTER DELETE ON questions BEGIN
+                    INSERT INTO questions_fts
+                        (questions_fts, rowid, question, answer, context)
+                    VALUES ('delete', old.id, old.question, old.answer, old.context);
+                END;
+                """)
+            if not has_fts:
+                # Index rows written before full-text search existed
+                conn.execute(
+                    "INSERT INTO questions_fts (questions_fts) VALUES ('rebuild')"
+                )
+
+        self._writer = threading.Thread(target=self._write_loop, daemon=True)
+        self._writer.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _reader(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    def add(self, question: str, answer: str, context: Optional[str] = None):
+        self._check_writer()
+        self._queue.put(
+            (question, answer, context, time.time(), question_hash(question, context))
+        )
+
+    def _check_writer(self):
+        # Nothing drains the queue once the writer is gone, so fail instead of
+        # letting rows pile up or callers wait forever
+        if not self._writer.is_alive():
+            raise RuntimeError("Question store writer has stopped")
+
+    def _write(self, conn: sqlite3.Connection, batch: list):
+        # created_at is raised to the newest committed row's, under the write
+        # lock, so it follows commit order even when several workers share
+        # the file and a keyset page never skips a row committed late
+        sql = (
+            "INSERT INTO questions "
+            "(question, answer, context, created_at, question_hash) "
+            "VALUES (?, ?, ?, "
+            "max(?, coalesce((SELECT max(created_at) FROM questions), 0)), ?)"
+        )
+        try:
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                conn.executemany(sql, batch)
+            return
+        except sqlite3.Error:
+            if len(batch) == 1:
+                logger.exception("Dropped a question row that could not be written")
+                self.dropped += 1
+                return
+        # The batch was rolled back: write the rows one at a time so a bad
+        # row only costs itself
+        for row in batch:
+            self._write(conn, [row])
+
+    def _write_loop(self):
+        conn = self._connect()
+        stopping = False
+        while not stopping:
+            batch, waiters = [], []
+            item = self._queue.get()
+            while True:
+                if item is _STOP:
+                    stopping = True
+                elif isinstance(item, threading.Event):
+                    waiters.append(item)
+                else:
+                    batch.append(item)
+                if stopping or len(batch) >= self.batch_size:
+                    break
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+
+            try:
+                if batch:
+                    self._write(conn, batch)
+            except Exception:
+                logger.exception("Dropped %d question rows", len(batch))
+                self.dropped += len(batch)
+            finally:
+                for waiter in waiters:
+                    waiter.set()
+        conn.close()
+
+    def flush(self):
+        # Blocks until every row queued before this call is committed, or
+        # dropped because it could not be
+        self._check_writer()
+        done = threading.Event()
+        self._queue.put(done)
+        while not done.wait(1.0):
+            self._check_writer()
+
+    def list_questions(
+        self,
+        limit: Optional[int] = None,
+        after: Optional[int] = None,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+        context: Optional[str] = None,
+    ) -> List[dict]:
+        # Keyset pagination in (created_at, id) order, which the created_at
+        # index serves directly, so deep and time-bounded pages cost the same
+        conn = self._reader()
+        clauses, params = [], []
+
+        if after is not None:
+            cursor = conn.execute(
+                "SELECT created_at FROM questions WHERE id = ?", (after,)
+            ).fetchone()
+            if cursor is None:
+                return []
+            # Keep only the tighter of the two lower bounds for the index range
+            if since is None or cursor["created_at"] >= since:
+                clauses.append("(created_at, id) > (?, ?)")
+                params.extend([cursor["created_at"], after])
+                since = None
+        if since is not None:
+            clauses.append("created_at >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("created_at < ?")
+            params.append(until)
+        if context is not None:
+            clauses.append("context = ?")
+            params.append(context)
+
+        sql = f"SELECT {self._COLUMNS} FROM questions"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY created_at, id"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+
+        return [dict(row) for row in conn.execute(sql, params)]
+
+    def find(self, question: str, context: Optional[str] = None) -> List[dict]:
+        rows = self._reader().execute(
+            f"SELECT {self._COLUMNS} FROM questions "
+            "WHERE question_hash = ? ORDER BY id DESC",
+            (question_hash(question, context),),
+        )
+        return [dict(row) for row in rows]
+
+    def search(self, query: str, limit: int = 20, offset: int = 0) -> List[dict]:
+        match = fts5_query(query)
+        if not match:
+            return []
+        # bm25() is lower-is-better; report it so higher means more relevant
+        rows = self._reader().execute(
+            "SELECT q.id, q.question, q.answer, q.context, q.created_at, "
+            "-bm25(questions_fts) AS score "
+            "FROM questions_fts JOIN questions q ON q.id = questions_fts.rowid "
+            "WHERE questions_fts MATCH ? ORDER BY bm25(questions_fts) "
+            "LIMIT ? OFFSET ?",
+            (match, limit, offset),
+        )
+        return [dict(row) for row in rows]
+
+    def count(self) -> int:
+        return self._reader().execute("SELECT COUNT(*) FROM questions").fetchone()[0]
+
+    def clear(self):
+        self.flush()
+        with self._reader() as conn:
+            conn.execute("DELETE FROM questions")
+
+    def close(self):
+        if self._writer.is_alive():
+            self._queue.put(_STOP)
+            self._writer.join()
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    async def aclose(self):
+        await asyncio.to_thread(self.close)
+
+
+def sqlite_path(database_url: str) -> str:
+    if database_url.startswith("sqlite:///"):
+        return database_url[len("sqlite:///") :]
+    raise ValueError(f"Unsupported DATABASE_URL: {database_url}")
+
+
+def create_question_store():
+    database_url = get_settings().database_url
+    if not database_url:
+        return MemoryQuestionStore()
+    return SQLiteQuestionStore(sqlite_path(database_url))
@@ -0,0 +1,190 @@
+import functools
+import re
+from dataclasses import dataclass
+from typing import List, Optional
+from app.search import InvertedIndex
+from app.settings import get_settings
+
+# Total tokens (prompt + completion) each model accepts
+MODEL_CONTEXT_WINDOWS = {
+    "gpt-3.5-turbo": 16385,
+    "gpt-4": 8192,
+    "gpt-4-turbo": 128000,
+    "gpt-4o": 128000,
+    "gpt-4o-mini": 128000,
+}
+DEFAULT_CONTEXT_WINDOW = 8192
+
+# Chat framing overhead: per message, plus the primed assistant reply
+TOKENS_PER_MESSAGE = 4
+TOKENS_PER_REPLY = 3
+CONTEXT_PREFIX = "Context: "
+
+TRIM_STRATEGIES = ("head", "middle", "relevant", "reject")
+
+_APPROX_TOKEN = re.compile(r"\s*\w{1,4}|\s*[^\w\s]|\s+")
+_SENTENCE = re.compile(r"(?<=[.!?])\s+|\n+")
+
+
+class PromptTooLarge(Exception):
+    pass
+
+
+@dataclass
+class TokenUsage:
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    total_tokens: int = 0
+
+    def __post_init__(self):
+        self.total_tokens = self.prompt_tokens + self.completion_tokens
+
+
+class ApproximateEncoding:
+    # Stand-in when tiktoken is not installed: word pieces of up to four
+    # characters, which tracks cl100k token counts closely for English
+    name = "approximate"
+
+    def encode(self, text: str, **kwargs) -> List[str]:
+        return _APPROX_TOKEN.findall(text)
+
+    def decode(self, tokens: List[str]) -> str:
+        return "".join(tokens)
+
+
+@functools.lru_cache(maxsize=None)
+def get_encoding(model: str):
+    # Loading a BPE table is slow, so each model's encoder is built once
+    try:
+        import tiktoken
+    except ImportError:
+        return ApproximateEncoding()
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def context_window(model: str) -> int:
+    override = get_settings().openai_context_window
+    if override:
+        return override
+    return MODEL_CONTEXT_WINDOWS.get(model, DEFAULT_CONTEXT_WINDOW)
+
+
+class TokenBudget:
+    # Fits context into what is left of the model's window once the
+    # question, chat framing and the reserved completion are accounted for
+    def __init__(
+        self,
+        model: str,
+        max_tokens: int,
+        strategy: Optional[str] = None,
+        max_context_tokens: Optional[int] = None,
+        max_context_chars: Optional[int] = None,
+    ):
+        settings = get_settings()
+        strategy = settings.context_trim_strategy if strategy is None else strategy
+        if max_context_tokens is None:
+            max_context_tokens = settings.context_max_tokens
+        if max_context_chars is None:
+            max_context_chars = settings.context_max_chars
+        if strategy not in TRIM_STRATEGIES:
+            raise ValueError(f"Unknown context trim strategy: {strategy}")
+
+        self.model = model
+        self.max_tokens = max_tokens
+        self.strategy = strategy
+        self.max_context_tokens = max_context_tokens
+        self.max_context_chars = max_context_chars
+        self.encoding = get_encoding(model)
+
+    def encode(self, text: str) -> list:
+        # User text may contain special-token markers; count them as text
+        return self.encoding.encode(text, disallowed_special=())
+
+    def count(self, text: str) -> int:
+        return len(self.encode(text))
+
+    def count_messages(self, messages: list) -> int:
+        return TOKENS_PER_REPLY + sum(
+            TOKENS_PER_MESSAGE + self.count(message["content"]) for message in messages
+        )
+
+    def context_budget(self, prompt: str) -> int:
+        available = (
+            context_window(self.model)
+            - self.max_tokens
+            - TOKENS_PER_REPLY
+            - 2 * TOKENS_PER_MESSAGE
+            - self.count(prompt)
+            - self.count(CONTEXT_PREFIX)
+        )
+        if available < 0:
+            raise PromptTooLarge(
+                f"Question needs {-available} more tokens than {self.model} allows"
+            )
+        if self.max_context_tokens:
+            available = min(available, self.max_context_tokens)
+        return available
+
+    def fit(self, prompt: str, context: Optional[str]) -> Optional[str]:
+        budget = self.context_budget(prompt)
+        if not context:
+            return context
+        # Checked before tokenizing, which takes time in proportion to the
+        # input and holds the GIL while it does
+        if self.max_context_chars and len(context) > self.max_context_chars:
+            raise PromptTooLarge(
+                f"Context is {len(context)} characters; "
+                f"the limit is {self.max_context_chars}"
+            )
+
+        tokens = self.encode(context)
+        if len(tokens) <= budget:
+            return context
+
+        if self.strategy == "reject":
+            raise PromptTooLarge(
+                f"Context is {len(tokens)} tokens; the budget is {budget}"
+            )
+        if budget == 0:
+            return None
+        if self.strategy == "head":
+            return self.encoding.decode(tokens[:budget])
+        if self.strategy == "middle":
+            # Keep both ends, which tend to hold the intro and the conclusion
+            head = (budget + 1) // 2
+            tail = budget - head
+            return self.encoding.decode(tokens[:head]) + (
+                self.encoding.decode(tokens[-tail:]) if tail else ""
+            )
+        trimmed = self._relevant(prompt, context, budget)
+        if self.count(trimmed) > budget:
+            trimmed = self.encoding.decode(self.encode(trimmed)[:budget])
+        return trimmed
+
+    def _relevant(self, prompt: str, context: str, budget: int) -> str:
+        # Extractive summary: the sentences that best match the question,
+        # put back in their original order
+        sentences = [s for s in _SENTENCE.split(context) if s.strip()]
+        index = InvertedIndex()
+        for i, sentence in enumerate(sentences):
+            index.add(i, sentence)
+        ranked = [
+            i for i, _ in index.search(prompt, limit=len(sentences), match_all=False)
+        ]
+        matched = set(ranked)
+        ranked += [i for i in range(len(sentences)) if i not in matched]
+
+        kept, used = [], 0
+        for i in ranked:
+            cost = self.count(sentences[i]) + 1
+            if used + cost > budget:
+                continue
+            kept.append(i)
+            used += cost
+
+        if not kept:
+            return self.encoding.decode(self.encode(context)[:budget])
+        return " ".join(sentences[i] for i in sorted(kept))
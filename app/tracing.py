@@ -0,0 +1,419 @@
+import contextvars
+import json
+import random
+import re
+import sys
+import threading
+import time
+from typing import Dict, List, NamedTuple, Optional, Sequence, TextIO
+from app.metrics import route_template
+from app.settings import get_settings
+
+TRACEPARENT_HEADER = "traceparent"
+TRACESTATE_HEADER = "tracestate"
+
+# W3C Trace Context: version-traceid-parentid-flags
+_TRACEPARENT = re.compile(r"^([0-9a-f]{2})-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})")
+_INVALID_TRACE_ID = "0" * 32
+_INVALID_SPAN_ID = "0" * 16
+
+
+class SpanContext(NamedTuple):
+    trace_id: str
+    span_id: str
+    sampled: bool
+    remote: bool = False
+    tracestate: Optional[str] = None
+
+
+def parse_traceparent(
+    header: Optional[str], tracestate: Optional[str] = None
+) -> Optional[SpanContext]:
+    if not header:
+        return None
+    header = header.strip()
+    match = _TRACEPARENT.match(header)
+    if match is None:
+        return None
+    version, trace_id, span_id, flags = match.groups()
+    # Version ff is forbidden; future versions may append fields, so only
+    # version 00 has to end right after the flags
+    if version == "ff" or (version == "00" and len(header) != 55):
+        return None
+    if trace_id == _INVALID_TRACE_ID or span_id == _INVALID_SPAN_ID:
+        return None
+    return SpanContext(
+        trace_id, span_id, bool(int(flags, 16) & 1), True, tracestate or None
+    )
+
+
+def format_traceparent(context: SpanContext) -> str:
+    flags = "01" if context.sampled else "00"
+    return f"00-{context.trace_id}-{context.span_id}-{flags}"
+
+
+class Span:
+    # Follows the OpenTelemetry span model (ids, kind, attributes, events,
+    # status), so exporters can map spans onto OTLP field for field
+    recording = True
+
+    def __init__(
+        self,
+        tracer: "Tracer",
+        name: str,
+        context: SpanContext,
+        parent_id: Optional[str] = None,
+        kind: str = "internal",
+        attributes: Optional[dict] = None,
+    ):
+        self.tracer = tracer
+        self.name = name
+        self.context = context
+        self.parent_id = parent_id
+        self.kind = kind
+        self.attributes = dict(attributes) if attributes else {}
+        self.events: List[dict] = []
+        self.status = "unset"
+        self.status_message: Optional[str] = None
+        self.start_time = time.time_ns()
+        self.end_time: Optional[int] = None
+
+    @property
+    def duration(self) -> Optional[float]:
+        if self.end_time is None:
+            return None
+        return (self.end_time - self.start_time) / 1e9
+
+    def set_attribute(self, key: str, value):
+        self.attributes[key] = value
+
+    def add_event(self, name: str, attributes: Optional[dict] = None):
+        self.events.append(
+            {"name": name, "time": time.time_ns(), "attributes": attributes or {}}
+        )
+
+    def set_status(self, status: str, message: Optional[str] = None):
+        self.status = status
+        self.status_message = message
+
+    def record_exception(self, error: BaseException):
+        self.add_event(
+            "exception",
+            {
+                "exception.type": type(error).__name__,
+                "exception.message": str(error),
+            },
+        )
+        self.set_status("error", str(error) or type(error).__name__)
+
+    def end(self):
+        if self.end_time is not None:
+            return
+        self.end_time = time.time_ns()
+        self.tracer.exporter.export([self])
+
+    def to_dict(self) -> dict:
+        return {
+            "traceId": self.context.trace_id,
+            "spanId": self.context.span_id,
+            "parentSpanId": self.parent_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": self.start_time,
+            "endTimeUnixNano": self.end_time,
+            "attributes": self.attributes,
+            "events": self.events,
+            "status": {"code": self.status, "message": self.status_message},
+        }
+
+
+class NonRecordingSpan:
+    # Stands in when a request is not sampled. It still carries the caller's
+    # trace context (if any) so it can be passed on to the upstream.
+    recording = False
+    duration = None
+
+    def __init__(self, context: Optional[SpanContext] = None):
+        self.context = context
+
+    def set_attribute(self, key: str, value):
+        pass
+
+    def add_event(self, name: str, attributes: Optional[dict] = None):
+        pass
+
+    def set_status(self, status: str, message: Optional[str] = None):
+        pass
+
+    def record_exception(self, error: BaseException):
+        pass
+
+    def end(self):
+        pass
+
+
+INVALID_SPAN = NonRecordingSpan()
+
+_current_span: contextvars.ContextVar = contextvars.ContextVar(
+    "current_span", default=INVALID_SPAN
+)
+
+
+def current_span():
+    return _current_span.get()
+
+
+class _Scope:
+    # Makes a span current for a `with` block and ends it on the way out,
+    # recording any exception that escapes
+    __slots__ = ("span", "_token")
+
+    def __init__(self, span):
+        self.span = span
+
+    def __enter__(self):
+        self._token = _current_span.set(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, error, tb):
+        _current_span.reset(self._token)
+        if error is not None:
+            self.span.record_exception(error)
+        self.span.end()
+        return False
+
+
+class _NoopScope:
+    # Unsampled spans leave the current span alone and allocate nothing
+    __slots__ = ()
+
+    def __enter__(self):
+        return INVALID_SPAN
+
+    def __exit__(self, exc_type, error, tb):
+        return False
+
+
+_NOOP_SCOPE = _NoopScope()
+
+
+class NoopExporter:
+    def export(self, spans: Sequence[Span]):
+        pass
+
+    def shutdown(self):
+        pass
+
+
+class InMemoryExporter:
+    # Keeps finished spans for tests and debugging
+    def __init__(self):
+        self._spans: List[Span] = []
+        self._lock = threading.Lock()
+
+    def export(self, spans: Sequence[Span]):
+        with self._lock:
+            self._spans.extend(spans)
+
+    def spans(self) -> List[Span]:
+        with self._lock:
+            return list(self._spans)
+
+    def clear(self):
+        with self._lock:
+            self._spans.clear()
+
+    def shutdown(self):
+        self.clear()
+
+
+class ConsoleExporter:
+    # One JSON object per finished span
+    def __init__(self, out: TextIO = sys.stdout):
+        self.out = out
+        self._lock = threading.Lock()
+
+    def export(self, spans: Sequence[Span]):
+        lines = "".join(json.dumps(span.to_dict()) + "\n" for span in spans)
+        with self._lock:
+            self.out.write(lines)
+            self.out.flush()
+
+    def shutdown(self):
+        pass
+
+
+EXPORTERS = {
+    "none": NoopExporter,
+    "memory": InMemoryExporter,
+    "console": ConsoleExporter,
+}
+
+
+class Tracer:
+    # Parent-based sampling: spans under a sampled parent are always
+    # recorded, a caller's "not sampled" flag is honored, and new traces are
+    # sampled at `sample_rate`. With the no-op exporter nothing is recorded,
+    # but incoming trace context is still passed on to the upstream.
+    def __init__(
+        self,
+        exporter=None,
+        sample_rate: Optional[float] = None,
+        rng: Optional[random.Random] = None,
+    ):
+        if sample_rate is None:
+            sample_rate = get_settings().tracing_sample_rate
+        self.exporter = exporter or NoopExporter()
+        self.sample_rate = sample_rate
+        self.rng = rng or random.Random()
+        self.enabled = not isinstance(self.exporter, NoopExporter) and sample_rate > 0
+
+    def _id(self, bits: int) -> str:
+        return f"{self.rng.getrandbits(bits):0{bits // 4}x}"
+
+    def _should_sample(self, parent: Optional[SpanContext]) -> bool:
+        if not self.enabled:
+            return False
+        if parent is not None:
+            return parent.sampled
+        return self.sample_rate >= 1 or self.rng.random() < self.sample_rate
+
+    def start_span(
+        self,
+        name: str,
+        kind: str = "internal",
+        attributes: Optional[dict] = None,
+        parent: Optional[SpanContext] = None,
+    ):
+        # Returns a span that must be ended by the caller; prefer span()
+        if parent is None:
+            parent = _current_span.get().context
+        if not self._should_sample(parent):
+            if parent is not None:
+                # Not ours to record, but the caller's trace goes on upstream
+                return NonRecordingSpan(parent) if parent.remote else INVALID_SPAN
+            if self.enabled:
+                # A trace dropped at the root: the decision is kept in context
+                # so its children are dropped too, and passed on as such
+                return NonRecordingSpan(SpanContext(self._id(128), self._id(64), False))
+            return INVALID_SPAN
+        if parent is None:
+            context = SpanContext(self._id(128), self._id(64), True)
+            parent_id = None
+        else:
+            context = SpanContext(
+                parent.trace_id, self._id(64), True, tracestate=parent.tracestate
+            )
+            parent_id = parent.span_id
+        return Span(self, name, context, parent_id, kind, attributes)
+
+    def span(
+        self,
+        name: str,
+        kind: str = "internal",
+        attributes: Optional[dict] = None,
+        parent: Optional[SpanContext] = None,
+    ):
+        # The common case, tracing off, costs one context variable lookup
+        if not self.enabled and parent is None:
+            return _NOOP_SCOPE
+        span = self.start_span(name, kind, attributes, parent)
+        if span is INVALID_SPAN:
+            return _NOOP_SCOPE
+        return _Scope(span)
+
+    def shutdown(self):
+        self.exporter.shutdown()
+
+
+def create_tracer() -> Tracer:
+    name = get_settings().tracing_exporter
+    try:
+        exporter = EXPORTERS[name]()
+    except KeyError:
+        raise ValueError(
+            f"Unknown TRACING_EXPORTER {name!r}, "
+            f"expected one of {', '.join(EXPORTERS)}"
+        )
+    return Tracer(exporter)
+
+
+# The process-wide tracer, built from settings on first use; tests and
+# benchmarks swap it by assigning TRACER
+TRACER: Optional[Tracer] = None
+
+
+def get_tracer() -> Tracer:
+    global TRACER
+    if TRACER is None:
+        TRACER = create_tracer()
+    return TRACER
+
+
+def span(name: str, kind: str = "internal", attributes: Optional[dict] = None):
+    # Child of the current span, on the process-wide tracer
+    return get_tracer().span(name, kind, attributes)
+
+
+def inject(headers: Dict[str, str]) -> Dict[str, str]:
+    context = _current_span.get().context
+    if context is not None:
+        headers[TRACEPARENT_HEADER] = format_traceparent(context)
+        if context.tracestate:
+            headers[TRACESTATE_HEADER] = context.tracestate
+    return headers
+
+
+def upstream_headers() -> dict:
+    # Keyword arguments for an OpenAI SDK call: trace headers when there is a
+    # trace to continue, nothing at all otherwise
+    headers = inject({})
+    return {"extra_headers": headers} if headers else {}
+
+
+def _header(scope, name: bytes) -> Optional[str]:
+    for key, value in scope["headers"]:
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+
+class TracingMiddleware:
+    # Plain ASGI, like MetricsMiddleware. Starts a server span per request,
+    # continuing the caller's W3C trace when a traceparent header is sent.
+    def __init__(self, app, routers: Sequence):
+        self.app = app
+        self.routers = routers
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        tracer = get_tracer()
+        parent = parse_traceparent(
+            _header(scope, b"traceparent"), _header(scope, b"tracestate")
+        )
+        if not tracer.enabled and parent is None:
+            await self.app(scope, receive, send)
+            return
+
+        route = route_template(self.routers, scope)
+        method = scope["method"]
+        attributes = {
+            "http.request.method": method,
+            "http.route": route,
+            "url.path": scope["path"],
+        }
+        span = tracer.start_span(f"{method} {route}", "server", attributes, parent)
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                span.set_attribute("http.response.status_code", status)
+                if status >= 500:
+                    span.set_status("error")
+            await send(message)
+
+        with _Scope(span):
+            await self.app(scope, receive, send_with_status)
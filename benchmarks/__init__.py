@@ -0,0 +1 @@
+# Empty file to make benchmarks a Python package
@@ -0,0 +1,77 @@
+# Compares building an OpenAIClient per request against the shared registry
+# client, both talking to a local mock upstream.
+#
+#   python -m benchmarks.bench_client_lifecycle --requests 200
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+from benchmarks.mock_upstream import MockUpstream
+
+
+def summarize(label: str, samples: list) -> float:
+    samples_ms = sorted(s * 1000 for s in samples)
+    mean = statistics.mean(samples_ms)
+    p95 = samples_ms[int(len(samples_ms) * 0.95) - 1]
+    print(
+        f"{label:<24} mean={mean:7.3f}ms  p50={statistics.median(samples_ms):7.3f}ms  p95={p95:7.3f}ms"
+    )
+    return mean
+
+
+async def per_request_client(n: int) -> list:
+    from app.openai_client import OpenAIClient
+
+    samples = []
+    for _ in range(n):
+        start = time.perf_counter()
+        client = OpenAIClient()
+        await client.agenerate_response("What is FastAPI?")
+        await client.aclose()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+async def shared_client(n: int) -> list:
+    from app.clients import ClientRegistry
+    from app.openai_client import OpenAIClient
+
+    # A bare client without the response caches, so every request reaches
+    # the upstream just like the per-request case
+    registry = ClientRegistry()
+    registry.register("openai", OpenAIClient)
+    client = registry.get("openai")
+    await client.agenerate_response("warm-up")
+
+    samples = []
+    for _ in range(n):
+        start = time.perf_counter()
+        client = registry.get("openai")
+        await client.agenerate_response("What is FastAPI?")
+        samples.append(time.perf_counter() - start)
+    await registry.aclose()
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    with MockUpstream(port=args.port) as upstream:
+        os.environ.setdefault("OPENAI_API_KEY", "benchmark-key")
+        os.environ["OPENAI_BASE_URL"] = upstream.base_url
+
+        per_request = summarize(
+            "per-request client", asyncio.run(per_request_client(args.requests))
+        )
+        shared = summarize("shared client", asyncio.run(shared_client(args.requests)))
+
+    print(f"saved per request: {per_request - shared:.3f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+# Measures the cost of recording metrics: a single histogram observation, and
+# a full request through the ASGI app with and without MetricsMiddleware.
+#
+#   python -m benchmarks.bench_metrics --requests 5000
+import argparse
+import asyncio
+import time
+
+from fastapi import APIRouter, FastAPI
+
+from app.metrics import Histogram, MetricsMiddleware, MetricsRegistry
+
+
+def bench_observe(n: int) -> float:
+    histogram = Histogram("bench_seconds", "Benchmark", registry=MetricsRegistry())
+    child = histogram.labels()
+    start = time.perf_counter()
+    for i in range(n):
+        child.observe(i * 1e-6)
+    return (time.perf_counter() - start) / n
+
+
+def build_app(with_metrics: bool) -> FastAPI:
+    router = APIRouter(prefix="/api/v1")
+
+    async def item(item_id: str):
+        return {"id": item_id}
+
+    router.add_api_route("/items/{item_id}", item, methods=["GET"])
+    app = FastAPI()
+    app.include_router(router)
+    if with_metrics:
+        app.add_middleware(MetricsMiddleware, routers=[router])
+    return app
+
+
+async def bench_requests(app: FastAPI, n: int) -> float:
+    # Drives the ASGI app directly so only in-process work is measured
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    def scope(i: int) -> dict:
+        return {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": "GET",
+            "scheme": "http",
+            "path": f"/api/v1/items/{i}",
+            "raw_path": f"/api/v1/items/{i}".encode(),
+            "root_path": "",
+            "query_string": b"",
+            "headers": [],
+            "client": ("127.0.0.1", 1234),
+            "server": ("127.0.0.1", 8000),
+            "state": {},
+        }
+
+    for i in range(100):
+        await app(scope(i), receive, send)
+    start = time.perf_counter()
+    for i in range(n):
+        await app(scope(i), receive, send)
+    return (time.perf_counter() - start) / n
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--observations", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    print(f"histogram observe      {bench_observe(args.observations) * 1e9:8.0f}ns")
+    plain = asyncio.run(bench_requests(build_app(False), args.requests))
+    metered = asyncio.run(bench_requests(build_app(True), args.requests))
+    print(f"request without metrics {plain * 1e6:7.1f}us")
+    print(f"request with metrics    {metered * 1e6:7.1f}us")
+    print(f"overhead per request    {(metered - plain) * 1e6:7.1f}us")
+
+
+if __name__ == "__main__":
+    main()
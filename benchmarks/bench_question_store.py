@@ -0,0 +1,81 @@
+# Measures GET /api/v1/questions-style reads against a large SQLite history:
+# first page, a deep keyset page, a time-range page and full-text search.
+#
+#   python -m benchmarks.bench_question_store --rows 1000000
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+from app.storage import SQLiteQuestionStore, question_hash
+
+
+def fill(store: SQLiteQuestionStore, rows: int):
+    conn = store._connect()
+    now = time.time() - rows
+    batch = []
+    with conn:
+        for i in range(rows):
+            question = f"Question number {i}?"
+            batch.append(
+                (question, f"Answer {i}", None, now + i, question_hash(question))
+            )
+            if len(batch) == 10000:
+                conn.executemany(
+                    "INSERT INTO questions "
+                    "(question, answer, context, created_at, question_hash) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    batch,
+                )
+                batch.clear()
+        if batch:
+            conn.executemany(
+                "INSERT INTO questions "
+                "(question, answer, context, created_at, question_hash) "
+                "VALUES (?, ?, ?, ?, ?)",
+                batch,
+            )
+    conn.close()
+
+
+def measure(label: str, fn, repeats: int = 200):
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    print(
+        f"{label:<20} p50={statistics.median(samples):.3f}ms  "
+        f"p99={samples[int(len(samples) * 0.99) - 1]:.3f}ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = SQLiteQuestionStore(os.path.join(tmp, "questions.db"))
+        fill(store, args.rows)
+        midpoint = time.time() - args.rows / 2
+
+        measure("first page", lambda: store.list_questions(limit=100))
+        measure(
+            "deep page",
+            lambda: store.list_questions(limit=100, after=args.rows - 1000),
+        )
+        measure(
+            "time range page",
+            lambda: store.list_questions(limit=100, since=midpoint),
+        )
+        measure("hash lookup", lambda: store.find("Question number 12345?"))
+        measure("search (rare term)", lambda: store.search("12345"))
+        measure("search (two terms)", lambda: store.search("answer 777777"))
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+# Cold-start cost: importing the app in a fresh interpreter, and the time
+# from spawning uvicorn to the first /health answer and to the first answered
+# /api/v1/ask (against the mock upstream), with clients built lazily and with
+# STARTUP_PRELOAD=true.
+#
+#   python -m benchmarks.bench_startup --runs 5
+#   python -m benchmarks.bench_startup --root /path/to/other/checkout
+import argparse
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+import httpx
+from benchmarks.loadtest import ROOT, ServerProcess, api_env, free_port
+
+IMPORT_SCRIPT = (
+    "import time; start = time.perf_counter(); import app.main; "
+    "print(time.perf_counter() - start)"
+)
+
+
+def measure_import(root: str, env: Dict[str, str]) -> Dict[str, float]:
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-c", IMPORT_SCRIPT],
+        cwd=root,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return {
+        "import_s": float(result.stdout),
+        "process_s": time.perf_counter() - start,
+    }
+
+
+def measure_ready(root: str, env: Dict[str, str]) -> Dict[str, float]:
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    args = [
+        sys.executable,
+        "-m",
+        "uvicorn",
+        "app.main:app",
+        "--host=127.0.0.1",
+        f"--port={port}",
+        "--log-level=warning",
+    ]
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        args, cwd=root, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        with httpx.Client(base_url=base_url, timeout=30) as client:
+            deadline = start + 30
+            while True:
+                if process.poll() is not None or time.perf_counter() > deadline:
+                    raise RuntimeError("API server did not start")
+                try:
+                    if client.get("/health").status_code == 200:
+                        break
+                except httpx.HTTPError:
+                    time.sleep(0.002)
+            ready = time.perf_counter() - start
+            response = client.post("/api/v1/ask", json={"question": "What is FastAPI?"})
+            response.raise_for_status()
+            answered = time.perf_counter() - start
+    finally:
+        process.terminate()
+        process.wait()
+    return {"ready_s": ready, "first_answer_s": answered}
+
+
+def report(label: str, runs: List[Dict[str, float]]):
+    for metric in runs[0]:
+        values = [run[metric] for run in runs]
+        print(
+            f"{label:<10}{metric:<16}"
+            f"{statistics.median(values) * 1000:9.0f}{min(values) * 1000:9.0f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--root", default=ROOT, help="Checkout to measure")
+    args = parser.parse_args()
+
+    upstream_port = free_port()
+    mock = ["benchmarks.mock_upstream", f"--port={upstream_port}"]
+    with ServerProcess(mock, upstream_port) as upstream:
+        with tempfile.TemporaryDirectory() as upload_dir:
+            env = api_env(upstream.base_url, upload_dir)
+            print(f"{'':<10}{'metric':<16}{'median':>9}{'min':>9}")
+            report("import", [measure_import(args.root, env) for _ in range(args.runs)])
+            for mode, preload in (("lazy", "false"), ("preload", "true")):
+                env = {**env, "STARTUP_PRELOAD": preload}
+                runs = [measure_ready(args.root, env) for _ in range(args.runs)]
+                report(mode, runs)
+    print("times in ms from process start")
+
+
+if __name__ == "__main__":
+    main()
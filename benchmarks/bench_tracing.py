@@ -0,0 +1,67 @@
+# Measures the cost of tracing: one span with tracing off, sampled out, and
+# recorded to memory, and a full request through TracingMiddleware with
+# tracing off versus every request recorded.
+#
+#   python -m benchmarks.bench_tracing --requests 5000
+import argparse
+import asyncio
+import time
+
+from fastapi import APIRouter, FastAPI
+
+from app import tracing
+from app.tracing import InMemoryExporter, NoopExporter, Tracer, TracingMiddleware
+from benchmarks.bench_metrics import bench_requests
+
+
+def bench_span(tracer: Tracer, n: int) -> float:
+    start = time.perf_counter()
+    for _ in range(n):
+        with tracer.span("bench"):
+            pass
+    return (time.perf_counter() - start) / n
+
+
+def build_app(with_tracing: bool) -> FastAPI:
+    router = APIRouter(prefix="/api/v1")
+
+    async def item(item_id: str):
+        with tracing.span("item"):
+            return {"id": item_id}
+
+    router.add_api_route("/items/{item_id}", item, methods=["GET"])
+    app = FastAPI()
+    app.include_router(router)
+    if with_tracing:
+        app.add_middleware(TracingMiddleware, routers=[router])
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--spans", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    off = bench_span(Tracer(NoopExporter()), args.spans)
+    sampled_out = Tracer(InMemoryExporter(), sample_rate=1e-9)
+    with sampled_out.span("root"):
+        # Children of an unsampled root, the common case at low sample rates
+        dropped = bench_span(sampled_out, args.spans)
+    recorded = bench_span(Tracer(InMemoryExporter()), args.spans // 10)
+    print(f"span, tracing off       {off * 1e9:8.0f}ns")
+    print(f"span, sampled out       {dropped * 1e9:8.0f}ns")
+    print(f"span, recorded          {recorded * 1e9:8.0f}ns")
+
+    plain = asyncio.run(bench_requests(build_app(False), args.requests))
+    tracing.TRACER = Tracer(NoopExporter())
+    disabled = asyncio.run(bench_requests(build_app(True), args.requests))
+    tracing.TRACER = Tracer(InMemoryExporter())
+    traced = asyncio.run(bench_requests(build_app(True), args.requests))
+    print(f"request, no middleware  {plain * 1e6:7.1f}us")
+    print(f"request, tracing off    {disabled * 1e6:7.1f}us")
+    print(f"request, all recorded   {traced * 1e6:7.1f}us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,429 @@
+# Load test: runs the API in its own process against a mock upstream (also in
+# its own process), drives each scenario at a fixed concurrency and reports
+# latency percentiles, throughput, errors and server memory. Each scenario
+# gets a fresh API process, so memory and history do not carry over.
+#
+#   python -m benchmarks.loadtest --scenarios ask,ask_stream --concurrency 32
+#   python -m benchmarks.loadtest --save-baseline benchmarks/baseline.json
+#   python -m benchmarks.loadtest --check benchmarks/baseline.json
+#   python -m benchmarks.loadtest --scenarios ask --workers 4
+#
+# --check reruns with the settings stored in the baseline and exits 1 when a
+# scenario got slower, lost throughput or used more memory by more than
+# --tolerance.
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+
+import httpx
+
+from benchmarks.mock_upstream import LATENCY_DISTRIBUTIONS
+from benchmarks.pdfs import make_pdf
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+WORDS = (
+    "api async cache client context deploy error fastapi latency model python "
+    "queue request response retry server stream token upload worker"
+).split()
+
+
+def question(i: int) -> str:
+    # Distinct per request so answers come from the upstream, not the cache
+    words = random.Random(i).sample(WORDS, 5)
+    return f"Question {i}: how do {' '.join(words)} fit together?"
+
+
+@dataclass
+class Scenario:
+    name: str
+    build: Callable[[httpx.AsyncClient, int], httpx.Request]
+    # Extra check on the whole body, for failures reported inside a 200
+    body_ok: Callable[[bytes], bool] = lambda body: True
+
+
+def _ask(client: httpx.AsyncClient, i: int) -> httpx.Request:
+    return client.build_request("POST", "/api/v1/ask", json={"question": question(i)})
+
+
+def _ask_stream(client: httpx.AsyncClient, i: int) -> httpx.Request:
+    return client.build_request(
+        "POST", "/api/v1/ask/stream", json={"question": question(i)}
+    )
+
+
+def _questions(client: httpx.AsyncClient, i: int) -> httpx.Request:
+    return client.build_request("GET", "/api/v1/questions", params={"limit": 50})
+
+
+def _upload(client: httpx.AsyncClient, i: int) -> httpx.Request:
+    pdf = make_pdf([f"Load test document {i}, page {page}" for page in range(3)])
+    files = {"file": (f"load-{i}.pdf", pdf, "application/pdf")}
+    return client.build_request("POST", "/api/v1/upload/pdf", files=files)
+
+
+SCENARIOS: Dict[str, Scenario] = {
+    "ask": Scenario("ask", _ask),
+    "ask_stream": Scenario(
+        "ask_stream", _ask_stream, lambda body: b"event: done" in body
+    ),
+    "questions": Scenario("questions", _questions),
+    "upload": Scenario("upload", _upload),
+}
+
+
+@dataclass
+class Sample:
+    latency: float
+    # Time to the first byte of the body, which for streams is the first event
+    ttfb: float
+    ok: bool
+
+
+async def send(client: httpx.AsyncClient, scenario: Scenario, i: int) -> Sample:
+    start = time.perf_counter()
+    first = None
+    try:
+        response = await client.send(scenario.build(client, i), stream=True)
+        try:
+            body = bytearray()
+            async for data in response.aiter_raw():
+                if first is None:
+                    first = time.perf_counter()
+                body += data
+        finally:
+            await response.aclose()
+        ok = response.status_code < 400 and scenario.body_ok(bytes(body))
+    except httpx.HTTPError:
+        ok = False
+    end = time.perf_counter()
+    return Sample(end - start, (first or end) - start, ok)
+
+
+def percentile(values: List[float], pct: float) -> float:
+    # Nearest rank
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(len(ordered) * pct / 100) - 1))
+    return ordered[index]
+
+
+def summarize(samples: List[Sample], elapsed: float) -> dict:
+    ok = [s for s in samples if s.ok]
+    latencies = [s.latency * 1000 for s in ok]
+    ttfbs = [s.ttfb * 1000 for s in ok]
+    return {
+        "requests": len(samples),
+        "errors": len(samples) - len(ok),
+        "error_rate": (len(samples) - len(ok)) / len(samples) if samples else 0.0,
+        "rps": len(ok) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 50),
+        "p95_ms": percentile(latencies, 95),
+        "p99_ms": percentile(latencies, 99),
+        "mean_ms": sum(latencies) / len(latencies) if latencies else 0.0,
+        "ttfb_p50_ms": percentile(ttfbs, 50),
+        "ttfb_p95_ms": percentile(ttfbs, 95),
+    }
+
+
+async def run_scenario(
+    client: httpx.AsyncClient,
+    scenario: Scenario,
+    concurrency: int,
+    requests: int,
+    warmup: int = 0,
+) -> dict:
+    for i in range(warmup):
+        await send(client, scenario, -1 - i)
+
+    counter = itertools.count()
+    samples: List[Sample] = []
+
+    async def worker():
+        while (i := next(counter)) < requests:
+            samples.append(await send(client, scenario, i))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(samples, time.perf_counter() - start)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@dataclass
+class ServerProcess:
+    # A server started with `python -m <module> ...`, ready once `health`
+    # answers 200
+    args: List[str]
+    port: int
+    env: Dict[str, str] = field(default_factory=lambda: dict(os.environ))
+    health: str = "/health"
+    process: Optional[subprocess.Popen] = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def __enter__(self):
+        # A file rather than a pipe, which nobody drains while the test runs
+        self._log = tempfile.TemporaryFile()
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", *self.args],
+            cwd=ROOT,
+            env=self.env,
+            stdout=subprocess.DEVNULL,
+            stderr=self._log,
+        )
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                self._log.seek(0)
+                output = self._log.read().decode(errors="replace")
+                self._log.close()
+                raise RuntimeError(f"{self.args[0]} exited: {output}")
+            try:
+                if httpx.get(self.base_url + self.health).status_code == 200:
+                    return self
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.05)
+        self.__exit__()
+        raise RuntimeError(f"{self.args[0]} did not start within 30s")
+
+    def __exit__(self, *exc_info):
+        self.process.terminate()
+        try:
+            self.process.wait(10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+        self._log.close()
+
+    def memory(self, workers: bool = False) -> dict:
+        # Resident and peak resident set size in MB (Linux only). With
+        # workers, summed over the worker processes instead; the peak is then
+        # the sum of each worker's own peak.
+        pids = [self.process.pid]
+        try:
+            if workers:
+                with open(
+                    f"/proc/{self.process.pid}/task/{self.process.pid}/children"
+                ) as f:
+                    pids = [int(pid) for pid in f.read().split()]
+            rss = peak = 0
+            for pid in pids:
+                with open(f"/proc/{pid}/status") as status:
+                    fields = dict(line.split(":", 1) for line in status)
+                rss += int(fields["VmRSS"].split()[0])
+                peak += int(fields["VmHWM"].split()[0])
+        except (OSError, KeyError):
+            return {"rss_mb": None, "peak_rss_mb": None}
+        return {"rss_mb": rss / 1024, "peak_rss_mb": peak / 1024}
+
+
+def mock_args(config: dict, port: int) -> List[str]:
+    args = [
+        "benchmarks.mock_upstream",
+        f"--port={port}",
+        f"--latency={config['latency']}",
+        f"--latency-distribution={config['latency_distribution']}",
+        f"--tokens-per-second={config['tokens_per_second']}",
+        f"--error-rate={config['error_rate']}",
+        "--seed=1",
+    ]
+    if config["answer_tokens"] is not None:
+        args.append(f"--answer-tokens={config['answer_tokens']}")
+    return args
+
+
+def api_env(upstream_url: str, upload_dir: str) -> Dict[str, str]:
+    env = dict(os.environ)
+    env.pop("LLM_BACKENDS", None)
+    env.update(
+        OPENAI_API_KEY=env.get("OPENAI_API_KEY") or "load-test-key",
+        OPENAI_BASE_URL=upstream_url + "/v1",
+        UPLOAD_DIR=upload_dir,
+    )
+    return env
+
+
+async def drive(base_url: str, scenario: Scenario, config: dict) -> dict:
+    concurrency = config["concurrency"]
+    limits = httpx.Limits(
+        max_connections=concurrency, max_keepalive_connections=concurrency
+    )
+    async with httpx.AsyncClient(
+        base_url=base_url, limits=limits, timeout=60
+    ) as client:
+        return await run_scenario(
+            client, scenario, concurrency, config["requests"], config["warmup"]
+        )
+
+
+def run(config: dict) -> Dict[str, dict]:
+    results = {}
+    upstream_port = free_port()
+    with ServerProcess(mock_args(config, upstream_port), upstream_port) as upstream:
+        for name in config["scenarios"]:
+            with tempfile.TemporaryDirectory() as upload_dir:
+                port = free_port()
+                args = [
+                    "uvicorn",
+                    "app.main:app",
+                    "--host=127.0.0.1",
+                    f"--port={port}",
+                    "--log-level=warning",
+                ]
+                env = api_env(upstream.base_url, upload_dir)
+                workers = config.get("workers", 1)
+                if workers > 1:
+                    # The supported multi-worker mode, with its shared state
+                    args = ["app.server"]
+                    env.update(WORKERS=str(workers), HOST="127.0.0.1", PORT=str(port))
+                with ServerProcess(args, port, env) as api:
+                    result = asyncio.run(drive(api.base_url, SCENARIOS[name], config))
+                    result.update(api.memory(workers > 1))
+            results[name] = result
+    return results
+
+
+# Metric -> True when a higher value is worse. p99 is reported but not
+# checked: over a few hundred requests it moves too much from run to run.
+CHECKED_METRICS = {
+    "p50_ms": True,
+    "p95_ms": True,
+    "peak_rss_mb": True,
+    "rps": False,
+}
+# Absolute slack on error rate, which is often exactly zero in the baseline
+ERROR_RATE_SLACK = 0.01
+
+
+def compare(
+    results: Dict[str, dict], baseline: Dict[str, dict], tolerance: float
+) -> List[str]:
+    regressions = []
+    for name, expected in baseline.items():
+        actual = results.get(name)
+        if actual is None:
+            continue
+        for metric, higher_is_worse in CHECKED_METRICS.items():
+            before, after = expected.get(metric), actual.get(metric)
+            if not before or after is None:
+                continue
+            change = (after - before) / before
+            if (change if higher_is_worse else -change) > tolerance:
+                regressions.append(
+                    f"{name}: {metric} {after:.1f} vs baseline {before:.1f} "
+                    f"({change:+.0%})"
+                )
+        if actual["error_rate"] > expected["error_rate"] + ERROR_RATE_SLACK:
+            regressions.append(
+                f"{name}: error_rate {actual['error_rate']:.2%} vs baseline "
+                f"{expected['error_rate']:.2%}"
+            )
+    return regressions
+
+
+def print_report(results: Dict[str, dict]):
+    header = (
+        f"{'scenario':<12}{'reqs':>7}{'errors':>8}{'rps':>9}{'p50':>9}{'p95':>9}"
+        f"{'p99':>9}{'ttfb50':>9}{'rss':>8}{'peak':>8}"
+    )
+    print(header)
+    for name, r in results.items():
+        rss = f"{r['rss_mb']:8.1f}" if r["rss_mb"] is not None else f"{'-':>8}"
+        peak = (
+            f"{r['peak_rss_mb']:8.1f}" if r["peak_rss_mb"] is not None else f"{'-':>8}"
+        )
+        print(
+            f"{name:<12}{r['requests']:>7}{r['errors']:>8}{r['rps']:>9.1f}"
+            f"{r['p50_ms']:>9.1f}{r['p95_ms']:>9.1f}{r['p99_ms']:>9.1f}"
+            f"{r['ttfb_p50_ms']:>9.1f}{rss}{peak}"
+        )
+    print("latencies in ms, memory in MB")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument(
+        "--latency-distribution", choices=LATENCY_DISTRIBUTIONS, default="lognormal"
+    )
+    parser.add_argument("--tokens-per-second", type=float, default=500.0)
+    parser.add_argument("--answer-tokens", type=int, default=50)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument(
+        "--workers", type=int, default=1, help="API processes, via app.server"
+    )
+    parser.add_argument("--json", help="Also write the results to this file")
+    parser.add_argument("--save-baseline", metavar="PATH")
+    parser.add_argument("--check", metavar="PATH")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args()
+
+    config = {
+        "scenarios": args.scenarios.split(","),
+        "concurrency": args.concurrency,
+        "requests": args.requests,
+        "warmup": args.warmup,
+        "latency": args.latency,
+        "latency_distribution": args.latency_distribution,
+        "tokens_per_second": args.tokens_per_second,
+        "answer_tokens": args.answer_tokens,
+        "error_rate": args.error_rate,
+        "workers": args.workers,
+    }
+    unknown = set(config["scenarios"]) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    baseline = None
+    if args.check:
+        with open(args.check) as f:
+            baseline = json.load(f)
+        # Results are only comparable under the same load
+        config = baseline["config"]
+
+    results = run(config)
+    print_report(results)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"config": config, "results": results}, f, indent=2)
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump({"config": config, "results": results}, f, indent=2)
+            f.write("\n")
+        print(f"baseline saved to {args.save_baseline}")
+    if baseline is not None:
+        regressions = compare(results, baseline["results"], args.tolerance)
+        if regressions:
+            print(f"regressions beyond {args.tolerance:.0%} of the baseline:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print(f"no regressions beyond {args.tolerance:.0%} of the baseline")
+
+
+if __name__ == "__main__":
+    main()
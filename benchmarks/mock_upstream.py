@@ -0,0 +1,275 @@
+import argparse
+import asyncio
+import json
+import math
+import random
+import threading
+import time
+from contextlib import ExitStack
+from typing import Dict, Iterable, List, Optional
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from app.providers import Backend
+
+LATENCY_DISTRIBUTIONS = ("fixed", "uniform", "exponential", "lognormal")
+
+
+def sample_latency(
+    rng: random.Random, mean: float, distribution: str = "fixed", sigma: float = 0.5
+) -> float:
+    # Every distribution has the given mean; they differ in how long the
+    # tail is (lognormal's grows with sigma)
+    if mean <= 0 or distribution == "fixed":
+        return max(mean, 0.0)
+    if distribution == "uniform":
+        return rng.uniform(0, 2 * mean)
+    if distribution == "exponential":
+        return rng.expovariate(1 / mean)
+    if distribution == "lognormal":
+        return rng.lognormvariate(math.log(mean) - sigma**2 / 2, sigma)
+    raise ValueError(f"Unknown latency distribution: {distribution}")
+
+
+def create_mock_app(
+    latency: float = 0.0,
+    error_rate: float = 0.0,
+    error_status: int = 503,
+    retry_after: Optional[float] = None,
+    faults: Optional[Iterable[dict]] = None,
+    seed: Optional[int] = None,
+    latency_distribution: str = "fixed",
+    latency_sigma: float = 0.5,
+    tokens_per_second: float = 0.0,
+    answer_tokens: Optional[int] = None,
+) -> FastAPI:
+    # faults are consumed one per request, e.g. {"status": 429, "retry_after": 1}
+    # or {"latency": 2.0}; once they run out, error_rate injects random errors.
+    # `latency` is the mean time to the first token; with tokens_per_second
+    # set, each of the answer's tokens then takes 1 / tokens_per_second.
+    if latency_distribution not in LATENCY_DISTRIBUTIONS:
+        raise ValueError(f"Unknown latency distribution: {latency_distribution}")
+    mock_app = FastAPI()
+    mock_app.state.requests = 0
+    # W3C traceparent header of each request, None when it had none
+    mock_app.state.traceparents = []
+    pending = list(faults or [])
+    rng = random.Random(seed)
+    words = ["Mock", "answer"] if answer_tokens is None else ["mock"] * answer_tokens
+    token_time = 1 / tokens_per_second if tokens_per_second else 0.0
+    usage = {
+        "prompt_tokens": 10,
+        "completion_tokens": len(words),
+        "total_tokens": 10 + len(words),
+    }
+
+    def chunk(model: str, delta: dict, finish_reason: Optional[str] = None) -> str:
+        body = {
+            "id": "chatcmpl-mock",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }
+        return f"data: {json.dumps(body)}\n\n"
+
+    async def stream_answer(model: str):
+        yield chunk(model, {"role": "assistant", "content": ""})
+        for i, word in enumerate(words):
+            if i and token_time:
+                await asyncio.sleep(token_time)
+            yield chunk(model, {"content": word if i == 0 else f" {word}"})
+        yield chunk(model, {}, "stop")
+        yield "data: [DONE]\n\n"
+
+    async def respond(model: str, request: Request, stream: bool = False):
+        mock_app.state.requests += 1
+        mock_app.state.traceparents.append(request.headers.get("traceparent"))
+        fault = pending.pop(0) if pending else {}
+        if not fault and error_rate and rng.random() < error_rate:
+            fault = {"status": error_status, "retry_after": retry_after}
+
+        delay = fault.get("latency")
+        if delay is None:
+            delay = sample_latency(rng, latency, latency_distribution, latency_sigma)
+        if delay:
+            await asyncio.sleep(delay)
+
+        status = fault.get("status")
+        if status:
+            headers = {}
+            if fault.get("retry_after") is not None:
+                headers["Retry-After"] = str(fault["retry_after"])
+            return JSONResponse(
+                {"error": {"message": f"Injected {status}", "type": "mock_error"}},
+                status_code=status,
+                headers=headers,
+            )
+
+        if stream:
+            return StreamingResponse(
+                stream_answer(model), media_type="text/event-stream"
+            )
+
+        # The first token arrived after `delay`; the rest take token_time each
+        if token_time and len(words) > 1:
+            await asyncio.sleep(token_time * (len(words) - 1))
+
+        return {
+            "id": "chatcmpl-mock",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [
+                {
+                    "index": 0,
+                    "message": {"role": "assistant", "content": " ".join(words)},
+                    "finish_reason": "stop",
+                }
+            ],
+            "usage": usage,
+        }
+
+    @mock_app.get("/health")
+    async def health():
+        return {"status": "ok"}
+
+    @mock_app.post("/v1/chat/completions")
+    async def chat_completions(body: dict, request: Request):
+        model = body.get("model", "gpt-3.5-turbo")
+        return await respond(model, request, bool(body.get("stream")))
+
+    # Azure-style endpoint: the deployment in the path picks the model
+    @mock_app.post("/openai/deployments/{deployment}/chat/completions")
+    async def azure_chat_completions(deployment: str, body: dict, request: Request):
+        return await respond(deployment, request, bool(body.get("stream")))
+
+    return mock_app
+
+
+class MockUpstream:
+    # Runs an OpenAI-compatible server on a background thread; port=0 picks
+    # a free port
+    def __init__(self, host: str = "127.0.0.1", port: int = 8765, **app_kwargs):
+        self.host = host
+        self.port = port
+        self.app = create_mock_app(**app_kwargs)
+        config = uvicorn.Config(self.app, host=host, port=port, log_level="warning")
+        self.server = uvicorn.Server(config)
+        self._thread = threading.Thread(target=self.server.run, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}/v1"
+
+    @property
+    def requests(self) -> int:
+        return self.app.state.requests
+
+    @property
+    def traceparents(self) -> list:
+        return self.app.state.traceparents
+
+    def __enter__(self):
+        self._thread.start()
+        while not self.server.started:
+            time.sleep(0.01)
+        if self.port == 0:
+            self.port = self.server.servers[0].sockets[0].getsockname()[1]
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.should_exit = True
+        self._thread.join()
+
+
+class MockBackendSet:
+    # Several mock upstreams at once, one per backend. Each spec holds the
+    # backend's "kind" ("local" or "azure") and "model", plus any
+    # create_mock_app fault settings.
+    def __init__(self, specs: Dict[str, dict]):
+        self.specs = specs
+        self.upstreams: Dict[str, MockUpstream] = {}
+        self._stack = ExitStack()
+
+    def _base_url(self, name: str) -> str:
+        upstream = self.upstreams[name]
+        if self.specs[name].get("kind", "local") == "azure":
+            return f"http://{upstream.host}:{upstream.port}"
+        return upstream.base_url
+
+    def config(self) -> str:
+        # An LLM_BACKENDS value pointing at the running mocks
+        return json.dumps(
+            [
+                {
+                    "name": name,
+                    "kind": spec.get("kind", "local"),
+                    "model": spec["model"],
+                    "base_url": self._base_url(name),
+                    "api_key_env": "OPENAI_API_KEY",
+                }
+                for name, spec in self.specs.items()
+            ]
+        )
+
+    def backends(self) -> List[Backend]:
+        return [
+            Backend(
+                name=name,
+                model=spec["model"],
+                kind=spec.get("kind", "local"),
+                base_url=self._base_url(name),
+                api_key="not-needed",
+            )
+            for name, spec in self.specs.items()
+        ]
+
+    def __enter__(self):
+        for name, spec in self.specs.items():
+            app_kwargs = {
+                key: value
+                for key, value in spec.items()
+                if key not in ("kind", "model")
+            }
+            upstream = MockUpstream(port=0, **app_kwargs)
+            self.upstreams[name] = self._stack.enter_context(upstream)
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stack.close()
+
+
+def main():
+    # Standalone mock, e.g. for the load test or a locally run API:
+    #   python -m benchmarks.mock_upstream --latency 0.05 --latency-distribution lognormal
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument(
+        "--latency-distribution", choices=LATENCY_DISTRIBUTIONS, default="fixed"
+    )
+    parser.add_argument("--latency-sigma", type=float, default=0.5)
+    parser.add_argument("--tokens-per-second", type=float, default=0.0)
+    parser.add_argument("--answer-tokens", type=int, default=None)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    mock_app = create_mock_app(
+        latency=args.latency,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        seed=args.seed,
+        latency_distribution=args.latency_distribution,
+        latency_sigma=args.latency_sigma,
+        tokens_per_second=args.tokens_per_second,
+        answer_tokens=args.answer_tokens,
+    )
+    uvicorn.run(mock_app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,7 @@
+# Read by gunicorn from the working directory, so run from the repo root:
+#   gunicorn app.main:app
+# Worker count, bind address and the rest come from the app's settings
+from app.server import gunicorn_options, on_exit, on_starting  # noqa: F401
+from app.settings import get_settings
+
+globals().update(gunicorn_options(get_settings()))
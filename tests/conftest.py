@@ -0,0 +1,9 @@
+import pytest
+from app.files import FileStore
+
+
+@pytest.fixture
+def file_store(tmp_path):
+    store = FileStore(str(tmp_path))
+    yield store
+    store.close()
@@ -0,0 +1,202 @@
+import asyncio
+import json
+import shutil
+import tempfile
+from fastapi.testclient import TestClient
+from unittest.mock import AsyncMock, MagicMock
+from app.clients import get_openai_client, get_question_store, get_retriever
+from app.files import FileStore
+from app.main import app
+from app.openai_client import Completion
+from app.retrieval import DocumentRetriever
+from app.settings import override_settings
+from app.storage import MemoryQuestionStore
+
+client = TestClient(app)
+store = MemoryQuestionStore()
+
+
+def override_openai_client(side_effect):
+    mock_openai_client = MagicMock()
+    mock_openai_client.acomplete = AsyncMock(side_effect=side_effect)
+    app.dependency_overrides[get_openai_client] = lambda: mock_openai_client
+    return mock_openai_client
+
+
+async def echo(prompt, context=None):
+    return Completion(text=f"Answer to {prompt}", model="gpt-3.5-turbo")
+
+
+class TestBatchController:
+    def setup_method(self):
+        store.clear()
+        self.upload_dir = tempfile.mkdtemp()
+        self.file_store = FileStore(self.upload_dir)
+        retriever = DocumentRetriever(self.file_store)
+        app.dependency_overrides[get_question_store] = lambda: store
+        app.dependency_overrides[get_retriever] = lambda: retriever
+
+    def teardown_method(self):
+        app.dependency_overrides.clear()
+        self.file_store.close()
+        shutil.rmtree(self.upload_dir)
+
+    def test_batch_returns_results_in_order(self):
+        async def out_of_order(prompt, context=None):
+            # Earlier questions finish last
+            await asyncio.sleep(0.01 * (3 - int(prompt[-2])))
+            return await echo(prompt, context)
+
+        override_openai_client(out_of_order)
+
+        response = client.post(
+            "/api/v1/ask/batch",
+            json=[{"question": f"Question {i}?"} for i in range(3)],
+        )
+
+        assert response.status_code == 200
+        data = response.json()
+        assert [item["index"] for item in data] == [0, 1, 2]
+        assert [item["answer"] for item in data] == [
+            f"Answer to Question {i}?" for i in range(3)
+        ]
+        assert all(item["error"] is None for item in data)
+        assert store.count() == 3
+
+    def test_batch_accepts_ndjson(self):
+        mock_openai_client = override_openai_client(echo)
+        body = "\n".join(
+            [
+                json.dumps({"question": "What is FastAPI?", "context": "Python"}),
+                "",
+                json.dumps({"question": "What is Django?"}),
+            ]
+        )
+
+        response = client.post(
+            "/api/v1/ask/batch",
+            content=body,
+            headers={"Content-Type": "application/x-ndjson"},
+        )
+
+        assert response.status_code == 200
+        assert [item["answer"] for item in response.json()] == [
+            "Answer to What is FastAPI?",
+            "Answer to What is Django?",
+        ]
+        mock_openai_client.acomplete.assert_any_await(
+            prompt="What is FastAPI?", context="Python"
+        )
+
+    def test_batch_dedupes_identical_items(self):
+        mock_openai_client = override_openai_client(echo)
+
+        response = client.post(
+            "/api/v1/ask/batch",
+            json=[
+                {"question": "Same?", "context": "A"},
+                {"question": "Same?", "context": "A"},
+                {"question": "Same?", "context": "B"},
+                {"question": "Same?", "context": "A"},
+            ],
+        )
+
+        assert response.status_code == 200
+        assert len(response.json()) == 4
+        assert mock_openai_client.acomplete.await_count == 2
+
+    def test_batch_respects_concurrency_limit(self):
+        in_flight = 0
+        peak = 0
+
+        async def tracked(prompt, context=None):
+            nonlocal in_flight, peak
+            in_flight += 1
+            peak = max(peak, in_flight)
+            await asyncio.sleep(0.01)
+            in_flight -= 1
+            return await echo(prompt, context)
+
+        override_openai_client(tracked)
+
+        with override_settings(batch_concurrency=3):
+            response = client.post(
+                "/api/v1/ask/batch",
+                json=[{"question": f"Question {i}?"} for i in range(12)],
+            )
+
+        assert response.status_code == 200
+        assert peak == 3
+
+    def test_batch_reports_per_item_errors(self):
+        async def flaky(prompt, context=None):
+            if prompt == "Bad?":
+                raise Exception("OpenAI API error: boom")
+            return await echo(prompt, context)
+
+        override_openai_client(flaky)
+
+        response = client.post(
+            "/api/v1/ask/batch",
+            json=[{"question": "Good?"}, {"question": "Bad?"}, {"question": " "}],
+        )
+
+        assert response.status_code == 200
+        good, bad, empty = response.json()
+        assert good["answer"] == "Answer to Good?"
+        assert bad["answer"] is None
+        assert "Failed to generate AI response: OpenAI API error: boom" in bad["error"]
+        assert empty["error"] == "Question cannot be empty"
+        assert store.count() == 1
+
+    def test_batch_streams_ndjson_as_items_complete(self):
+        async def slow_first(prompt, context=None):
+            if prompt == "Slow?":
+                await asyncio.sleep(0.05)
+            return await echo(prompt, context)
+
+        override_openai_client(slow_first)
+
+        response = client.post(
+            "/api/v1/ask/batch?stream=true",
+            json=[{"question": "Slow?"}, {"question": "Fast?"}],
+        )
+
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        assert [line["index"] for line in lines] == [1, 0]
+
+    def test_batch_rejects_empty_and_oversized(self):
+        override_openai_client(echo)
+
+        assert client.post("/api/v1/ask/batch", json=[]).status_code == 400
+
+        with override_settings(batch_max_items=2):
+            response = client.post("/api/v1/ask/batch", json=[{"question": "Q?"}] * 3)
+        assert response.status_code == 400
+        assert "limit" in response.json()["detail"]
+
+    def test_batch_rejects_invalid_items(self):
+        override_openai_client(echo)
+
+        response = client.post("/api/v1/ask/batch", json=[{"context": "missing"}])
+
+        assert response.status_code == 422
+
+    def test_batch_reports_unknown_file_per_item(self):
+        override_openai_client(echo)
+
+        response = client.post(
+            "/api/v1/ask/batch",
+            json=[
+                {"question": "Question 0?"},
+                {"question": "Question 1?", "file_id": "missing"},
+            ],
+        )
+
+        assert response.status_code == 200
+        data = response.json()
+        assert data[0]["answer"] == "Answer to Question 0?"
+        assert data[1]["error"] == "File not found"
+        assert store.count() == 1
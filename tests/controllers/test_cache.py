@@ -0,0 +1,39 @@
+from fastapi.testclient import TestClient
+from unittest.mock import MagicMock
+from app.cache import LRUCache, ResponseCache
+from app.clients import get_openai_client
+from app.main import app
+
+client = TestClient(app)
+
+
+class TestCacheController:
+    def teardown_method(self):
+        app.dependency_overrides.clear()
+
+    def test_cache_stats_when_disabled(self):
+        mock_openai_client = MagicMock(cache=None, semantic_cache=None)
+        app.dependency_overrides[get_openai_client] = lambda: mock_openai_client
+
+        response = client.get("/api/v1/cache/stats")
+
+        assert response.status_code == 200
+        assert response.json() == {"enabled": False}
+
+    def test_cache_stats_reports_counters(self):
+        cache = ResponseCache(LRUCache(max_entries=1), ttl=60)
+        cache.stats.hits = 3
+        cache.stats.misses = 1
+        mock_openai_client = MagicMock(cache=cache, semantic_cache=None)
+        app.dependency_overrides[get_openai_client] = lambda: mock_openai_client
+
+        response = client.get("/api/v1/cache/stats")
+
+        assert response.status_code == 200
+        assert response.json() == {
+            "enabled": True,
+            "hits": 3,
+            "misses": 1,
+            "evictions": 0,
+            "hit_ratio": 0.75,
+        }
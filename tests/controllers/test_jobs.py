@@ -0,0 +1,137 @@
+import asyncio
+import shutil
+import tempfile
+import time
+from fastapi.testclient import TestClient
+from unittest.mock import AsyncMock, MagicMock
+from app.clients import get_job_queue
+from app.controllers.jobs import job_handler
+from app.files import FileStore
+from app.jobs import JobQueue, JobStore
+from app.main import app
+from app.openai_client import Completion
+from app.retrieval import DocumentRetriever
+from app.storage import MemoryQuestionStore
+
+
+def wait_for_job(client, job_id, status="done"):
+    for _ in range(500):
+        job = client.get(f"/api/v1/jobs/{job_id}").json()
+        if job["status"] == status:
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"job {job_id} is {job['status']}, not {status}")
+
+
+class TestJobsController:
+    def setup_method(self):
+        self.store = MemoryQuestionStore()
+        self.upload_dir = tempfile.mkdtemp()
+        self.file_store = FileStore(self.upload_dir)
+        retriever = DocumentRetriever(self.file_store)
+        self.openai_client = MagicMock()
+        self.openai_client.acomplete = AsyncMock(
+            return_value=Completion(text="FastAPI is a framework", model="gpt-4o")
+        )
+        self.queue = None
+
+        def job_queue():
+            # Built on the app's loop, on first use
+            if self.queue is None:
+                handler = job_handler(
+                    lambda: self.openai_client, lambda: self.store, lambda: retriever
+                )
+                self.queue = JobQueue(
+                    JobStore(), handler, workers=2, queue_size=2, webhook_url=""
+                )
+            return self.queue
+
+        app.dependency_overrides[get_job_queue] = job_queue
+
+    def teardown_method(self):
+        app.dependency_overrides.clear()
+        self.file_store.close()
+        shutil.rmtree(self.upload_dir)
+
+    def close_queue(self, client):
+        if self.queue is not None:
+            client.portal.call(self.queue.aclose)
+
+    def test_submit_then_poll(self):
+        with TestClient(app) as client:
+            response = client.post(
+                "/api/v1/jobs",
+                json={"question": "What is FastAPI?", "context": "Python"},
+                headers={"X-Client-Id": "client-a"},
+            )
+
+            assert response.status_code == 202
+            job = response.json()
+            assert response.headers["Location"] == f"/api/v1/jobs/{job['id']}"
+            assert job["status"] == "queued"
+            assert job["request"]["question"] == "What is FastAPI?"
+
+            done = wait_for_job(client, job["id"])
+            self.close_queue(client)
+
+        assert done["result"]["answer"] == "FastAPI is a framework"
+        assert done["result"]["model"] == "gpt-4o"
+        assert done["error"] is None
+        assert done["finished_at"] >= done["started_at"] >= done["created_at"]
+        # Answered exactly like POST /ask, history included
+        self.openai_client.acomplete.assert_awaited_once_with(
+            prompt="What is FastAPI?", context="Python"
+        )
+        assert self.store.count() == 1
+
+    def test_errors_become_the_job_error(self):
+        with TestClient(app) as client:
+            job = client.post(
+                "/api/v1/jobs", json={"question": "Summarize", "file_id": "missing"}
+            ).json()
+
+            failed = wait_for_job(client, job["id"], "failed")
+            self.close_queue(client)
+
+        assert failed["error"] == "File not found"
+        assert failed["result"] is None
+
+    def test_full_queue_is_503(self):
+        gate = asyncio.Event()
+
+        async def blocked(**kwargs):
+            await gate.wait()
+
+        self.openai_client.acomplete = AsyncMock(side_effect=blocked)
+        with TestClient(app) as client:
+            # Both workers busy, then two queued jobs fill the queue
+            for i in range(2):
+                client.post("/api/v1/jobs", json={"question": f"Running {i}"})
+            for _ in range(100):
+                if self.queue.store.count("running") == 2:
+                    break
+                time.sleep(0.01)
+            queued = [
+                client.post("/api/v1/jobs", json={"question": f"Queued {i}"})
+                for i in range(2)
+            ]
+            full = client.post("/api/v1/jobs", json={"question": "One more"})
+            client.portal.call(gate.set)
+            self.close_queue(client)
+
+        assert [response.status_code for response in queued] == [202, 202]
+        assert full.status_code == 503
+        assert full.headers["Retry-After"] == "5"
+
+    def test_validation(self):
+        with TestClient(app) as client:
+            empty = client.post("/api/v1/jobs", json={"question": "  "})
+            priority = client.post(
+                "/api/v1/jobs", json={"question": "Q", "priority": 10}
+            )
+            missing = client.get("/api/v1/jobs/unknown")
+            self.close_queue(client)
+
+        assert empty.status_code == 400
+        assert priority.status_code == 422
+        assert missing.status_code == 404
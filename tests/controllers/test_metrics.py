@@ -0,0 +1,51 @@
+from fastapi.testclient import TestClient
+from unittest.mock import MagicMock
+from app.cache import LRUCache, ResponseCache
+from app.clients import get_openai_client
+from app.limiter import UpstreamLimiter
+from app.main import app
+from app.resilience import ResiliencePolicy
+
+client = TestClient(app)
+
+
+class TestMetricsController:
+    def setup_method(self):
+        cache = ResponseCache(LRUCache(max_entries=1), ttl=60)
+        cache.stats.hits = 3
+        cache.stats.misses = 1
+        self.openai_client = MagicMock(
+            cache=cache,
+            semantic_cache=None,
+            limiter=UpstreamLimiter(),
+            resilience=ResiliencePolicy(),
+        )
+        app.dependency_overrides[get_openai_client] = lambda: self.openai_client
+
+    def teardown_method(self):
+        app.dependency_overrides.clear()
+
+    def test_metrics_exposition(self):
+        client.get("/health")
+
+        response = client.get("/metrics")
+
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+        body = response.text
+        assert 'http_requests_total{method="GET",route="/health",status="200"}' in body
+        assert "# TYPE http_request_duration_seconds histogram" in body
+        assert "# TYPE llm_request_duration_seconds histogram" in body
+        assert "# TYPE llm_time_to_first_token_seconds histogram" in body
+        assert "# TYPE pdf_upload_bytes histogram" in body
+        assert 'cache_lookups_total{cache="exact",result="hit"} 3' in body
+        assert 'cache_hit_ratio{cache="exact"} 0.75' in body
+        assert "upstream_circuit_open 0" in body
+
+    def test_metrics_without_caches(self):
+        self.openai_client.cache = None
+
+        body = client.get("/metrics").text
+
+        assert "# TYPE cache_hit_ratio gauge" in body
+        assert "cache_hit_ratio{" not in body
@@ -1,72 +1,276 @@
+import asyncio
+import hashlib
+import json
+import shutil
+import tempfile
+import time
 import pytest
 from fastapi.testclient import TestClient
-from unittest.mock import patch, MagicMock
+from unittest.mock import AsyncMock, MagicMock, patch
+from app import tracing
+from app.clients import get_question_store, get_retriever, registry
+from app.files import FileStore
 from app.main import app
+from app.openai_client import Completion
+from app.retrieval import DocumentRetriever, chunk_pages
+from app.storage import MemoryQuestionStore
+from app.resilience import CircuitOpen, UpstreamError, UpstreamTimeout
+from app.tokens import PromptTooLarge, TokenUsage
+from app.tracing import InMemoryExporter, Tracer
 from app.controllers.questions import (
     ask_question,
+    get_openai_client,
     QuestionRequest,
     QuestionResponse,
-    questions_db,
 )
 
 client = TestClient(app)
+store = MemoryQuestionStore()
+
+
+def stored_rows():
+    return [
+        {key: row[key] for key in ("question", "answer", "context")}
+        for row in store.list_questions()
+    ]
+
+
+def make_mock_client(answer=None, side_effect=None, cached=False):
+    mock_openai_client = MagicMock()
+    mock_openai_client.acomplete = AsyncMock(
+        return_value=Completion(text=answer, model="gpt-3.5-turbo", cached=cached),
+        side_effect=side_effect,
+    )
+    return mock_openai_client
+
+
+def override_streaming_client(deltas, error=None, fail_at=None):
+    async def astream(prompt, context=None):
+        for i, delta in enumerate(deltas):
+            if i == fail_at:
+                raise error
+            yield delta
+        if error is not None and fail_at is None:
+            raise error
+
+    mock_openai_client = MagicMock(model="gpt-3.5-turbo")
+    mock_openai_client.astream = MagicMock(side_effect=astream)
+    app.dependency_overrides[get_openai_client] = lambda: mock_openai_client
+    return mock_openai_client
+
+
+def parse_sse(body):
+    events = []
+    for block in body.strip().split("\n\n"):
+        event = "message"
+        for line in block.splitlines():
+            if line.startswith("event: "):
+                event = line[len("event: ") :]
+            elif line.startswith("data: "):
+                events.append((event, json.loads(line[len("data: ") :])))
+    return events
+
+
+def override_openai_client(answer=None, side_effect=None, cached=False):
+    mock_openai_client = make_mock_client(answer, side_effect, cached)
+    app.dependency_overrides[get_openai_client] = lambda: mock_openai_client
+    return mock_openai_client
 
 
 class TestQuestionsController:
     def setup_method(self):
-        questions_db.clear()
+        store.clear()
+        self.upload_dir = tempfile.mkdtemp()
+        self.file_store = FileStore(self.upload_dir)
+        self.retriever = DocumentRetriever(self.file_store)
+        app.dependency_overrides[get_question_store] = lambda: store
+        app.dependency_overrides[get_retriever] = lambda: self.retriever
+
+    def teardown_method(self):
+        app.dependency_overrides.clear()
+        self.file_store.close()
+        shutil.rmtree(self.upload_dir)
+
+    def store_pdf(self, pages, file_id="doc-1"):
+        content = "\n".join(pages).encode()
+        digest = hashlib.sha256(content).hexdigest()
+        path = self.file_store.temp_path()
+        with open(path, "wb") as f:
+            f.write(content)
+        self.file_store.add(file_id, "manual.pdf", digest, len(content), path)
+        if pages:
+            self.file_store.save_text(digest, pages, chunk_pages(pages))
+        return file_id
+
+    def test_ask_question_is_traced(self, monkeypatch):
+        exporter = InMemoryExporter()
+        monkeypatch.setattr(tracing, "TRACER", Tracer(exporter))
+        override_openai_client("FastAPI is a web framework.")
+        trace_id = "4bf92f3577b34da6a3ce929d0e0e4736"
+
+        response = client.post(
+            "/api/v1/ask",
+            json={"question": "What is FastAPI?"},
+            headers={"traceparent": f"00-{trace_id}-00f067aa0ba902b7-01"},
+        )
+
+        assert response.status_code == 200
+        spans = {span.name: span for span in exporter.spans()}
+        server = spans["POST /api/v1/ask"]
+        assert server.kind == "server"
+        assert server.parent_id == "00f067aa0ba902b7"
+        assert server.attributes["http.response.status_code"] == 200
+        ask = spans["ask_question"]
+        assert ask.parent_id == server.context.span_id
+        assert ask.attributes["llm.cached"] is False
+        for name in ("resolve_context", "questions.store"):
+            assert spans[name].parent_id == ask.context.span_id
+        assert {span.context.trace_id for span in spans.values()} == {trace_id}
+
+    def test_failed_ask_marks_the_server_span(self, monkeypatch):
+        exporter = InMemoryExporter()
+        monkeypatch.setattr(tracing, "TRACER", Tracer(exporter))
+        override_openai_client(side_effect=Exception("API Error"))
+
+        response = client.post("/api/v1/ask", json={"question": "What is FastAPI?"})
+
+        assert response.status_code == 500
+        spans = {span.name: span for span in exporter.spans()}
+        assert spans["POST /api/v1/ask"].status == "error"
+        assert spans["ask_question"].events[0]["name"] == "exception"
 
     def test_ask_question_success_with_context(self):
-        with patch("app.controllers.questions.OpenAIClient") as mock_openai_class:
-            mock_openai_client = MagicMock()
-            mock_openai_client.generate_response.return_value = (
-                "FastAPI is a modern Python web framework for building APIs."
-            )
-            mock_openai_class.return_value = mock_openai_client
+        mock_openai_client = override_openai_client(
+            "FastAPI is a modern Python web framework for building APIs."
+        )
 
-            question_data = {
-                "question": "What is FastAPI?",
-                "context": "Python web framework",
-            }
-            response = client.post("/api/v1/ask", json=question_data)
-
-            assert response.status_code == 200
-            response_data = response.json()
-            assert response_data["question"] == "What is FastAPI?"
-            assert (
-                response_data["answer"]
-                == "FastAPI is a modern Python web framework for building APIs."
-            )
-            assert response_data["model"] == "gpt-3.5-turbo"
+        question_data = {
+            "question": "What is FastAPI?",
+            "context": "Python web framework",
+        }
+        response = client.post("/api/v1/ask", json=question_data)
 
-            mock_openai_class.assert_called_once()
-            mock_openai_client.generate_response.assert_called_once_with(
-                prompt="What is FastAPI?", context="Python web framework"
-            )
+        assert response.status_code == 200
+        response_data = response.json()
+        assert response_data["question"] == "What is FastAPI?"
+        assert (
+            response_data["answer"]
+            == "FastAPI is a modern Python web framework for building APIs."
+        )
+        assert response_data["model"] == "gpt-3.5-turbo"
+        assert response_data["cached"] is False
+
+        mock_openai_client.acomplete.assert_awaited_once_with(
+            prompt="What is FastAPI?", context="Python web framework"
+        )
+
+    def test_ask_question_with_file_id_sends_relevant_excerpts(self):
+        mock_openai_client = override_openai_client("Use path operations.")
+        pages = [f"Filler page {i} about unrelated things." for i in range(50)]
+        pages[17] = "Routing in FastAPI uses path operation decorators."
+        file_id = self.store_pdf(pages)
+
+        response = client.post(
+            "/api/v1/ask",
+            json={"question": "How does routing work?", "file_id": file_id},
+        )
+
+        assert response.status_code == 200
+        context = mock_openai_client.acomplete.await_args.kwargs["context"]
+        assert context == (
+            "Excerpts from manual.pdf:\n\n"
+            "[page 18] Routing in FastAPI uses path operation decorators."
+        )
+        assert stored_rows()[0]["context"] is None
+
+    def test_ask_question_with_file_id_keeps_explicit_context(self):
+        mock_openai_client = override_openai_client("Answer")
+        file_id = self.store_pdf(["FastAPI routing guide"])
+
+        client.post(
+            "/api/v1/ask",
+            json={"question": "routing?", "context": "Be brief", "file_id": file_id},
+        )
+
+        context = mock_openai_client.acomplete.await_args.kwargs["context"]
+        assert context.startswith("Be brief\n\nExcerpts from manual.pdf:")
+
+    def test_ask_question_with_unknown_or_unextracted_file(self):
+        mock_openai_client = override_openai_client("unused")
+        pending = self.store_pdf([], file_id="pending")
+
+        missing = client.post(
+            "/api/v1/ask", json={"question": "What?", "file_id": "nope"}
+        )
+        not_ready = client.post(
+            "/api/v1/ask", json={"question": "What?", "file_id": pending}
+        )
+
+        assert missing.status_code == 404
+        assert not_ready.status_code == 409
+        mock_openai_client.acomplete.assert_not_awaited()
+
+    def test_ask_question_reports_token_usage(self):
+        mock_openai_client = override_openai_client("Answer")
+        mock_openai_client.acomplete.return_value.usage = TokenUsage(42, 7)
+
+        response = client.post("/api/v1/ask", json={"question": "What?"})
+
+        assert response.json()["usage"] == {
+            "prompt_tokens": 42,
+            "completion_tokens": 7,
+            "total_tokens": 49,
+        }
+
+    def test_ask_question_over_token_budget_returns_413(self):
+        override_openai_client(side_effect=PromptTooLarge("Question is too long"))
+
+        response = client.post("/api/v1/ask", json={"question": "What?"})
+
+        assert response.status_code == 413
+        assert response.json()["detail"] == "Question is too long"
+        assert store.count() == 0
+
+    def test_ask_question_reports_the_model_that_answered(self):
+        mock_openai_client = MagicMock()
+        mock_openai_client.acomplete = AsyncMock(
+            return_value=Completion(text="Answer", model="llama3")
+        )
+        app.dependency_overrides[get_openai_client] = lambda: mock_openai_client
+
+        response = client.post("/api/v1/ask", json={"question": "What is FastAPI?"})
+
+        assert response.status_code == 200
+        assert response.json()["model"] == "llama3"
+
+    def test_ask_question_reports_cache_hit(self):
+        override_openai_client("Cached answer", cached=True)
+
+        response = client.post("/api/v1/ask", json={"question": "What is FastAPI?"})
+
+        assert response.status_code == 200
+        assert response.json()["cached"] is True
+        assert store.count() == 1
 
     def test_ask_question_success_without_context(self):
-        with patch("app.controllers.questions.OpenAIClient") as mock_openai_class:
-            mock_openai_client = MagicMock()
-            mock_openai_client.generate_response.return_value = (
-                "Machine learning is a subset of artificial intelligence."
-            )
-            mock_openai_class.return_value = mock_openai_client
+        mock_openai_client = override_openai_client(
+            "Machine learning is a subset of artificial intelligence."
+        )
 
-            question_data = {"question": "What is machine learning?"}
-            response = client.post("/api/v1/ask", json=question_data)
+        question_data = {"question": "What is machine learning?"}
+        response = client.post("/api/v1/ask", json=question_data)
 
-            assert response.status_code == 200
-            response_data = response.json()
-            assert response_data["question"] == "What is machine learning?"
-            assert (
-                response_data["answer"]
-                == "Machine learning is a subset of artificial intelligence."
-            )
+        assert response.status_code == 200
+        response_data = response.json()
+        assert response_data["question"] == "What is machine learning?"
+        assert (
+            response_data["answer"]
+            == "Machine learning is a subset of artificial intelligence."
+        )
 
-            mock_openai_class.assert_called_once()
-            mock_openai_client.generate_response.assert_called_once_with(
-                prompt="What is machine learning?", context=None
-            )
+        mock_openai_client.acomplete.assert_awaited_once_with(
+            prompt="What is machine learning?", context=None
+        )
 
     def test_ask_empty_question(self):
         question_data = {"question": "", "context": "Empty question"}
@@ -83,66 +287,76 @@ class TestQuestionsController:
         assert "Question cannot be empty" in response.json()["detail"]
 
     def test_ask_question_openai_error(self):
-        with patch("app.controllers.questions.OpenAIClient") as mock_openai_class:
-            mock_openai_client = MagicMock()
-            mock_openai_client.generate_response.side_effect = Exception(
-                "API rate limit exceeded"
-            )
-            mock_openai_class.return_value = mock_openai_client
+        mock_openai_client = override_openai_client(
+            side_effect=Exception("API rate limit exceeded")
+        )
 
-            question_data = {"question": "What is AI?", "context": "Technology"}
-            response = client.post("/api/v1/ask", json=question_data)
+        question_data = {"question": "What is AI?", "context": "Technology"}
+        response = client.post("/api/v1/ask", json=question_data)
 
-            assert response.status_code == 500
-            assert (
-                "Failed to generate AI response: API rate limit exceeded"
-                in response.json()["detail"]
-            )
+        assert response.status_code == 500
+        assert (
+            "Failed to generate AI response: API rate limit exceeded"
+            in response.json()["detail"]
+        )
+
+        mock_openai_client.acomplete.assert_awaited_once()
+
+    def test_ask_question_upstream_timeout_returns_504(self):
+        override_openai_client(side_effect=UpstreamTimeout("OpenAI API error: slow"))
+
+        response = client.post("/api/v1/ask", json={"question": "What is AI?"})
+
+        assert response.status_code == 504
+        assert "Retry-After" not in response.headers
+        assert store.count() == 0
+
+    def test_ask_question_upstream_rate_limit_returns_429(self):
+        override_openai_client(
+            side_effect=UpstreamError("OpenAI API error: 429", 429, retry_after=2.4)
+        )
+
+        response = client.post("/api/v1/ask", json={"question": "What is AI?"})
 
-            mock_openai_class.assert_called_once()
+        assert response.status_code == 429
+        assert response.headers["Retry-After"] == "2"
+
+    def test_ask_question_open_circuit_returns_503(self):
+        override_openai_client(side_effect=CircuitOpen(retry_after=12.0))
+
+        response = client.post("/api/v1/ask", json={"question": "What is AI?"})
+
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "12"
+        assert "failing fast" in response.json()["detail"]
 
     def test_ask_question_stores_in_database(self):
-        with patch("app.controllers.questions.OpenAIClient") as mock_openai_class:
-            mock_openai_client = MagicMock()
-            mock_openai_client.generate_response.return_value = "Test answer"
-            mock_openai_class.return_value = mock_openai_client
+        mock_openai_client = override_openai_client("Test answer")
 
-            question_data = {"question": "Test question?", "context": "Test context"}
-            response = client.post("/api/v1/ask", json=question_data)
+        question_data = {"question": "Test question?", "context": "Test context"}
+        response = client.post("/api/v1/ask", json=question_data)
 
-            assert response.status_code == 200
-            assert len(questions_db) == 1
+        assert response.status_code == 200
+        assert store.count() == 1
 
-            stored_question = questions_db[0]
-            assert stored_question["question"] == "Test question?"
-            assert stored_question["answer"] == "Test answer"
-            assert stored_question["context"] == "Test context"
+        stored_question = store.list_questions()[0]
+        assert stored_question["question"] == "Test question?"
+        assert stored_question["answer"] == "Test answer"
+        assert stored_question["context"] == "Test context"
 
-            mock_openai_class.assert_called_once()
+        mock_openai_client.acomplete.assert_awaited_once()
 
     def test_get_questions_empty(self):
-        questions_db.clear()
+        store.clear()
         response = client.get("/api/v1/questions")
 
         assert response.status_code == 200
         assert response.json() == []
 
     def test_get_questions_with_data(self):
-        questions_db.clear()
-        questions_db.extend(
-            [
-                {
-                    "question": "What is Python?",
-                    "answer": "Python is a programming language.",
-                    "context": "Programming",
-                },
-                {
-                    "question": "What is FastAPI?",
-                    "answer": "FastAPI is a web framework.",
-                    "context": "Web development",
-                },
-            ]
-        )
+        store.clear()
+        store.add("What is Python?", "Python is a programming language.", "Programming")
+        store.add("What is FastAPI?", "FastAPI is a web framework.", "Web development")
 
         response = client.get("/api/v1/questions")
 
@@ -152,54 +366,324 @@ class TestQuestionsController:
         assert data[0]["question"] == "What is Python?"
         assert data[1]["question"] == "What is FastAPI?"
 
+    def test_get_questions_paginates_with_cursor(self):
+        for i in range(5):
+            store.add(f"Question {i}?", f"Answer {i}")
+
+        first = client.get("/api/v1/questions", params={"limit": 2})
+        cursor = first.headers["X-Next-Cursor"]
+        second = client.get("/api/v1/questions", params={"limit": 2, "after": cursor})
+        last = client.get(
+            "/api/v1/questions",
+            params={"limit": 2, "after": second.headers["X-Next-Cursor"]},
+        )
+
+        assert [row["question"] for row in first.json()] == [
+            "Question 0?",
+            "Question 1?",
+        ]
+        assert [row["question"] for row in second.json()] == [
+            "Question 2?",
+            "Question 3?",
+        ]
+        assert [row["question"] for row in last.json()] == ["Question 4?"]
+        assert "X-Next-Cursor" not in last.headers
+
+    def test_get_questions_limit_is_bounded(self):
+        assert client.get("/api/v1/questions", params={"limit": 0}).status_code == 422
+        assert (
+            client.get("/api/v1/questions", params={"limit": 1001}).status_code == 422
+        )
+
+    def test_get_questions_filters_by_time_and_context(self):
+        with patch("app.storage.time.time", side_effect=[1000.0, 2000.0, 3000.0]):
+            store.add("Old?", "Answer", "Programming")
+            store.add("Middle?", "Answer", "Cooking")
+            store.add("New?", "Answer", "Programming")
+
+        response = client.get(
+            "/api/v1/questions",
+            params={"since": "1970-01-01T00:25:00Z", "context": "Programming"},
+        )
+        assert [row["question"] for row in response.json()] == ["New?"]
+
+        response = client.get("/api/v1/questions", params={"until": 2000})
+        assert [row["question"] for row in response.json()] == ["Old?"]
+
+    def test_get_questions_field_projection(self):
+        store.add("What is Python?", "A language.", "Programming")
+
+        response = client.get(
+            "/api/v1/questions", params={"fields": "question, answer"}
+        )
+
+        assert response.status_code == 200
+        assert response.json() == [
+            {"question": "What is Python?", "answer": "A language."}
+        ]
+
+    def test_get_questions_rejects_unknown_fields(self):
+        response = client.get("/api/v1/questions", params={"fields": "question,secret"})
+
+        assert response.status_code == 400
+        assert "Unknown fields: secret" in response.json()["detail"]
+
+    def test_get_questions_etag_not_modified(self):
+        store.add("What is Python?", "A language.")
+
+        first = client.get("/api/v1/questions")
+        etag = first.headers["ETag"]
+
+        unchanged = client.get("/api/v1/questions", headers={"If-None-Match": etag})
+        assert unchanged.status_code == 304
+        assert unchanged.content == b""
+        assert unchanged.headers["ETag"] == etag
+
+        weak = client.get(
+            "/api/v1/questions", headers={"If-None-Match": f'"other", W/{etag}'}
+        )
+        assert weak.status_code == 304
+
+        store.add("What is FastAPI?", "A framework.")
+        changed = client.get("/api/v1/questions", headers={"If-None-Match": etag})
+        assert changed.status_code == 200
+        assert changed.headers["ETag"] != etag
+        assert len(changed.json()) == 2
+
     @pytest.mark.asyncio
     async def test_ask_question_function_direct(self):
-        with patch("app.controllers.questions.OpenAIClient") as mock_openai_class:
-            mock_openai_client = MagicMock()
-            mock_openai_client.generate_response.return_value = "Direct test response"
-            mock_openai_class.return_value = mock_openai_client
+        mock_openai_client = make_mock_client("Direct test response")
 
-            questions_db.clear()
+        store.clear()
 
-            test_question = "What is testing?"
-            test_context = "Software development"
-            request = QuestionRequest(question=test_question, context=test_context)
+        test_question = "What is testing?"
+        test_context = "Software development"
+        request = QuestionRequest(question=test_question, context=test_context)
 
-            result = await ask_question(request)
+        result = await ask_question(
+            request, openai_client=mock_openai_client, store=store
+        )
 
-            mock_openai_class.assert_called_once()
-            mock_openai_client.generate_response.assert_called_once_with(
-                prompt=test_question, context=test_context
-            )
+        mock_openai_client.acomplete.assert_awaited_once_with(
+            prompt=test_question, context=test_context
+        )
 
-            assert isinstance(result, QuestionResponse)
-            assert result.question == test_question
-            assert result.answer == "Direct test response"
-            assert result.model == "gpt-3.5-turbo"
+        assert isinstance(result, QuestionResponse)
+        assert result.question == test_question
+        assert result.answer == "Direct test response"
+        assert result.model == "gpt-3.5-turbo"
+
+        assert store.count() == 1
+        stored = store.list_questions()[0]
+        assert stored["question"] == test_question
+        assert stored["answer"] == "Direct test response"
+        assert stored["context"] == test_context
+
+    @pytest.mark.asyncio
+    async def test_concurrent_questions_overlap_upstream_latency(self):
+        async def slow_response(prompt, context=None):
+            await asyncio.sleep(0.2)
+            return Completion(text=f"Answer to {prompt}", model="gpt-3.5-turbo")
+
+        mock_openai_client = make_mock_client(side_effect=slow_response)
+
+        start = time.perf_counter()
+        results = await asyncio.gather(
+            *[
+                ask_question(
+                    QuestionRequest(question=f"Question {i}?"),
+                    openai_client=mock_openai_client,
+                    store=store,
+                )
+                for i in range(5)
+            ]
+        )
+        elapsed = time.perf_counter() - start
 
-            assert len(questions_db) == 1
-            stored = questions_db[0]
-            assert stored["question"] == test_question
-            assert stored["answer"] == "Direct test response"
-            assert stored["context"] == test_context
+        assert [r.answer for r in results] == [
+            f"Answer to Question {i}?" for i in range(5)
+        ]
+        assert elapsed < 0.6
 
     def test_multiple_questions_accumulation(self):
-        with patch("app.controllers.questions.OpenAIClient") as mock_openai_class:
-            mock_openai_client = MagicMock()
-            mock_openai_client.generate_response.return_value = "Test answer"
-            mock_openai_class.return_value = mock_openai_client
+        mock_openai_client = override_openai_client("Test answer")
 
-            questions_db.clear()
+        store.clear()
 
-            response1 = client.post("/api/v1/ask", json={"question": "Question 1?"})
-            assert response1.status_code == 200
-            assert len(questions_db) == 1
+        response1 = client.post("/api/v1/ask", json={"question": "Question 1?"})
+        assert response1.status_code == 200
+        assert store.count() == 1
 
-            response2 = client.post("/api/v1/ask", json={"question": "Question 2?"})
-            assert response2.status_code == 200
-            assert len(questions_db) == 2
+        response2 = client.post("/api/v1/ask", json={"question": "Question 2?"})
+        assert response2.status_code == 200
+        assert store.count() == 2
 
-            assert questions_db[0]["question"] == "Question 1?"
-            assert questions_db[1]["question"] == "Question 2?"
+        assert store.list_questions()[0]["question"] == "Question 1?"
+        assert store.list_questions()[1]["question"] == "Question 2?"
 
-            assert mock_openai_class.call_count == 2
+        assert mock_openai_client.acomplete.await_count == 2
+
+    def test_lifespan_shares_one_client_across_requests(self, monkeypatch, tmp_path):
+        # Keep startup out of ./uploads and skip the extraction process pool
+        monkeypatch.setitem(
+            registry._factories, "file_store", lambda: FileStore(str(tmp_path))
+        )
+        monkeypatch.setitem(
+            registry._factories,
+            "ingest_pipeline",
+            lambda: MagicMock(aclose=AsyncMock()),
+        )
+
+        with TestClient(app) as lifespan_client:
+            shared = registry.get("openai")
+            shared.acomplete = AsyncMock(
+                return_value=Completion(text="Shared answer", model="gpt-3.5-turbo")
+            )
+
+            lifespan_client.post("/api/v1/ask", json={"question": "Question 1?"})
+            lifespan_client.post("/api/v1/ask", json={"question": "Question 2?"})
+
+            assert registry.get("openai") is shared
+            assert shared.acomplete.await_count == 2
+
+    def test_ask_stream_forwards_deltas_and_stores_answer(self):
+        mock_openai_client = override_streaming_client(["Fast", "API is ", "great. "])
+
+        response = client.post(
+            "/api/v1/ask/stream",
+            json={"question": "What is FastAPI?", "context": "Python"},
+        )
+
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/event-stream")
+
+        events = parse_sse(response.text)
+        assert events[:3] == [
+            ("message", {"delta": "Fast"}),
+            ("message", {"delta": "API is "}),
+            ("message", {"delta": "great. "}),
+        ]
+        assert events[3] == (
+            "done",
+            {
+                "question": "What is FastAPI?",
+                "answer": "FastAPI is great.",
+                "model": "gpt-3.5-turbo",
+                "cached": False,
+                "usage": None,
+            },
+        )
+
+        assert stored_rows() == [
+            {
+                "question": "What is FastAPI?",
+                "answer": "FastAPI is great.",
+                "context": "Python",
+            }
+        ]
+        mock_openai_client.astream.assert_called_once_with(
+            prompt="What is FastAPI?", context="Python"
+        )
+
+    def test_ask_stream_done_event_reports_cache_hit(self):
+        override_streaming_client(
+            [
+                "Cached answer",
+                Completion(
+                    text="Cached answer",
+                    model="gpt-4",
+                    cached=True,
+                    usage=TokenUsage(),
+                ),
+            ]
+        )
+
+        response = client.post("/api/v1/ask/stream", json={"question": "What?"})
+
+        events = parse_sse(response.text)
+        assert events == [
+            ("message", {"delta": "Cached answer"}),
+            (
+                "done",
+                {
+                    "question": "What?",
+                    "answer": "Cached answer",
+                    "model": "gpt-4",
+                    "cached": True,
+                    "usage": {
+                        "prompt_tokens": 0,
+                        "completion_tokens": 0,
+                        "total_tokens": 0,
+                    },
+                },
+            ),
+        ]
+
+    def test_ask_stream_empty_question(self):
+        override_streaming_client(["unused"])
+
+        response = client.post("/api/v1/ask/stream", json={"question": "  "})
+
+        assert response.status_code == 400
+        assert "Question cannot be empty" in response.json()["detail"]
+
+    def test_ask_stream_error_before_first_delta_returns_500(self):
+        override_streaming_client([], error=Exception("OpenAI API error: boom"))
+
+        response = client.post("/api/v1/ask/stream", json={"question": "What?"})
+
+        assert response.status_code == 500
+        assert "Failed to generate AI response" in response.json()["detail"]
+        assert store.count() == 0
+
+    def test_ask_stream_open_circuit_before_first_delta_returns_503(self):
+        override_streaming_client([], error=CircuitOpen(retry_after=5.0))
+
+        response = client.post("/api/v1/ask/stream", json={"question": "What?"})
+
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "5"
+
+    def test_ask_stream_error_mid_stream_sends_error_event(self):
+        override_streaming_client(
+            ["Partial", "never sent"], error=Exception("connection reset"), fail_at=1
+        )
+
+        response = client.post("/api/v1/ask/stream", json={"question": "What?"})
+
+        assert response.status_code == 200
+        events = parse_sse(response.text)
+        assert events[0] == ("message", {"delta": "Partial"})
+        assert events[1][0] == "error"
+        assert "connection reset" in events[1][1]["detail"]
+        assert store.count() == 0
+
+    def test_search_questions(self):
+        store.add("What is FastAPI?", "FastAPI is a Python web framework.")
+        store.add("How do I bake bread?", "Use flour, water and yeast.")
+        store.add("Why FastAPI?", "FastAPI is fast. FastAPI has great docs.")
+
+        response = client.get("/api/v1/questions/search", params={"q": "FastAPI"})
+
+        assert response.status_code == 200
+        data = response.json()
+        assert [row["question"] for row in data] == ["Why FastAPI?", "What is FastAPI?"]
+        assert data[0]["score"] > data[1]["score"]
+        assert data[0]["answer"] == "FastAPI is fast. FastAPI has great docs."
+
+        page = client.get(
+            "/api/v1/questions/search", params={"q": "fastapi", "limit": 1, "offset": 1}
+        )
+        assert [row["question"] for row in page.json()] == ["What is FastAPI?"]
+
+    def test_search_questions_validation(self):
+        assert client.get("/api/v1/questions/search").status_code == 422
+        assert (
+            client.get("/api/v1/questions/search", params={"q": ""}).status_code == 422
+        )
+        assert (
+            client.get(
+                "/api/v1/questions/search", params={"q": "x", "limit": 101}
+            ).status_code
+            == 422
+        )
@@ -1,23 +1,98 @@
+import builtins
+import hashlib
 import pytest
 import os
+import shutil
+import tempfile
 from fastapi.testclient import TestClient
-from unittest.mock import patch, MagicMock, mock_open
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch, MagicMock
+from app import tracing
+from app.clients import get_file_store, get_ingest_pipeline
+from app.files import FileStore
+from app.ingest import IngestPipeline
 from app.main import app
+from app.metrics import UPLOAD_BYTES, UPLOAD_DURATION
+from app.settings import override_settings
+from app.tracing import InMemoryExporter, Tracer
 from app.controllers.upload import upload_pdf, PDFUploadResponse
-from fastapi import UploadFile
+from fastapi import HTTPException, UploadFile
+from benchmarks.pdfs import make_pdf
 
 client = TestClient(app)
+real_open = builtins.open
+
+
+def make_upload_file(filename, chunks, size=None):
+    # Two passes over the body: hashing, then copying new content to disk
+    mock_file = MagicMock(spec=UploadFile)
+    mock_file.filename = filename
+    mock_file.size = size
+    mock_file.read.side_effect = list(chunks) + [b""] + list(chunks) + [b""]
+    return mock_file
 
 
 class TestPDFUpload:
+    def setup_method(self):
+        self.upload_dir = tempfile.mkdtemp()
+        self.file_store = FileStore(self.upload_dir)
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.pipeline = IngestPipeline(
+            self.file_store, workers=1, executor=self.executor
+        )
+        app.dependency_overrides[get_file_store] = lambda: self.file_store
+        app.dependency_overrides[get_ingest_pipeline] = lambda: self.pipeline
+
+    def teardown_method(self):
+        app.dependency_overrides.clear()
+        self.pipeline.close()
+        self.executor.shutdown()
+        self.file_store.close()
+        shutil.rmtree(self.upload_dir)
+
+    def stored_objects(self):
+        return [
+            name
+            for _, _, names in os.walk(self.file_store.objects_dir)
+            for name in names
+        ]
+
+    def test_upload_records_size_and_duration(self):
+        uploads_before = sum(UPLOAD_BYTES.labels().snapshot()[0])
+        stored_before = sum(UPLOAD_DURATION.labels("stored").snapshot()[0])
+
+        response = client.post(
+            "/api/v1/upload/pdf",
+            files={"file": ("test.pdf", b"Mock PDF content", "application/pdf")},
+        )
+
+        assert response.status_code == 200
+        assert sum(UPLOAD_BYTES.labels().snapshot()[0]) == uploads_before + 1
+        assert sum(UPLOAD_DURATION.labels("stored").snapshot()[0]) == stored_before + 1
+
+    def test_upload_is_traced(self, monkeypatch):
+        exporter = InMemoryExporter()
+        monkeypatch.setattr(tracing, "TRACER", Tracer(exporter))
+
+        response = client.post(
+            "/api/v1/upload/pdf",
+            files={"file": ("test.pdf", b"Mock PDF content", "application/pdf")},
+        )
+
+        assert response.status_code == 200
+        spans = {span.name: span for span in exporter.spans()}
+        upload = spans["upload_pdf"]
+        assert upload.parent_id == spans["POST /api/v1/upload/pdf"].context.span_id
+        assert upload.attributes["upload.size"] == len(b"Mock PDF content")
+        assert upload.attributes["upload.outcome"] == "stored"
+        assert spans["upload.hash"].parent_id == upload.context.span_id
+        assert spans["upload.store"].parent_id == upload.context.span_id
+
     def test_upload_pdf_success(self):
         # Create a mock PDF file
         pdf_content = b"Mock PDF content"
 
-        with (
-            patch("app.controllers.upload.UPLOAD_DIR", "uploads"),
-            patch("builtins.open", mock_open()) as mock_file_open,
-        ):
+        with patch("builtins.open", side_effect=real_open) as mock_file_open:
             response = client.post(
                 "/api/v1/upload/pdf",
                 files={"file": ("test.pdf", pdf_content, "application/pdf")},
@@ -28,6 +103,7 @@ class TestPDFUpload:
             assert "file_id" in data
             assert data["filename"] == "test.pdf"
             assert data["message"] == "PDF uploaded successfully"
+            assert data["deduplicated"] is False
 
             # Verify file operations were called (check if any call matches our expected pattern)
             calls = mock_file_open.call_args_list
@@ -36,6 +112,9 @@ class TestPDFUpload:
             ]
             assert len(upload_calls) >= 1, "Expected at least one file write operation"
 
+        with open(self.file_store.path(data["file_id"]), "rb") as f:
+            assert f.read() == pdf_content
+
     def test_upload_non_pdf_file(self):
         txt_content = b"Not a PDF file"
 
@@ -72,158 +151,256 @@ class TestPDFUpload:
     def test_upload_case_insensitive_pdf_extension(self):
         pdf_content = b"Mock PDF content"
 
-        with (
-            patch("app.controllers.upload.UPLOAD_DIR", "uploads"),
-            patch("builtins.open", mock_open()),
-            patch("app.controllers.upload.os.makedirs"),
-        ):
-            response = client.post(
-                "/api/v1/upload/pdf",
-                files={"file": ("test.PDF", pdf_content, "application/pdf")},
-            )
+        response = client.post(
+            "/api/v1/upload/pdf",
+            files={"file": ("test.PDF", pdf_content, "application/pdf")},
+        )
 
-            assert response.status_code == 200
-            data = response.json()
-            assert data["filename"] == "test.PDF"
+        assert response.status_code == 200
+        data = response.json()
+        assert data["filename"] == "test.PDF"
 
     def test_upload_multiple_files(self):
         pdf_content1 = b"Mock PDF content 1"
         pdf_content2 = b"Mock PDF content 2"
 
-        with (
-            patch("app.controllers.upload.UPLOAD_DIR", "uploads"),
-            patch("builtins.open", mock_open()),
-            patch("app.controllers.upload.os.makedirs"),
-        ):
-            response1 = client.post(
-                "/api/v1/upload/pdf",
-                files={"file": ("test1.pdf", pdf_content1, "application/pdf")},
-            )
-            assert response1.status_code == 200
+        response1 = client.post(
+            "/api/v1/upload/pdf",
+            files={"file": ("test1.pdf", pdf_content1, "application/pdf")},
+        )
+        assert response1.status_code == 200
 
-            response2 = client.post(
-                "/api/v1/upload/pdf",
-                files={"file": ("test2.pdf", pdf_content2, "application/pdf")},
-            )
-            assert response2.status_code == 200
+        response2 = client.post(
+            "/api/v1/upload/pdf",
+            files={"file": ("test2.pdf", pdf_content2, "application/pdf")},
+        )
+        assert response2.status_code == 200
+
+        data1 = response1.json()
+        data2 = response2.json()
+        assert data1["file_id"] != data2["file_id"]
+        assert data1["sha256"] != data2["sha256"]
+        assert len(self.stored_objects()) == 2
+
+    def test_upload_response_model(self):
+        pdf_content = b"Mock PDF content"
+
+        response = client.post(
+            "/api/v1/upload/pdf",
+            files={"file": ("test.pdf", pdf_content, "application/pdf")},
+        )
 
-            data1 = response1.json()
-            data2 = response2.json()
-            assert data1["file_id"] != data2["file_id"]
+        assert response.status_code == 200
+        data = response.json()
 
-    def test_upload_handles_directory_creation(self):
+        required_fields = ["file_id", "filename", "message"]
+        for field in required_fields:
+            assert field in data
+
+        assert isinstance(data["file_id"], str)
+        assert isinstance(data["filename"], str)
+        assert isinstance(data["message"], str)
+
+        assert len(data["file_id"]) == 36
+        assert data["file_id"].count("-") == 4
+
+    def test_upload_error_handling(self):
         pdf_content = b"Mock PDF content"
 
-        with (
-            patch("app.controllers.upload.UPLOAD_DIR", "uploads"),
-            patch("builtins.open", mock_open()),
-        ):
+        with patch("builtins.open", side_effect=IOError("Write error")):
             response = client.post(
                 "/api/v1/upload/pdf",
                 files={"file": ("test.pdf", pdf_content, "application/pdf")},
             )
 
-            assert response.status_code == 200
+            assert response.status_code == 500
+            assert "Error uploading PDF" in response.json()["detail"]
 
-    def test_upload_file_content_validation(self):
+    def test_upload_unique_filename_generation(self):
         pdf_content = b"Mock PDF content"
 
-        with (
-            patch("app.controllers.upload.UPLOAD_DIR", "uploads"),
-            patch("builtins.open", mock_open()),
-            patch("app.controllers.upload.os.makedirs"),
-        ):
+        file_ids = []
+        for i in range(3):
             response = client.post(
                 "/api/v1/upload/pdf",
                 files={"file": ("test.pdf", pdf_content, "application/pdf")},
             )
-
             assert response.status_code == 200
+            file_ids.append(response.json()["file_id"])
 
-    def test_upload_response_model(self):
-        pdf_content = b"Mock PDF content"
+        assert len(set(file_ids)) == 3  # All unique
+
+    def test_repeat_upload_is_deduplicated(self):
+        pdf_content = b"%PDF-1.4 same document"
 
-        with (
-            patch("app.controllers.upload.UPLOAD_DIR", "uploads"),
-            patch("builtins.open", mock_open()),
-            patch("app.controllers.upload.os.makedirs"),
-        ):
+        first = client.post(
+            "/api/v1/upload/pdf",
+            files={"file": ("a.pdf", pdf_content, "application/pdf")},
+        ).json()
+        self.pipeline.join()
+
+        with patch("builtins.open", side_effect=AssertionError("wrote again")):
             response = client.post(
                 "/api/v1/upload/pdf",
-                files={"file": ("test.pdf", pdf_content, "application/pdf")},
+                files={"file": ("b.pdf", pdf_content, "application/pdf")},
             )
 
-            assert response.status_code == 200
-            data = response.json()
+        assert response.status_code == 200
+        second = response.json()
+        assert second["deduplicated"] is True
+        assert second["file_id"] != first["file_id"]
+        assert second["sha256"] == first["sha256"]
+        assert self.file_store.path(first["file_id"]) == self.file_store.path(
+            second["file_id"]
+        )
+        assert self.file_store.refcount(first["sha256"]) == 2
+        assert len(self.stored_objects()) == 1
 
-            required_fields = ["file_id", "filename", "message"]
-            for field in required_fields:
-                assert field in data
+    def test_upload_streams_to_disk(self):
+        pdf_content = b"%PDF-1.4 " + b"x" * (3 * 1024 * 1024)
 
-            assert isinstance(data["file_id"], str)
-            assert isinstance(data["filename"], str)
-            assert isinstance(data["message"], str)
+        with override_settings(upload_chunk_size=64 * 1024):
+            response = client.post(
+                "/api/v1/upload/pdf",
+                files={"file": ("big.pdf", pdf_content, "application/pdf")},
+            )
 
-            assert len(data["file_id"]) == 36
-            assert data["file_id"].count("-") == 4
+        assert response.status_code == 200
+        data = response.json()
+        assert data["size"] == len(pdf_content)
+        assert data["sha256"] == hashlib.sha256(pdf_content).hexdigest()
 
-    def test_upload_error_handling(self):
+        path = self.file_store.path(data["file_id"])
+        assert path.startswith(
+            os.path.join(
+                self.file_store.objects_dir, data["sha256"][:2], data["sha256"][2:4]
+            )
+        )
+        with open(path, "rb") as f:
+            assert f.read() == pdf_content
+        assert os.listdir(self.file_store.tmp_dir) == []
+
+    @pytest.mark.asyncio
+    async def test_upload_pdf_function_directly(self):
         pdf_content = b"Mock PDF content"
+        mock_file = make_upload_file("test.pdf", [pdf_content], size=len(pdf_content))
+
+        result = await upload_pdf(mock_file, self.file_store, self.pipeline)
+
+        assert isinstance(result, PDFUploadResponse)
+        assert result.filename == "test.pdf"
+        assert result.message == "PDF uploaded successfully"
+        assert len(result.file_id) == 36  # UUID length
+        mock_file.seek.assert_awaited_once_with(0)
+
+    @pytest.mark.asyncio
+    async def test_upload_reads_in_chunks(self):
+        mock_file = make_upload_file("test.pdf", [b"a" * 10, b"b" * 10, b"c" * 5])
+
+        with override_settings(upload_chunk_size=10):
+            result = await upload_pdf(mock_file, self.file_store, self.pipeline)
+
+        assert result.size == 25
+        for call in mock_file.read.call_args_list:
+            assert call.args == (10,)
 
-        with (
-            patch("app.controllers.upload.UPLOAD_DIR", "uploads"),
-            patch("builtins.open", side_effect=IOError("Write error")),
-            patch("app.controllers.upload.os.makedirs"),
-        ):
+    @pytest.mark.asyncio
+    async def test_upload_size_limit_enforced_while_streaming(self):
+        # No declared size, so the limit can only be caught mid-stream
+        mock_file = make_upload_file("test.pdf", [b"x" * 600] * 3)
+
+        with patch("app.controllers.upload.MAX_UPLOAD_SIZE", 1000):
+            with pytest.raises(HTTPException) as exc_info:
+                await upload_pdf(mock_file, self.file_store, self.pipeline)
+
+        assert exc_info.value.status_code == 400
+        assert "File size exceeds 10MB limit" in exc_info.value.detail
+        # Stopped reading at the chunk that crossed the limit
+        assert mock_file.read.call_count == 2
+        assert self.stored_objects() == []
+
+    def test_upload_write_failure_removes_partial_file(self):
+        with patch("app.files.os.replace", side_effect=OSError("Rename failed")):
             response = client.post(
                 "/api/v1/upload/pdf",
-                files={"file": ("test.pdf", pdf_content, "application/pdf")},
+                files={"file": ("test.pdf", b"Mock PDF content", "application/pdf")},
             )
 
-            assert response.status_code == 500
-            assert "Error uploading PDF" in response.json()["detail"]
+        assert response.status_code == 500
+        assert "Rename failed" in response.json()["detail"]
+        assert os.listdir(self.file_store.tmp_dir) == []
+        assert self.stored_objects() == []
 
-    def test_upload_unique_filename_generation(self):
-        pdf_content = b"Mock PDF content"
+    def test_upload_queues_text_extraction(self):
+        pdf_content = make_pdf(["Chapter one", "Chapter two"])
 
-        with (
-            patch("app.controllers.upload.UPLOAD_DIR", "uploads"),
-            patch("builtins.open", mock_open()),
-            patch("app.controllers.upload.os.makedirs"),
-        ):
-            file_ids = []
-            for i in range(3):
-                response = client.post(
-                    "/api/v1/upload/pdf",
-                    files={"file": ("test.pdf", pdf_content, "application/pdf")},
-                )
-                assert response.status_code == 200
-                file_ids.append(response.json()["file_id"])
-
-            assert len(set(file_ids)) == 3  # All unique
+        response = client.post(
+            "/api/v1/upload/pdf",
+            files={"file": ("book.pdf", pdf_content, "application/pdf")},
+        )
+        assert response.status_code == 200
+        data = response.json()
+        assert data["status"] in ("queued", "processing", "done")
+
+        self.pipeline.join()
+        status = client.get(f"/api/v1/upload/{data['file_id']}/status")
+
+        assert status.status_code == 200
+        assert status.json() == {
+            "file_id": data["file_id"],
+            "filename": "book.pdf",
+            "status": "done",
+            "pages_done": 2,
+            "pages_total": 2,
+            "error": None,
+        }
+        assert self.file_store.load_text(data["sha256"]) == [
+            "Chapter one",
+            "Chapter two",
+        ]
+
+    def test_repeat_upload_reuses_extracted_text(self):
+        pdf_content = make_pdf(["Same document"])
+        client.post(
+            "/api/v1/upload/pdf",
+            files={"file": ("a.pdf", pdf_content, "application/pdf")},
+        )
+        self.pipeline.join()
 
-    @pytest.mark.asyncio
-    async def test_upload_pdf_function_directly(self):
-        pdf_content = b"Mock PDF content"
+        response = client.post(
+            "/api/v1/upload/pdf",
+            files={"file": ("b.pdf", pdf_content, "application/pdf")},
+        )
+
+        assert response.json()["deduplicated"] is True
+        assert response.json()["status"] == "done"
+
+    def test_upload_status_reports_failed_extraction(self):
+        response = client.post(
+            "/api/v1/upload/pdf",
+            files={"file": ("test.pdf", b"Mock PDF content", "application/pdf")},
+        )
+        self.pipeline.join()
 
-        with (
-            patch("app.controllers.upload.UPLOAD_DIR", "uploads"),
-            patch("builtins.open", mock_open()) as mock_file_open,
-        ):
-            mock_file = MagicMock(spec=UploadFile)
-            mock_file.filename = "test.pdf"
-            mock_file.size = len(pdf_content)
-            mock_file.read.return_value = pdf_content
+        status = client.get(f"/api/v1/upload/{response.json()['file_id']}/status")
 
-            result = await upload_pdf(mock_file)
+        assert status.status_code == 200
+        assert status.json()["status"] == "failed"
+        assert status.json()["error"]
 
-            assert isinstance(result, PDFUploadResponse)
-            assert result.filename == "test.pdf"
-            assert result.message == "PDF uploaded successfully"
-            assert len(result.file_id) == 36  # UUID length
+    def test_upload_status_unknown_file(self):
+        response = client.get("/api/v1/upload/missing/status")
 
-            calls = mock_file_open.call_args_list
-            upload_calls = [
-                call for call in calls if len(call[0]) >= 2 and call[0][1] == "wb"
-            ]
-            assert len(upload_calls) >= 1, "Expected at least one file write operation"
+        assert response.status_code == 404
+        assert response.json()["detail"] == "File not found"
+
+    def test_upload_rejected_when_processing_queue_full(self):
+        with patch.object(self.pipeline, "full", return_value=True):
+            response = client.post(
+                "/api/v1/upload/pdf",
+                files={"file": ("test.pdf", make_pdf(["x"]), "application/pdf")},
+            )
+
+        assert response.status_code == 503
+        assert response.headers["retry-after"] == "5"
+        assert self.stored_objects() == []
@@ -0,0 +1,83 @@
+from fastapi.testclient import TestClient
+from unittest.mock import MagicMock
+from app.clients import get_openai_client
+from app.hedging import Hedger
+from app.limiter import UpstreamLimiter
+from app.main import app
+from app.providers import Backend, BackendRouter
+from app.resilience import ResiliencePolicy
+
+client = TestClient(app)
+
+
+class TestUpstreamController:
+    def teardown_method(self):
+        app.dependency_overrides.clear()
+
+    def test_upstream_stats_without_hedging(self):
+        mock_openai_client = MagicMock(
+            resilience=ResiliencePolicy(),
+            hedger=None,
+            limiter=UpstreamLimiter(),
+            router=BackendRouter([Backend("openai", "gpt-3.5-turbo")]),
+        )
+        app.dependency_overrides[get_openai_client] = lambda: mock_openai_client
+
+        response = client.get("/api/v1/upstream/stats")
+
+        assert response.status_code == 200
+        assert response.json() == {
+            "resilience": {
+                "retries": 0,
+                "timeouts": 0,
+                "breaker_state": "closed",
+                "breaker_opened": 0,
+            },
+            "limiter": {
+                "in_flight": 0,
+                "queued": 0,
+                "admitted": 0,
+                "waited": 0,
+                "rejected": 0,
+                "timed_out": 0,
+                "extra": 0,
+            },
+            "routing": {
+                "failovers": 0,
+                "backends": [
+                    {
+                        "name": "openai",
+                        "kind": "openai",
+                        "model": "gpt-3.5-turbo",
+                        "available": True,
+                        "latency_ms": None,
+                        "error_rate": 0.0,
+                        "calls": 0,
+                        "errors": 0,
+                    }
+                ],
+            },
+            "hedging": {"enabled": False},
+        }
+
+    def test_upstream_stats_reports_hedges(self):
+        hedger = Hedger()
+        hedger.calls = 40
+        hedger.fired = 2
+        hedger.won = 1
+        mock_openai_client = MagicMock(
+            resilience=ResiliencePolicy(),
+            hedger=hedger,
+            limiter=UpstreamLimiter(),
+            router=BackendRouter([Backend("openai", "gpt-3.5-turbo")]),
+        )
+        app.dependency_overrides[get_openai_client] = lambda: mock_openai_client
+
+        response = client.get("/api/v1/upstream/stats")
+
+        assert response.status_code == 200
+        hedging = response.json()["hedging"]
+        assert hedging["fired"] == 2
+        assert hedging["fire_rate"] == 0.05
+        assert hedging["win_rate"] == 0.5
+        assert hedging["delay"] is None
@@ -0,0 +1,17 @@
+import httpx
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class StatusError(Exception):
+    # An SDK-style HTTP error: a status code plus the response's headers
+    def __init__(self, status_code, headers=None):
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+        self.response = httpx.Response(status_code, headers=headers or {})
@@ -0,0 +1,211 @@
+import fnmatch
+import time
+import pytest
+from unittest.mock import patch
+from app.cache import (
+    LRUCache,
+    RedisCache,
+    ResponseCache,
+    SQLiteCache,
+    create_response_cache,
+    make_cache_key,
+)
+from app.settings import override_settings
+
+
+class FakeRedis:
+    # Minimal async stand-in for redis.asyncio.Redis
+    def __init__(self):
+        self.data = {}
+        self.closed = False
+
+    async def get(self, name):
+        entry = self.data.get(name)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self.data[name]
+            return None
+        return value
+
+    async def set(self, name, value, ex=None):
+        expires_at = time.monotonic() + ex if ex else None
+        self.data[name] = (value.encode("utf-8"), expires_at)
+
+    async def delete(self, name):
+        self.data.pop(name, None)
+
+    async def scan_iter(self, match="*"):
+        for name in list(self.data):
+            if fnmatch.fnmatch(name, match):
+                yield name
+
+    async def aclose(self):
+        self.closed = True
+
+
+MESSAGES = [{"role": "user", "content": "What is FastAPI?"}]
+
+
+class TestMakeCacheKey:
+    def test_same_request_same_key(self):
+        key1 = make_cache_key("gpt-3.5-turbo", MESSAGES, 1000, 0.7)
+        key2 = make_cache_key("gpt-3.5-turbo", list(MESSAGES), 1000, 0.7)
+
+        assert key1 == key2
+        assert len(key1) == 64
+
+    def test_whitespace_is_normalized(self):
+        spaced = [{"role": "user", "content": "  What   is\nFastAPI? "}]
+
+        assert make_cache_key("gpt-3.5-turbo", MESSAGES, 1000, 0.7) == (
+            make_cache_key("gpt-3.5-turbo", spaced, 1000, 0.7)
+        )
+
+    @pytest.mark.parametrize(
+        "model, max_tokens, temperature",
+        [("gpt-4", 1000, 0.7), ("gpt-3.5-turbo", 500, 0.7), ("gpt-3.5-turbo", 1000, 0)],
+    )
+    def test_parameters_change_key(self, model, max_tokens, temperature):
+        base = make_cache_key("gpt-3.5-turbo", MESSAGES, 1000, 0.7)
+
+        assert make_cache_key(model, MESSAGES, max_tokens, temperature) != base
+
+    def test_context_changes_key(self):
+        with_context = [{"role": "system", "content": "Context: web"}] + MESSAGES
+
+        assert make_cache_key("gpt-3.5-turbo", MESSAGES, 1000, 0.7) != (
+            make_cache_key("gpt-3.5-turbo", with_context, 1000, 0.7)
+        )
+
+
+class TestLRUCache:
+    @pytest.mark.asyncio
+    async def test_evicts_least_recently_used(self):
+        cache = LRUCache(max_entries=2)
+        await cache.set("a", {"text": "A"}, ttl=60)
+        await cache.set("b", {"text": "B"}, ttl=60)
+
+        assert await cache.get("a") == {"text": "A"}
+
+        await cache.set("c", {"text": "C"}, ttl=60)
+
+        assert await cache.get("b") is None
+        assert await cache.get("a") == {"text": "A"}
+        assert await cache.get("c") == {"text": "C"}
+        assert cache.evictions == 1
+        assert len(cache) == 2
+
+    @pytest.mark.asyncio
+    async def test_entries_expire_after_ttl(self):
+        cache = LRUCache(max_entries=10)
+
+        with patch("app.cache.time.monotonic", return_value=100.0):
+            await cache.set("a", {"text": "A"}, ttl=5)
+        with patch("app.cache.time.monotonic", return_value=104.0):
+            assert await cache.get("a") == {"text": "A"}
+        with patch("app.cache.time.monotonic", return_value=105.0):
+            assert await cache.get("a") is None
+
+        assert len(cache) == 0
+
+
+class TestRedisCache:
+    @pytest.mark.asyncio
+    async def test_round_trips_through_redis(self):
+        fake = FakeRedis()
+        cache = RedisCache(fake)
+
+        await cache.set("key", {"text": "Answer", "model": "gpt-3.5-turbo"}, ttl=60)
+
+        assert "ask:key" in fake.data
+        assert await cache.get("key") == {"text": "Answer", "model": "gpt-3.5-turbo"}
+        assert await cache.get("other") is None
+
+    @pytest.mark.asyncio
+    async def test_clear_and_close(self):
+        fake = FakeRedis()
+        await fake.set("unrelated", "value")
+        cache = RedisCache(fake)
+        await cache.set("key", {"text": "Answer"}, ttl=60)
+
+        await cache.clear()
+        await cache.aclose()
+
+        assert list(fake.data) == ["unrelated"]
+        assert fake.closed is True
+
+
+class TestSQLiteCache:
+    @pytest.mark.asyncio
+    async def test_shared_between_instances(self, tmp_path):
+        # Two workers opening the same file
+        path = str(tmp_path / "shared.db")
+        first, second = SQLiteCache(path), SQLiteCache(path)
+
+        await first.set("key", {"text": "Answer"}, ttl=60)
+
+        assert await second.get("key") == {"text": "Answer"}
+        await second.clear()
+        assert await first.get("key") is None
+        await first.aclose()
+        await second.aclose()
+
+    @pytest.mark.asyncio
+    async def test_entries_expire_after_ttl(self, tmp_path):
+        cache = SQLiteCache(str(tmp_path / "shared.db"))
+
+        with patch("app.cache.time.time", return_value=100.0):
+            await cache.set("a", {"text": "A"}, ttl=5)
+        with patch("app.cache.time.time", return_value=104.0):
+            assert await cache.get("a") == {"text": "A"}
+        with patch("app.cache.time.time", return_value=105.0):
+            assert await cache.get("a") is None
+        await cache.aclose()
+
+    @pytest.mark.asyncio
+    async def test_trimmed_to_max_entries(self, tmp_path):
+        cache = SQLiteCache(str(tmp_path / "shared.db"), max_entries=10)
+
+        for i in range(SQLiteCache.TRIM_EVERY):
+            await cache.set(str(i), {"text": str(i)}, ttl=60 + i)
+
+        assert len(cache) == 10
+        assert cache.evictions == SQLiteCache.TRIM_EVERY - 10
+        # The entries closest to expiry went first
+        assert await cache.get("0") is None
+        assert await cache.get(str(SQLiteCache.TRIM_EVERY - 1)) is not None
+        await cache.aclose()
+
+    @pytest.mark.asyncio
+    async def test_used_when_shared_state_is_configured(self, tmp_path):
+        path = str(tmp_path / "shared.db")
+        with override_settings(cache_enabled=True, shared_state_path=path):
+            cache = create_response_cache()
+
+        assert isinstance(cache.backend, SQLiteCache)
+        await cache.aclose()
+
+
+class TestResponseCache:
+    @pytest.mark.asyncio
+    async def test_counts_hits_misses_and_evictions(self):
+        cache = ResponseCache(LRUCache(max_entries=1), ttl=60)
+
+        assert await cache.get("a") is None
+        await cache.set("a", {"text": "A"})
+        assert await cache.get("a") == {"text": "A"}
+        await cache.set("b", {"text": "B"})
+
+        stats = cache.stats.as_dict()
+        assert stats == {"hits": 1, "misses": 1, "evictions": 1, "hit_ratio": 0.5}
+
+    @pytest.mark.asyncio
+    async def test_works_with_redis_backend(self):
+        cache = ResponseCache(RedisCache(FakeRedis()), ttl=60)
+
+        await cache.set("a", {"text": "A"})
+
+        assert await cache.get("a") == {"text": "A"}
+        assert cache.stats.hits == 1
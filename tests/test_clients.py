@@ -0,0 +1,67 @@
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+from app.clients import ClientRegistry
+
+
+def make_factory():
+    factory = MagicMock(side_effect=lambda: MagicMock(aclose=AsyncMock()))
+    return factory
+
+
+class TestClientRegistry:
+    def test_get_builds_client_once(self):
+        registry = ClientRegistry()
+        factory = make_factory()
+        registry.register("openai", factory)
+
+        first = registry.get("openai")
+        second = registry.get("openai")
+
+        assert first is second
+        factory.assert_called_once()
+
+    def test_startup_builds_all_registered_clients(self):
+        registry = ClientRegistry()
+        # Stub the defaults too, so startup never touches ./uploads
+        factories = {name: make_factory() for name in registry._factories}
+        factories["other"] = make_factory()
+        for name, factory in factories.items():
+            registry.register(name, factory)
+
+        registry.startup()
+
+        for factory in factories.values():
+            factory.assert_called_once()
+
+    def test_get_unknown_client_raises(self):
+        registry = ClientRegistry()
+
+        with pytest.raises(KeyError):
+            registry.get("missing")
+
+    @pytest.mark.asyncio
+    async def test_aclose_closes_clients_and_allows_restart(self):
+        registry = ClientRegistry()
+        factory = make_factory()
+        registry.register("openai", factory)
+
+        client = registry.get("openai")
+        await registry.aclose()
+
+        client.aclose.assert_awaited_once()
+
+        assert registry.get("openai") is not client
+        assert factory.call_count == 2
+
+    def test_get_builds_dependencies_from_inside_a_factory(self):
+        registry = ClientRegistry()
+        registry.register("file_store", make_factory())
+        registry.register(
+            "pipeline",
+            lambda: MagicMock(store=registry.get("file_store"), aclose=AsyncMock()),
+        )
+
+        # Resolving the dependent first must not deadlock on the registry lock
+        pipeline = registry.get("pipeline")
+
+        assert pipeline.store is registry.get("file_store")
@@ -0,0 +1,97 @@
+import hashlib
+import os
+from app.files import FileStore
+
+
+def stage(file_store, content: bytes) -> str:
+    path = file_store.temp_path()
+    with open(path, "wb") as f:
+        f.write(content)
+    return path
+
+
+class TestFileStore:
+    def test_add_publishes_sharded_blob(self, file_store):
+        content = b"%PDF-1.4 hello"
+        digest = hashlib.sha256(content).hexdigest()
+
+        file_store.add("a", "a.pdf", digest, len(content), stage(file_store, content))
+
+        path = file_store.path("a")
+        assert path == os.path.join(
+            file_store.objects_dir, digest[:2], digest[2:4], f"{digest}.pdf"
+        )
+        with open(path, "rb") as f:
+            assert f.read() == content
+        assert file_store.get("a")["filename"] == "a.pdf"
+        assert file_store.refcount(digest) == 1
+        assert os.listdir(file_store.tmp_dir) == []
+
+    def test_link_requires_existing_blob(self, file_store):
+        content = b"%PDF-1.4 hello"
+        digest = hashlib.sha256(content).hexdigest()
+
+        assert file_store.link("a", "a.pdf", digest, len(content)) is False
+        assert file_store.get("a") is None
+
+        file_store.add("a", "a.pdf", digest, len(content), stage(file_store, content))
+
+        assert file_store.link("b", "b.pdf", digest, len(content)) is True
+        assert file_store.path("b") == file_store.path("a")
+        assert file_store.refcount(digest) == 2
+
+    def test_concurrent_add_of_same_content_keeps_one_blob(self, file_store):
+        content = b"%PDF-1.4 hello"
+        digest = hashlib.sha256(content).hexdigest()
+        first = stage(file_store, content)
+        second = stage(file_store, content)
+
+        file_store.add("a", "a.pdf", digest, len(content), first)
+        file_store.add("b", "b.pdf", digest, len(content), second)
+
+        assert file_store.refcount(digest) == 2
+        assert not os.path.exists(second)
+        assert os.listdir(file_store.tmp_dir) == []
+
+    def test_remove_deletes_blob_with_last_reference(self, file_store):
+        content = b"%PDF-1.4 hello"
+        digest = hashlib.sha256(content).hexdigest()
+        file_store.add("a", "a.pdf", digest, len(content), stage(file_store, content))
+        file_store.link("b", "b.pdf", digest, len(content))
+        path = file_store.path("a")
+
+        assert file_store.remove("a") is True
+        assert os.path.exists(path)
+        assert file_store.refcount(digest) == 1
+
+        assert file_store.remove("b") is True
+        assert not os.path.exists(path)
+        assert file_store.refcount(digest) == 0
+        assert file_store.remove("b") is False
+
+    def test_metadata_survives_reopen(self, tmp_path):
+        content = b"%PDF-1.4 hello"
+        digest = hashlib.sha256(content).hexdigest()
+        store = FileStore(str(tmp_path))
+        store.add("a", "a.pdf", digest, len(content), stage(store, content))
+        store.close()
+
+        reopened = FileStore(str(tmp_path))
+        try:
+            assert reopened.link("b", "b.pdf", digest, len(content)) is True
+            assert reopened.refcount(digest) == 2
+        finally:
+            reopened.close()
+
+    def test_page_count_is_recorded_with_saved_text(self, file_store, monkeypatch):
+        content = b"%PDF-1.4 hello"
+        digest = hashlib.sha256(content).hexdigest()
+        file_store.add("a", "a.pdf", digest, len(content), stage(file_store, content))
+
+        assert file_store.page_count(digest) is None
+
+        file_store.save_text(digest, ["one", "two", "three"])
+        # Reading the count must not parse the extracted text
+        monkeypatch.setattr(file_store, "load_text", None)
+
+        assert file_store.page_count(digest) == 3
@@ -0,0 +1,166 @@
+import asyncio
+import pytest
+from app.hedging import Hedger, LatencyTracker
+from app.openai_client import OpenAIClient
+from app.resilience import CircuitBreaker, ResiliencePolicy
+from benchmarks.mock_upstream import MockUpstream
+
+
+def warmed_hedger(latency=0.01, samples=20, **kwargs):
+    hedger = Hedger(min_samples=samples, min_delay=0.0, **kwargs)
+    for _ in range(samples):
+        hedger.tracker.record(latency)
+    return hedger
+
+
+def scripted(*delays):
+    # Call n sleeps delays[n] and returns n; a delay that is an exception is
+    # raised instead
+    calls = []
+    cancelled = []
+
+    async def call():
+        n = len(calls)
+        calls.append(n)
+        delay = delays[n]
+        if isinstance(delay, Exception):
+            raise delay
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            cancelled.append(n)
+            raise
+        return n
+
+    return call, calls, cancelled
+
+
+class TestLatencyTracker:
+    def test_percentile(self):
+        tracker = LatencyTracker(window=100)
+        for ms in range(1, 101):
+            tracker.record(ms / 1000)
+        assert tracker.percentile(50) == 0.051
+        assert tracker.percentile(95) == 0.096
+        assert tracker.percentile(100) == 0.1
+
+    def test_window_drops_old_samples(self):
+        tracker = LatencyTracker(window=10)
+        for _ in range(40):
+            tracker.record(5.0)
+        for _ in range(40):
+            tracker.record(0.1)
+        assert len(tracker) == 10
+        assert tracker.percentile(99) == 0.1
+
+    def test_empty(self):
+        assert LatencyTracker().percentile(95) is None
+
+
+class TestHedger:
+    @pytest.mark.asyncio
+    async def test_no_hedge_before_enough_samples(self):
+        hedger = Hedger(min_samples=5, budget=1.0)
+        call, calls, _ = scripted(0.05)
+        assert await hedger.run(call) == 0
+        assert calls == [0]
+        assert hedger.delay() is None
+        assert len(hedger.tracker) == 1
+
+    @pytest.mark.asyncio
+    async def test_fast_call_is_not_hedged(self):
+        hedger = warmed_hedger(latency=0.2, budget=1.0)
+        call, calls, _ = scripted(0.0)
+        assert await hedger.run(call) == 0
+        assert calls == [0]
+        assert hedger.fired == 0
+
+    @pytest.mark.asyncio
+    async def test_slow_call_is_hedged_and_loser_cancelled(self):
+        hedger = warmed_hedger(budget=1.0)
+        call, calls, cancelled = scripted(5.0, 0.0)
+        assert await hedger.run(call) == 1
+        await asyncio.sleep(0)
+        assert calls == [0, 1]
+        assert cancelled == [0]
+        assert hedger.fired == 1
+        assert hedger.won == 1
+
+    @pytest.mark.asyncio
+    async def test_primary_can_still_win(self):
+        hedger = warmed_hedger(budget=1.0)
+        call, calls, cancelled = scripted(0.05, 5.0)
+        assert await hedger.run(call) == 0
+        await asyncio.sleep(0)
+        assert cancelled == [1]
+        assert hedger.fired == 1
+        assert hedger.won == 0
+
+    @pytest.mark.asyncio
+    async def test_failed_attempt_falls_back_to_the_other(self):
+        hedger = warmed_hedger(budget=1.0)
+        call, calls, _ = scripted(0.05, RuntimeError("boom"))
+        assert await hedger.run(call) == 0
+        assert calls == [0, 1]
+        assert hedger.won == 0
+
+    @pytest.mark.asyncio
+    async def test_both_failing_raises(self):
+        hedger = warmed_hedger(budget=1.0)
+
+        async def call():
+            await asyncio.sleep(0.03)
+            raise RuntimeError("boom")
+
+        with pytest.raises(RuntimeError):
+            await hedger.run(call)
+
+    @pytest.mark.asyncio
+    async def test_budget_caps_extra_requests(self):
+        hedger = warmed_hedger(budget=0.25)
+        for _ in range(8):
+            call, _, _ = scripted(0.03, 0.0)
+            await hedger.run(call)
+        assert hedger.fired == 2
+        assert hedger.over_budget == 6
+        assert hedger.stats()["fire_rate"] == 0.25
+
+    @pytest.mark.asyncio
+    async def test_cancelling_the_caller_cancels_both_calls(self):
+        hedger = warmed_hedger(budget=1.0)
+        call, calls, cancelled = scripted(5.0, 5.0)
+        task = asyncio.ensure_future(hedger.run(call))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        await asyncio.sleep(0)
+        assert sorted(cancelled) == [0, 1]
+
+
+class TestHedgingAgainstMockUpstream:
+    @pytest.mark.asyncio
+    async def test_slow_upstream_call_is_hedged(self, monkeypatch):
+        faults = [{}] * 20 + [{"latency": 3.0}]
+        with MockUpstream(port=0, faults=faults) as upstream:
+            monkeypatch.setenv("OPENAI_BASE_URL", upstream.base_url)
+            hedger = Hedger(min_samples=20, min_delay=0.05, budget=1.0)
+            client = OpenAIClient(
+                resilience=ResiliencePolicy(
+                    attempt_timeout=10, breaker=CircuitBreaker(failure_threshold=100)
+                ),
+                hedger=hedger,
+            )
+            for i in range(20):
+                await client.agenerate_response(f"warm-up {i}")
+
+            loop = asyncio.get_running_loop()
+            start = loop.time()
+            answer = await client.agenerate_response("What is FastAPI?")
+            elapsed = loop.time() - start
+            await client.aclose()
+
+        assert answer == "Mock answer"
+        assert elapsed < 2.0
+        assert upstream.requests == 22
+        assert hedger.won == 1
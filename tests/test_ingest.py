@@ -0,0 +1,133 @@
+import hashlib
+import threading
+import time
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+from app.ingest import IngestPipeline, IngestQueueFull
+from benchmarks.pdfs import make_pdf
+
+
+def store_pdf(file_store, content: bytes, file_id: str = "a") -> str:
+    digest = hashlib.sha256(content).hexdigest()
+    path = file_store.temp_path()
+    with open(path, "wb") as f:
+        f.write(content)
+    file_store.add(file_id, f"{file_id}.pdf", digest, len(content), path)
+    return digest
+
+
+class BlockingExecutor(ThreadPoolExecutor):
+    # Holds every task until released, so queue states can be observed
+    def __init__(self):
+        super().__init__(max_workers=1)
+        self.release = threading.Event()
+
+    def submit(self, fn, *args):
+        return super().submit(lambda: self.release.wait() and fn(*args))
+
+
+class TestIngestPipeline:
+    def test_extracts_pages_in_process_pool(self, file_store):
+        digest = store_pdf(file_store, make_pdf(["Hello world", "Second page"]))
+        pipeline = IngestPipeline(file_store, workers=1)
+        try:
+            pipeline.submit(digest)
+            pipeline.join()
+        finally:
+            pipeline.close()
+
+        assert file_store.load_text(digest) == ["Hello world", "Second page"]
+        assert file_store.load_chunks(digest) == [
+            {"page": 1, "text": "Hello world"},
+            {"page": 2, "text": "Second page"},
+        ]
+        job = pipeline.status(digest)
+        assert job.status == "done"
+        assert job.pages_done == job.pages_total == 2
+
+    def test_reports_page_progress(self, file_store):
+        pages = [f"Page {i}" for i in range(5)]
+        digest = store_pdf(file_store, make_pdf(pages))
+        seen = []
+
+        class RecordingExecutor(ThreadPoolExecutor):
+            def submit(self, fn, *args):
+                seen.append((fn.__name__, pipeline.status(digest).pages_done))
+                return super().submit(fn, *args)
+
+        executor = RecordingExecutor(max_workers=1)
+        pipeline = IngestPipeline(
+            file_store, workers=1, pages_per_task=2, executor=executor
+        )
+        try:
+            job = pipeline.submit(digest)
+            pipeline.join()
+        finally:
+            pipeline.close()
+            executor.shutdown()
+
+        assert seen == [
+            ("count_pages", 0),
+            ("extract_pages", 0),
+            ("extract_pages", 2),
+            ("extract_pages", 4),
+        ]
+        assert job.pages_done == job.pages_total == 5
+        assert file_store.load_text(digest) == pages
+
+    def test_duplicate_content_is_extracted_once(self, file_store):
+        content = make_pdf(["Same"])
+        digest = store_pdf(file_store, content, "a")
+        executor = BlockingExecutor()
+        pipeline = IngestPipeline(file_store, workers=1, executor=executor)
+        try:
+            first = pipeline.submit(digest)
+            second = pipeline.submit(digest)
+            assert first is second
+
+            executor.release.set()
+            pipeline.join()
+            assert pipeline.submit(digest).status == "done"
+        finally:
+            pipeline.close()
+            executor.shutdown()
+
+    def test_bounded_queue_rejects_when_full(self, file_store):
+        digests = [
+            store_pdf(file_store, make_pdf([f"Doc {i}"]), str(i)) for i in range(3)
+        ]
+        executor = BlockingExecutor()
+        pipeline = IngestPipeline(
+            file_store, workers=1, queue_size=1, executor=executor
+        )
+        try:
+            pipeline.submit(digests[0])
+            # The worker takes the first job, the second fills the queue
+            while pipeline.status(digests[0]).status == "queued":
+                time.sleep(0.001)
+            pipeline.submit(digests[1])
+            assert pipeline.full()
+
+            with pytest.raises(IngestQueueFull):
+                pipeline.submit(digests[2], timeout=0.01)
+            assert pipeline.status(digests[2]) is None
+        finally:
+            executor.release.set()
+            pipeline.close()
+            executor.shutdown()
+
+    def test_failed_extraction_is_reported(self, file_store):
+        digest = store_pdf(file_store, b"%PDF-1.4 not really a pdf")
+        executor = ThreadPoolExecutor(max_workers=1)
+        pipeline = IngestPipeline(file_store, workers=1, executor=executor)
+        try:
+            pipeline.submit(digest)
+            pipeline.join()
+            job = pipeline.status(digest)
+        finally:
+            pipeline.close()
+            executor.shutdown()
+
+        assert job.status == "failed"
+        assert job.error
+        assert file_store.load_text(digest) is None
@@ -0,0 +1,286 @@
+import asyncio
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+import app.jobs as jobs
+from app.jobs import JobFailed, JobQueue, JobQueueFull, JobStore
+from app.limiter import current_client
+
+
+class WebhookReceiver:
+    # Local HTTP stand-in for the webhook; answers with the queued statuses,
+    # then 200, and keeps every body it was sent
+    def __init__(self, statuses=()):
+        self.bodies = []
+        self.statuses = list(statuses)
+        self.received = threading.Event()
+        receiver = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers["Content-Length"])
+                body = json.loads(self.rfile.read(length))
+                status = receiver.statuses.pop(0) if receiver.statuses else 200
+                if status == 200:
+                    receiver.bodies.append(body)
+                    receiver.received.set()
+                self.send_response(status)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server.server_address[1]}/hook"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+async def echo(request):
+    return {"answer": f"Answer to {request['question']}"}
+
+
+def queue(handler=echo, store=None, **kwargs):
+    options = dict(workers=2, queue_size=100, timeout=5, webhook_url="")
+    options.update(kwargs)
+    return JobQueue(store or JobStore(), handler, **options)
+
+
+async def wait_for_status(queue, job_id, status="done"):
+    for _ in range(500):
+        job = await queue.get(job_id)
+        if job.status == status:
+            return job
+        await asyncio.sleep(0.01)
+    raise AssertionError(f"job {job_id} is {job.status}, not {status}")
+
+
+class TestJobStore:
+    def test_claims_by_priority_then_age(self):
+        store = JobStore()
+        low = store.add({"question": "low"}, 0, "a", limit=10)
+        first_high = store.add({"question": "high 1"}, 5, "a", limit=10)
+        second_high = store.add({"question": "high 2"}, 5, "a", limit=10)
+
+        claimed = [store.claim(lease=60).id for _ in range(3)]
+
+        assert claimed == [first_high.id, second_high.id, low.id]
+        assert store.claim(lease=60) is None
+        assert store.get(low.id).status == "running"
+        assert store.get(low.id).attempts == 1
+
+    def test_bounded(self):
+        store = JobStore()
+        store.add({"question": "one"}, 0, "a", limit=1)
+
+        with pytest.raises(JobQueueFull):
+            store.add({"question": "two"}, 0, "a", limit=1)
+        # Running jobs no longer count against the bound
+        store.claim(lease=60)
+        store.add({"question": "two"}, 0, "a", limit=1)
+
+    def test_workers_sharing_a_file_never_claim_the_same_job(self, tmp_path):
+        path = str(tmp_path / "jobs.db")
+        first, second = JobStore(path), JobStore(path)
+        for i in range(20):
+            first.add({"question": str(i)}, 0, "a", limit=100)
+
+        claimed = []
+        for _ in range(10):
+            claimed += [first.claim(lease=60).id, second.claim(lease=60).id]
+
+        assert len(set(claimed)) == 20
+        assert first.claim(lease=60) is None
+        first.close()
+        second.close()
+
+    def test_expired_leases_are_requeued_then_abandoned(self):
+        store = JobStore()
+        job = store.add({"question": "q"}, 0, "a", limit=10)
+
+        for attempt in range(1, jobs.MAX_ATTEMPTS):
+            assert store.claim(lease=-1).attempts == attempt
+            assert store.requeue_expired() == []
+            assert store.get(job.id).status == "queued"
+        store.claim(lease=-1)
+        (failed,) = store.requeue_expired()
+
+        assert failed.status == "failed"
+        assert failed.error == f"Abandoned after {jobs.MAX_ATTEMPTS} attempts"
+
+    def test_finish_and_release(self):
+        store = JobStore()
+        done = store.add({"question": "done"}, 0, "a", limit=10)
+        released = store.add({"question": "released"}, 0, "a", limit=10)
+        store.claim(lease=60)
+        store.claim(lease=60)
+
+        finished = store.finish(done.id, result={"answer": "A"})
+        store.release(released.id)
+
+        assert finished.status == "done"
+        assert finished.result == {"answer": "A"}
+        assert finished.finished_at >= finished.started_at
+        assert store.get(released.id).status == "queued"
+        assert store.get(released.id).attempts == 0
+
+
+class TestJobQueue:
+    @pytest.mark.asyncio
+    async def test_runs_submitted_jobs(self):
+        jobs_queue = queue()
+        current_client.set("client-a")
+
+        job = await jobs_queue.submit({"question": "What is FastAPI?"})
+        done = await wait_for_status(jobs_queue, job.id)
+
+        assert done.result == {"answer": "Answer to What is FastAPI?"}
+        assert done.client == "client-a"
+        await jobs_queue.aclose()
+
+    @pytest.mark.asyncio
+    async def test_pool_is_bounded(self):
+        running, peak = 0, 0
+
+        async def slow(request):
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.02)
+            running -= 1
+            return {}
+
+        jobs_queue = queue(slow, workers=3)
+        submitted = [await jobs_queue.submit({"question": str(i)}) for i in range(9)]
+        for job in submitted:
+            await wait_for_status(jobs_queue, job.id)
+
+        assert peak == 3
+        await jobs_queue.aclose()
+
+    @pytest.mark.asyncio
+    async def test_higher_priority_jumps_the_queue(self):
+        order = []
+        gate = asyncio.Event()
+
+        async def record(request):
+            await gate.wait()
+            order.append(request["question"])
+            return {}
+
+        jobs_queue = queue(record, workers=1)
+        # The first job holds the only worker while the rest queue up
+        first = await jobs_queue.submit({"question": "first"})
+        await wait_for_status(jobs_queue, first.id, "running")
+        await jobs_queue.submit({"question": "low"}, priority=0)
+        last = await jobs_queue.submit({"question": "high"}, priority=9)
+        gate.set()
+        await wait_for_status(jobs_queue, last.id)
+        await asyncio.sleep(0.05)
+
+        assert order == ["first", "high", "low"]
+        await jobs_queue.aclose()
+
+    @pytest.mark.asyncio
+    async def test_failures_and_timeouts_are_recorded(self):
+        async def handler(request):
+            if request["question"] == "bad":
+                raise JobFailed("File not found")
+            if request["question"] == "boom":
+                raise RuntimeError("upstream went away")
+            await asyncio.sleep(1)
+
+        jobs_queue = queue(handler, workers=3, timeout=0.05)
+        bad = await jobs_queue.submit({"question": "bad"})
+        boom = await jobs_queue.submit({"question": "boom"})
+        slow = await jobs_queue.submit({"question": "slow"})
+
+        assert (await wait_for_status(jobs_queue, bad.id, "failed")).error == (
+            "File not found"
+        )
+        assert (await wait_for_status(jobs_queue, boom.id, "failed")).error == (
+            "Job failed: upstream went away"
+        )
+        assert (await wait_for_status(jobs_queue, slow.id, "failed")).error == (
+            "Timed out after 0.05s"
+        )
+        await jobs_queue.aclose()
+
+    @pytest.mark.asyncio
+    async def test_jobs_survive_a_restart(self, tmp_path):
+        path = str(tmp_path / "jobs.db")
+        blocked = asyncio.Event()
+
+        async def never(request):
+            await blocked.wait()
+
+        first = queue(never, store=JobStore(path), workers=1)
+        running = await first.submit({"question": "running"})
+        queued = await first.submit({"question": "queued"})
+        await wait_for_status(first, running.id, "running")
+        # Shutdown puts the running job back in the queue
+        await first.aclose()
+
+        second = queue(store=JobStore(path))
+        second.start()
+
+        assert (await wait_for_status(second, running.id)).attempts == 1
+        assert (await wait_for_status(second, queued.id)).result is not None
+        await second.aclose()
+
+
+class TestWebhook:
+    @pytest.mark.asyncio
+    async def test_finished_jobs_are_posted(self):
+        with WebhookReceiver() as receiver:
+            jobs_queue = queue(webhook_url=receiver.url)
+            job = await jobs_queue.submit({"question": "What is FastAPI?"})
+            await wait_for_status(jobs_queue, job.id)
+            await asyncio.to_thread(receiver.received.wait, 5)
+            await jobs_queue.aclose()
+
+        (body,) = receiver.bodies
+        assert body["id"] == job.id
+        assert body["status"] == "done"
+        assert body["request"] == {"question": "What is FastAPI?"}
+        assert body["result"] == {"answer": "Answer to What is FastAPI?"}
+        assert "client" not in body
+        assert jobs_queue.delivered == 1
+
+    @pytest.mark.asyncio
+    async def test_server_errors_are_retried(self, monkeypatch):
+        monkeypatch.setattr(jobs, "WEBHOOK_BACKOFF", 0.01)
+        with WebhookReceiver(statuses=[503, 500]) as receiver:
+            jobs_queue = queue(webhook_url=receiver.url)
+            job = await jobs_queue.submit({"question": "q"})
+            await wait_for_status(jobs_queue, job.id)
+            await asyncio.to_thread(receiver.received.wait, 5)
+            await jobs_queue.aclose()
+
+        assert len(receiver.bodies) == 1
+        assert jobs_queue.delivered == 1
+
+    @pytest.mark.asyncio
+    async def test_client_errors_are_not_retried(self, monkeypatch):
+        monkeypatch.setattr(jobs, "WEBHOOK_BACKOFF", 0.01)
+        with WebhookReceiver(statuses=[404, 404]) as receiver:
+            jobs_queue = queue(webhook_url=receiver.url)
+            job = await jobs_queue.submit({"question": "q"})
+            await wait_for_status(jobs_queue, job.id)
+            # Shutdown waits for the delivery in flight
+            await jobs_queue.aclose()
+
+        assert receiver.statuses == [404]
+        assert jobs_queue.undelivered == 1
@@ -0,0 +1,345 @@
+import asyncio
+import sqlite3
+import time
+import pytest
+from fastapi.testclient import TestClient
+from unittest.mock import AsyncMock, MagicMock
+from app.clients import get_openai_client, get_question_store, get_retriever
+from app.limiter import (
+    RateLimited,
+    SharedTokenBucket,
+    TokenBucket,
+    UpstreamLimiter,
+    current_client,
+)
+from app.main import app
+from app.openai_client import Completion, OpenAIClient
+from app.resilience import ResiliencePolicy, UpstreamError
+from app.retrieval import DocumentRetriever
+from app.settings import override_settings
+from app.storage import MemoryQuestionStore
+from benchmarks.mock_upstream import MockUpstream
+from tests.fakes import FakeClock
+
+
+def limiter(**kwargs):
+    options = dict(
+        max_in_flight=1,
+        requests_per_window=0,
+        tokens_per_window=0,
+        queue_size=100,
+        queue_timeout=5,
+    )
+    options.update(kwargs)
+    return UpstreamLimiter(**options)
+
+
+async def enqueue(limiter, client_id, order, label):
+    current_client.set(client_id)
+    async with limiter.slot():
+        order.append(label)
+        await asyncio.sleep(0)
+
+
+class TestTokenBucket:
+    def test_refills_over_the_window(self):
+        clock = FakeClock()
+        bucket = TokenBucket(capacity=60, window=60, clock=clock)
+        bucket.take(60)
+        assert bucket.wait_time(1) == 1.0
+        clock.now = 30
+        assert bucket.wait_time(30) == 0.0
+        assert bucket.wait_time(31) == 1.0
+
+    def test_never_exceeds_capacity(self):
+        clock = FakeClock()
+        bucket = TokenBucket(capacity=10, window=1, clock=clock)
+        clock.now = 100
+        bucket.refund(50)
+        assert bucket.level == 10
+
+    def test_oversized_amount_waits_for_a_full_bucket_then_goes_into_debt(self):
+        clock = FakeClock()
+        bucket = TokenBucket(capacity=10, window=10, clock=clock)
+        assert bucket.wait_time(25) == 0.0
+        bucket.take(25)
+        assert bucket.level == -15
+        assert bucket.wait_time(1) == 16.0
+
+
+class TestSharedTokenBucket:
+    def test_workers_draw_from_one_budget(self, tmp_path):
+        clock = FakeClock()
+        path = str(tmp_path / "shared.db")
+        first = SharedTokenBucket(path, "requests", capacity=60, window=60, clock=clock)
+        second = SharedTokenBucket(
+            path, "requests", capacity=60, window=60, clock=clock
+        )
+
+        first.take(40)
+        second.take(20)
+
+        assert first.wait_time(1) == 1.0
+        clock.now = 30
+        assert second.wait_time(30) == 0.0
+        assert first.level == 30
+        first.close()
+        second.close()
+
+    def test_refund_and_debt_match_the_local_bucket(self, tmp_path):
+        clock = FakeClock()
+        bucket = SharedTokenBucket(
+            str(tmp_path / "shared.db"), "tokens", capacity=10, window=10, clock=clock
+        )
+
+        bucket.take(25)
+        assert bucket.wait_time(1) == 16.0
+        clock.now = 100
+        bucket.refund(50)
+        assert bucket.level == 10
+        bucket.close()
+
+    def test_locked_file_fails_open_without_losing_the_amount(self, tmp_path):
+        clock = FakeClock()
+        path = str(tmp_path / "shared.db")
+        bucket = SharedTokenBucket(
+            path, "requests", capacity=60, window=60, clock=clock
+        )
+        bucket.take(10)
+        # Another process holds the write lock
+        other = sqlite3.connect(path, isolation_level=None)
+        other.execute("BEGIN IMMEDIATE")
+
+        started = time.monotonic()
+        bucket.take(20)
+        assert bucket.level == 30
+        assert time.monotonic() - started < 1
+        assert bucket.contended == 2
+
+        other.execute("ROLLBACK")
+        other.close()
+        # The take made while locked is applied by the next update
+        assert bucket.level == 30
+        bucket.close()
+
+    def test_limiter_shares_buckets_when_configured(self, tmp_path):
+        with override_settings(shared_state_path=str(tmp_path / "shared.db")):
+            first = limiter(requests_per_window=10, tokens_per_window=100)
+            second = limiter(requests_per_window=10, tokens_per_window=100)
+
+        assert isinstance(first.requests, SharedTokenBucket)
+        first.requests.take(4)
+        assert second.requests.level == pytest.approx(6, abs=0.01)
+        first.close()
+        second.close()
+
+
+class TestUpstreamLimiter:
+    @pytest.mark.asyncio
+    async def test_caps_in_flight_calls(self):
+        gate = limiter(max_in_flight=2)
+        peak = 0
+
+        async def call():
+            nonlocal peak
+            async with gate.slot():
+                peak = max(peak, gate.in_flight)
+                await asyncio.sleep(0.01)
+
+        await asyncio.gather(*(call() for _ in range(10)))
+        assert peak == 2
+        assert gate.in_flight == 0
+        assert gate.admitted == 10
+
+    @pytest.mark.asyncio
+    async def test_round_robin_across_clients(self):
+        gate = limiter(max_in_flight=1)
+        order = []
+        await gate.acquire()
+
+        tasks = [
+            asyncio.ensure_future(enqueue(gate, "busy", order, f"busy-{i}"))
+            for i in range(4)
+        ]
+        tasks.append(asyncio.ensure_future(enqueue(gate, "quiet", order, "quiet")))
+        await asyncio.sleep(0)
+        assert gate.stats()["queued"] == 5
+
+        gate.release()
+        await asyncio.gather(*tasks)
+        assert order == ["busy-0", "quiet", "busy-1", "busy-2", "busy-3"]
+
+    @pytest.mark.asyncio
+    async def test_full_queue_is_rejected_with_retry_after(self):
+        gate = limiter(max_in_flight=1, queue_size=1)
+        await gate.acquire()
+        waiting = asyncio.ensure_future(gate.acquire())
+        await asyncio.sleep(0)
+
+        with pytest.raises(RateLimited) as exc_info:
+            await gate.acquire()
+        assert exc_info.value.status_code == 429
+        assert exc_info.value.retry_after >= 1
+        assert gate.rejected == 1
+
+        gate.release()
+        await waiting
+        assert gate.in_flight == 1
+
+    @pytest.mark.asyncio
+    async def test_queue_deadline(self):
+        gate = limiter(max_in_flight=1, queue_timeout=0.05)
+        await gate.acquire()
+
+        with pytest.raises(RateLimited):
+            await gate.acquire()
+        assert gate.timed_out == 1
+        assert gate.stats()["queued"] == 0
+
+    @pytest.mark.asyncio
+    async def test_cancelled_waiter_leaves_the_queue(self):
+        gate = limiter(max_in_flight=1)
+        await gate.acquire()
+        waiting = asyncio.ensure_future(gate.acquire())
+        await asyncio.sleep(0)
+        waiting.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+
+        assert gate.stats()["queued"] == 0
+        gate.release()
+        assert gate.in_flight == 0
+
+    @pytest.mark.asyncio
+    async def test_requests_per_window(self):
+        gate = limiter(max_in_flight=0, requests_per_window=2, window=0.2)
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        for _ in range(3):
+            async with gate.slot():
+                pass
+        # The third request waits for a tenth of the window to refill
+        assert loop.time() - start >= 0.09
+        assert gate.waited == 1
+
+    @pytest.mark.asyncio
+    async def test_unused_tokens_are_refunded(self):
+        gate = limiter(max_in_flight=0, tokens_per_window=1000, window=3600)
+        async with gate.slot(600) as slot:
+            assert gate.tokens.level == pytest.approx(400, abs=1)
+            slot.used = 100
+        assert gate.tokens.level == pytest.approx(900, abs=1)
+
+    @pytest.mark.asyncio
+    async def test_every_request_sent_under_a_slot_is_charged(self):
+        clock = FakeClock()
+        gate = limiter(
+            max_in_flight=2,
+            requests_per_window=10,
+            tokens_per_window=1000,
+            window=60,
+            clock=clock,
+        )
+        async with gate.slot(100) as slot:
+            with gate.send(slot):
+                # The first request is the slot's own
+                assert (gate.in_flight, gate.requests.level) == (1, 9)
+                with gate.send(slot):
+                    # A hedge: charged, and running alongside the first
+                    assert gate.in_flight == 2
+            with gate.send(slot):
+                # A retry: charged, but nothing else is running
+                assert gate.in_flight == 1
+            slot.used = 50
+
+        assert gate.in_flight == 0
+        assert gate.extra == 2
+        assert gate.requests.level == 7
+        # Only the answered request's unused estimate comes back
+        assert gate.tokens.level == 1000 - 300 + 50
+
+
+class TestClientLimiting:
+    @pytest.mark.asyncio
+    async def test_slot_is_released_and_tokens_settled(self, monkeypatch):
+        gate = limiter(max_in_flight=4, tokens_per_window=100000, window=60)
+        with MockUpstream(port=0, faults=[{}, {"status": 400}]) as upstream:
+            monkeypatch.setenv("OPENAI_BASE_URL", upstream.base_url)
+            client = OpenAIClient(
+                resilience=ResiliencePolicy(max_retries=0), limiter=gate
+            )
+            await client.agenerate_response("What is FastAPI?")
+            with pytest.raises(UpstreamError):
+                await client.agenerate_response("What is Django?")
+            await client.aclose()
+
+        assert gate.in_flight == 0
+        assert gate.admitted == 2
+        # The mock reports 12 tokens used; the rest of the estimate came back,
+        # but the failed call keeps its whole reservation
+        assert 100000 - gate.tokens.level > 1000
+
+    @pytest.mark.asyncio
+    async def test_retries_are_charged(self, monkeypatch):
+        gate = limiter(requests_per_window=10, window=60, clock=FakeClock())
+        faults = [{"status": 500}, {"status": 429, "retry_after": 0}, {}]
+        with MockUpstream(port=0, faults=faults) as upstream:
+            monkeypatch.setenv("OPENAI_BASE_URL", upstream.base_url)
+            client = OpenAIClient(
+                resilience=ResiliencePolicy(max_retries=2, backoff_base=0.01),
+                limiter=gate,
+            )
+            await client.agenerate_response("What is FastAPI?")
+            await client.aclose()
+
+        assert upstream.requests == 3
+        assert gate.admitted == 1
+        assert gate.extra == 2
+        assert gate.requests.level == 7
+
+
+class TestRateLimitedEndpoint:
+    @pytest.fixture(autouse=True)
+    def retriever(self, file_store):
+        # Keeps the app's own FileStore (and its files.db) out of ./uploads
+        app.dependency_overrides[get_retriever] = lambda: DocumentRetriever(file_store)
+        yield
+        app.dependency_overrides.clear()
+
+    def test_ask_returns_429_with_retry_after_when_queue_is_full(self):
+        mock_openai_client = MagicMock()
+        mock_openai_client.acomplete = AsyncMock(
+            side_effect=RateLimited(3.2, "Too many requests waiting for the upstream")
+        )
+        app.dependency_overrides[get_openai_client] = lambda: mock_openai_client
+        app.dependency_overrides[get_question_store] = lambda: MemoryQuestionStore()
+
+        response = TestClient(app).post(
+            "/api/v1/ask",
+            json={"question": "What is FastAPI?"},
+            headers={"X-Client-Id": "tenant-a"},
+        )
+
+        assert response.status_code == 429
+        assert response.headers["Retry-After"] == "3"
+
+    def test_client_id_header_reaches_the_limiter(self):
+        seen = []
+
+        async def acomplete(prompt, context=None):
+            seen.append(current_client.get())
+            return Completion(text="Answer", model="gpt-3.5-turbo")
+
+        mock_openai_client = MagicMock()
+        mock_openai_client.acomplete = acomplete
+        app.dependency_overrides[get_openai_client] = lambda: mock_openai_client
+        app.dependency_overrides[get_question_store] = lambda: MemoryQuestionStore()
+
+        TestClient(app).post(
+            "/api/v1/ask",
+            json={"question": "What is FastAPI?"},
+            headers={"X-Client-Id": "tenant-a"},
+        )
+        TestClient(app).post("/api/v1/ask", json={"question": "What is FastAPI?"})
+
+        assert seen == ["tenant-a", "testclient"]
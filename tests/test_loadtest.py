@@ -0,0 +1,199 @@
+import random
+import statistics
+import time
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+from unittest.mock import AsyncMock, MagicMock
+from app.clients import get_openai_client, get_question_store, get_retriever
+from app.main import app
+from app.openai_client import Completion
+from app.retrieval import DocumentRetriever
+from app.storage import MemoryQuestionStore
+from benchmarks.loadtest import (
+    SCENARIOS,
+    Sample,
+    compare,
+    percentile,
+    run_scenario,
+    summarize,
+)
+from benchmarks.mock_upstream import create_mock_app, sample_latency
+
+
+class TestMockUpstream:
+    @pytest.mark.parametrize("distribution", ["uniform", "exponential", "lognormal"])
+    def test_distributions_keep_the_mean(self, distribution):
+        rng = random.Random(1)
+
+        samples = [sample_latency(rng, 0.1, distribution) for _ in range(20000)]
+
+        assert statistics.mean(samples) == pytest.approx(0.1, rel=0.05)
+        assert min(samples) >= 0
+
+    def test_lognormal_tail_grows_with_sigma(self):
+        def p99(sigma):
+            rng = random.Random(1)
+            samples = [
+                sample_latency(rng, 0.1, "lognormal", sigma) for _ in range(5000)
+            ]
+            return percentile(samples, 99)
+
+        assert p99(1.0) > p99(0.25)
+
+    def test_fixed_and_unknown(self):
+        assert sample_latency(random.Random(), 0.2) == 0.2
+        with pytest.raises(ValueError):
+            create_mock_app(latency_distribution="pareto")
+
+    def test_answer_tokens_and_token_rate(self):
+        client = TestClient(create_mock_app(answer_tokens=20, tokens_per_second=400))
+
+        start = time.perf_counter()
+        response = client.post("/v1/chat/completions", json={"model": "m"})
+        elapsed = time.perf_counter() - start
+
+        body = response.json()
+        assert body["choices"][0]["message"]["content"] == " ".join(["mock"] * 20)
+        assert body["usage"]["completion_tokens"] == 20
+        assert elapsed >= 19 / 400
+
+    def test_streamed_answer(self):
+        client = TestClient(create_mock_app(answer_tokens=3))
+
+        response = client.post(
+            "/v1/chat/completions", json={"model": "m", "stream": True}
+        )
+
+        events = [
+            line.removeprefix("data: ")
+            for line in response.text.splitlines()
+            if line.startswith("data: ")
+        ]
+        assert response.headers["content-type"].startswith("text/event-stream")
+        assert events[-1] == "[DONE]"
+        assert '"content": " mock"' in events[2]
+        assert len(events) == 6
+
+
+class TestReport:
+    def test_percentile_nearest_rank(self):
+        values = list(range(1, 101))
+
+        assert percentile(values, 50) == 50
+        assert percentile(values, 99) == 99
+        assert percentile(values, 100) == 100
+        assert percentile([], 95) == 0.0
+
+    def test_summarize_ignores_failures_for_latency(self):
+        samples = [Sample(0.1, 0.05, True)] * 9 + [Sample(5.0, 5.0, False)]
+
+        result = summarize(samples, elapsed=2.0)
+
+        assert result["errors"] == 1
+        assert result["error_rate"] == 0.1
+        assert result["rps"] == 4.5
+        assert result["p99_ms"] == pytest.approx(100)
+        assert result["ttfb_p50_ms"] == pytest.approx(50)
+
+
+class TestCompare:
+    baseline = {
+        "ask": {
+            "p50_ms": 100.0,
+            "p95_ms": 200.0,
+            "p99_ms": 300.0,
+            "rps": 50.0,
+            "error_rate": 0.0,
+            "peak_rss_mb": 90.0,
+        }
+    }
+
+    def result(self, **changes):
+        return {"ask": {**self.baseline["ask"], **changes}}
+
+    def test_within_tolerance(self):
+        results = self.result(p95_ms=230.0, rps=42.0, p99_ms=900.0)
+
+        assert compare(results, self.baseline, tolerance=0.2) == []
+
+    def test_slower_latency(self):
+        (regression,) = compare(self.result(p95_ms=260.0), self.baseline, 0.2)
+
+        assert regression.startswith("ask: p95_ms 260.0 vs baseline 200.0")
+
+    def test_lower_throughput_and_more_errors(self):
+        results = self.result(rps=30.0, error_rate=0.05)
+
+        regressions = compare(results, self.baseline, 0.2)
+
+        assert len(regressions) == 2
+        assert regressions[0].startswith("ask: rps")
+
+    def test_more_memory(self):
+        assert compare(self.result(peak_rss_mb=150.0), self.baseline, 0.2)
+
+    def test_scenarios_not_run_are_skipped(self):
+        assert compare({}, self.baseline, 0.2) == []
+
+
+class TestScenarios:
+    def setup_method(self):
+        self.store = MemoryQuestionStore()
+
+        async def astream(prompt, context=None):
+            yield "Partial"
+            raise Exception("Upstream went away")
+
+        openai_client = MagicMock()
+        openai_client.acomplete = AsyncMock(
+            return_value=Completion(text="Answer", model="gpt-3.5-turbo")
+        )
+        openai_client.astream = astream
+        app.dependency_overrides[get_question_store] = lambda: self.store
+        app.dependency_overrides[get_openai_client] = lambda: openai_client
+
+    @pytest.fixture(autouse=True)
+    def retriever(self, file_store):
+        # Keeps the app's own FileStore (and its files.db) out of ./uploads
+        app.dependency_overrides[get_retriever] = lambda: DocumentRetriever(file_store)
+
+    def teardown_method(self):
+        app.dependency_overrides.clear()
+
+    def client(self):
+        transport = httpx.ASGITransport(app=app)
+        return httpx.AsyncClient(transport=transport, base_url="http://test")
+
+    @pytest.mark.asyncio
+    async def test_ask_scenario(self):
+        async with self.client() as client:
+            result = await run_scenario(
+                client, SCENARIOS["ask"], concurrency=4, requests=20, warmup=2
+            )
+
+        assert result["requests"] == 20
+        assert result["errors"] == 0
+        assert result["rps"] > 0
+        assert result["p50_ms"] <= result["p95_ms"] <= result["p99_ms"]
+        # Warm-up requests reach the app but are not counted
+        assert len(self.store.list_questions()) == 22
+
+    @pytest.mark.asyncio
+    async def test_questions_scenario(self):
+        async with self.client() as client:
+            result = await run_scenario(
+                client, SCENARIOS["questions"], concurrency=2, requests=10
+            )
+
+        assert result["errors"] == 0
+
+    @pytest.mark.asyncio
+    async def test_failed_stream_counts_as_an_error(self):
+        async with self.client() as client:
+            result = await run_scenario(
+                client, SCENARIOS["ask_stream"], concurrency=1, requests=3
+            )
+
+        # Each stream starts with a 200 but ends in an error event
+        assert result["errors"] == 3
@@ -0,0 +1,164 @@
+import threading
+import pytest
+from fastapi import APIRouter, FastAPI
+from fastapi.testclient import TestClient
+from app.providers import Backend, BackendRouter
+from app.metrics import (
+    Counter,
+    Gauge,
+    Histogram,
+    HTTP_DURATION,
+    HTTP_IN_FLIGHT,
+    HTTP_REQUESTS,
+    LLM_DURATION,
+    MetricsMiddleware,
+    MetricsRegistry,
+    render_family,
+)
+
+
+def samples(metric):
+    return {
+        (name, tuple(sorted(labels.items()))): value
+        for name, labels, value in metric.samples()
+    }
+
+
+class TestMetricTypes:
+    def test_counter_with_labels(self):
+        counter = Counter("jobs_total", "Jobs", ["kind"], registry=MetricsRegistry())
+        counter.labels("a").inc()
+        counter.labels("a").inc(2)
+        counter.labels("b").inc()
+        assert samples(counter) == {
+            ("jobs_total", (("kind", "a"),)): 3,
+            ("jobs_total", (("kind", "b"),)): 1,
+        }
+
+    def test_wrong_label_count(self):
+        counter = Counter("jobs_total", "Jobs", ["kind"], registry=MetricsRegistry())
+        with pytest.raises(ValueError):
+            counter.labels("a", "b")
+
+    def test_gauge_goes_up_and_down(self):
+        gauge = Gauge("busy", "Busy workers", registry=MetricsRegistry())
+        gauge.inc()
+        gauge.inc()
+        gauge.dec()
+        assert samples(gauge) == {("busy", ()): 1}
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = Histogram(
+            "latency_seconds", "Latency", buckets=(0.1, 1.0), registry=MetricsRegistry()
+        )
+        for value in (0.05, 0.1, 0.5, 3.0):
+            histogram.observe(value)
+        assert samples(histogram) == {
+            ("latency_seconds_bucket", (("le", "0.1"),)): 2,
+            ("latency_seconds_bucket", (("le", "1"),)): 3,
+            ("latency_seconds_bucket", (("le", "+Inf"),)): 4,
+            ("latency_seconds_sum", ()): 3.65,
+            ("latency_seconds_count", ()): 4,
+        }
+
+    def test_no_updates_lost_across_threads(self):
+        counter = Counter("hits_total", "Hits", registry=MetricsRegistry())
+        histogram = Histogram(
+            "sizes", "Sizes", buckets=(10,), registry=MetricsRegistry()
+        )
+
+        def work():
+            for _ in range(10000):
+                counter.inc()
+                histogram.observe(1)
+
+        threads = [threading.Thread(target=work) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert samples(counter) == {("hits_total", ()): 80000}
+        assert samples(histogram)[("sizes_count", ())] == 80000
+
+
+class TestExposition:
+    def test_render_family(self):
+        text = render_family(
+            "cache_hit_ratio",
+            "gauge",
+            "Share of lookups that hit",
+            [("cache_hit_ratio", {"cache": 'ex"act\n'}, 0.75)],
+        )
+        assert text == (
+            "# HELP cache_hit_ratio Share of lookups that hit\n"
+            "# TYPE cache_hit_ratio gauge\n"
+            'cache_hit_ratio{cache="ex\\"act\\n"} 0.75\n'
+        )
+
+    def test_registry_renders_every_metric(self):
+        registry = MetricsRegistry()
+        Counter("a_total", "A", registry=registry).inc()
+        Gauge("b", "B", registry=registry)
+        text = registry.render()
+        assert "# TYPE a_total counter\na_total 1\n" in text
+        assert "# TYPE b gauge\n" in text
+
+
+class TestMetricsMiddleware:
+    def make_app(self):
+        router = APIRouter(prefix="/api")
+
+        async def item(item_id: str):
+            assert HTTP_IN_FLIGHT.labels("/api/items/{item_id}").value() == 1
+            return {"id": item_id}
+
+        router.add_api_route("/items/{item_id}", item, methods=["GET"])
+        app = FastAPI()
+        app.include_router(router)
+        app.add_middleware(MetricsMiddleware, routers=[router])
+        return app
+
+    def test_records_by_route_template(self):
+        client = TestClient(self.make_app())
+        route = "/api/items/{item_id}"
+        before = HTTP_REQUESTS.labels("GET", route, 200).value()
+
+        for item_id in ("1", "2", "3"):
+            assert client.get(f"/api/items/{item_id}").status_code == 200
+
+        assert HTTP_REQUESTS.labels("GET", route, 200).value() == before + 3
+        counts, _ = HTTP_DURATION.labels("GET", route).snapshot()
+        assert sum(counts) >= 3
+        assert HTTP_IN_FLIGHT.labels(route).value() == 0
+
+    def test_unknown_paths_share_one_label(self):
+        client = TestClient(self.make_app())
+        before = HTTP_REQUESTS.labels("GET", "unmatched", 404).value()
+
+        client.get("/nope/1")
+        client.get("/nope/2")
+
+        assert HTTP_REQUESTS.labels("GET", "unmatched", 404).value() == before + 2
+
+
+class TestUpstreamMetrics:
+    @pytest.mark.asyncio
+    async def test_router_records_latency_by_backend_and_outcome(self):
+        backend = Backend("metrics-test", "test-model")
+        ok = LLM_DURATION.labels("metrics-test", "test-model", "ok")
+        error = LLM_DURATION.labels("metrics-test", "test-model", "error")
+
+        async def succeed(chosen):
+            return "answer"
+
+        async def fail(chosen):
+            raise ValueError("bug")
+
+        routing = BackendRouter([backend])
+        await routing.call(succeed)
+        with pytest.raises(ValueError):
+            await routing.call(fail)
+
+        assert sum(ok.snapshot()[0]) == 1
+        assert sum(error.snapshot()[0]) == 1
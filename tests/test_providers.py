@@ -0,0 +1,235 @@
+import json
+import pytest
+from unittest.mock import MagicMock
+from app.openai_client import OpenAIClient
+from app.providers import (
+    Backend,
+    BackendHealth,
+    BackendRouter,
+    create_router,
+    load_backends,
+)
+from app.resilience import CircuitBreaker, ResiliencePolicy
+from app.settings import override_settings
+from benchmarks.mock_upstream import MockBackendSet
+from tests.fakes import FakeClock, StatusError
+
+
+def backend(name, latency=None, error_rate=0.0, clock=None):
+    health = BackendHealth(clock=clock or FakeClock())
+    health.latency = latency
+    health.error_rate = error_rate
+    return Backend(name, f"{name}-model", health=health)
+
+
+def router(*backends):
+    return BackendRouter(list(backends), explore_rate=0.0)
+
+
+class TestBackendHealth:
+    def test_latency_ewma(self):
+        health = BackendHealth(alpha=0.5)
+        health.record_success(1.0)
+        assert health.latency == 1.0
+        health.record_success(3.0)
+        assert health.latency == 2.0
+
+    def test_errors_raise_the_score(self):
+        health = BackendHealth(alpha=0.5, error_penalty=4)
+        health.record_success(1.0)
+        health.record_failure()
+        assert health.error_rate == 0.5
+        assert health.score() == 3.0
+
+    def test_ejected_after_consecutive_failures(self):
+        clock = FakeClock()
+        health = BackendHealth(eject_failures=2, eject_seconds=30, clock=clock)
+        health.record_failure()
+        assert health.available()
+        health.record_failure()
+        assert not health.available()
+        clock.now = 30
+        assert health.available()
+
+    def test_success_resets_consecutive_failures(self):
+        health = BackendHealth(eject_failures=2)
+        health.record_failure()
+        health.record_success(0.1)
+        health.record_failure()
+        assert health.available()
+
+
+class TestBackendRouter:
+    def test_prefers_the_lowest_score(self):
+        fast = backend("fast", latency=0.1)
+        slow = backend("slow", latency=0.5)
+        flaky = backend("flaky", latency=0.2, error_rate=0.5)
+        assert router(slow, flaky, fast).candidates() == [fast, slow, flaky]
+
+    def test_unmeasured_backends_go_first(self):
+        measured = backend("measured", latency=0.1)
+        new = backend("new")
+        assert router(measured, new).candidates()[0] is new
+
+    def test_ejected_backends_go_last(self):
+        clock = FakeClock()
+        sick = backend("sick", latency=0.01, clock=clock)
+        sick.health.ejected_until = 10
+        healthy = backend("healthy", latency=1.0, clock=clock)
+        assert router(sick, healthy).candidates() == [healthy, sick]
+
+    def test_exploration_moves_another_backend_first(self):
+        fast = backend("fast", latency=0.1)
+        slow = backend("slow", latency=0.5)
+        rng = MagicMock()
+        rng.random.return_value = 0.0
+        rng.randrange.return_value = 1
+        explorer = BackendRouter([fast, slow], explore_rate=0.1, rng=rng)
+        assert explorer.candidates() == [slow, fast]
+
+    @pytest.mark.asyncio
+    async def test_fails_over_on_retryable_errors(self):
+        first = backend("first", latency=0.1)
+        second = backend("second", latency=0.2)
+        routing = router(first, second)
+
+        async def call(chosen):
+            if chosen is first:
+                raise StatusError(503)
+            return chosen.model
+
+        assert await routing.call(call) == ("second-model", second)
+        assert first.health.errors == 1
+        assert second.health.calls == 1
+        assert routing.failovers == 1
+
+    @pytest.mark.asyncio
+    async def test_client_errors_do_not_fail_over(self):
+        first = backend("first", latency=0.1)
+        second = backend("second", latency=0.2)
+
+        async def call(chosen):
+            raise StatusError(400)
+
+        with pytest.raises(StatusError):
+            await router(first, second).call(call)
+        assert first.health.errors == 0
+        assert second.health.calls == 0
+
+    @pytest.mark.asyncio
+    async def test_raises_when_every_backend_fails(self):
+        async def call(chosen):
+            raise StatusError(502)
+
+        with pytest.raises(StatusError):
+            await router(backend("a"), backend("b")).call(call)
+
+    def test_needs_a_backend(self):
+        with pytest.raises(ValueError):
+            BackendRouter([])
+
+
+class TestLoadBackends:
+    def test_parses_each_kind(self, monkeypatch):
+        monkeypatch.setenv("AZURE_OPENAI_API_KEY", "azure-key")
+        backends = load_backends(
+            json.dumps(
+                [
+                    {"name": "primary", "model": "gpt-4o-mini"},
+                    {
+                        "name": "azure-east",
+                        "kind": "azure",
+                        "model": "gpt35-deployment",
+                        "base_url": "https://east.openai.azure.com",
+                        "api_key_env": "AZURE_OPENAI_API_KEY",
+                        "api_version": "2024-02-01",
+                    },
+                    {
+                        "kind": "local",
+                        "model": "llama3",
+                        "base_url": "http://127.0.0.1:11434/v1",
+                        "api_key_env": "UNSET_LOCAL_KEY",
+                    },
+                ]
+            )
+        )
+
+        assert [b.name for b in backends] == ["primary", "azure-east", "local-2"]
+        assert backends[1].api_key == "azure-key"
+        assert backends[2].api_key == "not-needed"
+        assert backends[1].client.__class__.__name__ == "AsyncAzureOpenAI"
+
+    def test_rejects_bad_config(self, monkeypatch):
+        monkeypatch.delenv("MISSING_KEY", raising=False)
+        with pytest.raises(ValueError, match="not valid JSON"):
+            load_backends("[{")
+        with pytest.raises(ValueError, match="needs a model"):
+            load_backends('[{"name": "x"}]')
+        with pytest.raises(ValueError, match="MISSING_KEY is not set"):
+            load_backends('[{"model": "m", "api_key_env": "MISSING_KEY"}]')
+        with pytest.raises(ValueError, match="Unknown backend kind"):
+            load_backends('[{"model": "m", "kind": "bedrock"}]')
+        with pytest.raises(ValueError, match="needs a base_url"):
+            load_backends('[{"model": "m", "kind": "azure"}]')
+
+    def test_default_router_without_config(self):
+        default = Backend("openai", "gpt-3.5-turbo")
+        with override_settings(llm_backends=""):
+            assert create_router(default).backends == [default]
+
+
+class TestRoutingAgainstMockBackends:
+    def make_client(self, mocks):
+        return OpenAIClient(
+            router=BackendRouter(mocks.backends(), explore_rate=0.0),
+            resilience=ResiliencePolicy(
+                max_retries=0, breaker=CircuitBreaker(failure_threshold=100)
+            ),
+        )
+
+    @pytest.mark.asyncio
+    async def test_traffic_moves_to_the_faster_backend(self):
+        specs = {
+            "slow": {"kind": "azure", "model": "gpt35-deployment", "latency": 0.2},
+            "fast": {"kind": "local", "model": "llama3"},
+        }
+        with MockBackendSet(specs) as mocks:
+            client = self.make_client(mocks)
+            models = [
+                (await client.acomplete(f"Question {i}")).model for i in range(10)
+            ]
+            await client.aclose()
+
+        # Both are tried once, then the faster one takes the traffic
+        assert sorted(models[:2]) == ["gpt35-deployment", "llama3"]
+        assert set(models[2:]) == {"llama3"}
+        assert mocks.upstreams["slow"].requests == 1
+
+    @pytest.mark.asyncio
+    async def test_sick_backend_is_failed_over_and_ejected(self):
+        specs = {
+            "broken": {"model": "broken-model", "error_rate": 1.0},
+            "healthy": {"model": "healthy-model", "latency": 0.05},
+        }
+        with MockBackendSet(specs) as mocks:
+            client = self.make_client(mocks)
+            for i in range(6):
+                completion = await client.acomplete(f"Question {i}")
+                assert completion.model == "healthy-model"
+            stats = client.router.stats()
+            await client.aclose()
+
+        assert mocks.upstreams["broken"].requests == 3
+        assert stats["failovers"] == 3
+        assert stats["backends"][0]["available"] is False
+
+    @pytest.mark.asyncio
+    async def test_config_points_at_the_mocks(self):
+        with MockBackendSet({"local": {"model": "llama3"}}) as mocks:
+            with override_settings(llm_backends=mocks.config()):
+                client = OpenAIClient()
+            completion = await client.acomplete("What is FastAPI?")
+            await client.aclose()
+
+        assert completion.model == "llama3"
+        assert client.router.backends[0].name == "local"
@@ -0,0 +1,260 @@
+import asyncio
+import httpx
+import pytest
+from unittest.mock import patch
+from app.openai_client import OpenAIClient
+from app.resilience import (
+    CircuitBreaker,
+    CircuitOpen,
+    ResiliencePolicy,
+    UpstreamError,
+    UpstreamTimeout,
+    as_upstream_error,
+    is_retryable,
+    retry_after,
+)
+from benchmarks.mock_upstream import MockUpstream
+from tests.fakes import FakeClock, StatusError
+
+
+def make_policy(**kwargs):
+    options = dict(
+        attempt_timeout=1.0,
+        total_timeout=5.0,
+        max_retries=3,
+        backoff_base=0.001,
+        backoff_max=0.01,
+        breaker=CircuitBreaker(failure_threshold=100),
+    )
+    options.update(kwargs)
+    return ResiliencePolicy(**options)
+
+
+def flaky(*outcomes):
+    # Each call pops the next outcome: an exception is raised, anything else
+    # is returned
+    calls = []
+
+    async def call():
+        calls.append(1)
+        outcome = outcomes[len(calls) - 1]
+        if isinstance(outcome, Exception):
+            raise outcome
+        if outcome == "hang":
+            await asyncio.sleep(10)
+        return outcome
+
+    return call, calls
+
+
+class TestRetryAfter:
+    def test_seconds(self):
+        assert retry_after(StatusError(429, {"Retry-After": "2"})) == 2.0
+
+    def test_milliseconds_header_wins(self):
+        error = StatusError(429, {"Retry-After": "2", "retry-after-ms": "250"})
+        assert retry_after(error) == 0.25
+
+    def test_http_date_in_the_past_is_zero(self):
+        error = StatusError(503, {"Retry-After": "Wed, 21 Oct 2015 07:28:00 GMT"})
+        assert retry_after(error) == 0.0
+
+    def test_missing_or_garbage(self):
+        assert retry_after(StatusError(503)) is None
+        assert retry_after(StatusError(503, {"Retry-After": "soon"})) is None
+        assert retry_after(ValueError("no response")) is None
+
+
+class TestClassification:
+    def test_retryable_statuses(self):
+        assert is_retryable(StatusError(429))
+        assert is_retryable(StatusError(503))
+        assert not is_retryable(StatusError(400))
+        assert not is_retryable(ValueError("bug"))
+        assert is_retryable(httpx.ConnectError("refused"))
+
+    def test_rate_limit_keeps_status_and_retry_after(self):
+        error = as_upstream_error(StatusError(429, {"Retry-After": "3"}))
+        assert error.status_code == 429
+        assert error.retry_after == 3.0
+
+    def test_other_errors_become_bad_gateway(self):
+        error = as_upstream_error(StatusError(500))
+        assert error.status_code == 502
+        assert str(error).startswith("OpenAI API error:")
+
+
+class TestCircuitBreaker:
+    def test_opens_after_threshold_and_fails_fast(self):
+        breaker = CircuitBreaker(
+            failure_threshold=2, reset_timeout=10, clock=FakeClock()
+        )
+        breaker.before_call()
+        breaker.record_failure()
+        assert breaker.state == "closed"
+        breaker.record_failure()
+        assert breaker.state == "open"
+        with pytest.raises(CircuitOpen) as exc_info:
+            breaker.before_call()
+        assert exc_info.value.status_code == 503
+        assert exc_info.value.retry_after == 10
+
+    def test_success_resets_failure_count(self):
+        breaker = CircuitBreaker(failure_threshold=2, clock=FakeClock())
+        breaker.record_failure()
+        breaker.record_success()
+        breaker.record_failure()
+        assert breaker.state == "closed"
+
+    def test_half_open_lets_a_single_probe_through(self):
+        clock = FakeClock()
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10, clock=clock)
+        breaker.record_failure()
+        clock.now = 10
+        breaker.before_call()
+        assert breaker.state == "half_open"
+        with pytest.raises(CircuitOpen):
+            breaker.before_call()
+
+        breaker.record_success()
+        assert breaker.state == "closed"
+        breaker.before_call()
+
+    def test_failed_probe_reopens(self):
+        clock = FakeClock()
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10, clock=clock)
+        breaker.record_failure()
+        clock.now = 10
+        breaker.before_call()
+        breaker.record_failure()
+        assert breaker.state == "open"
+        assert breaker.opened == 2
+        with pytest.raises(CircuitOpen):
+            breaker.before_call()
+
+    def test_released_probe_frees_the_slot(self):
+        clock = FakeClock()
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10, clock=clock)
+        breaker.record_failure()
+        clock.now = 10
+        breaker.before_call()
+        breaker.release()
+        breaker.before_call()
+
+
+class TestResiliencePolicy:
+    @pytest.mark.asyncio
+    async def test_retries_retryable_errors(self):
+        call, calls = flaky(StatusError(503), StatusError(429), "ok")
+        policy = make_policy()
+        assert await policy.run(call) == "ok"
+        assert len(calls) == 3
+        assert policy.retries == 2
+
+    @pytest.mark.asyncio
+    async def test_does_not_retry_client_errors(self):
+        call, calls = flaky(StatusError(400), "ok")
+        with pytest.raises(StatusError):
+            await make_policy().run(call)
+        assert len(calls) == 1
+
+    @pytest.mark.asyncio
+    async def test_gives_up_after_max_retries(self):
+        call, calls = flaky(*[StatusError(503)] * 5)
+        with pytest.raises(StatusError):
+            await make_policy(max_retries=2).run(call)
+        assert len(calls) == 3
+
+    @pytest.mark.asyncio
+    async def test_attempt_timeout_is_retried(self):
+        call, calls = flaky("hang", "ok")
+        policy = make_policy(attempt_timeout=0.05)
+        assert await policy.run(call) == "ok"
+        assert policy.timeouts == 1
+
+    @pytest.mark.asyncio
+    async def test_total_deadline_caps_the_attempts(self):
+        call, calls = flaky(*["hang"] * 10)
+        policy = make_policy(attempt_timeout=0.05, total_timeout=0.12, max_retries=10)
+        with pytest.raises(UpstreamTimeout) as exc_info:
+            await policy.run(call)
+        assert exc_info.value.status_code == 504
+        assert len(calls) < 4
+
+    @pytest.mark.asyncio
+    async def test_honors_retry_after(self):
+        call, _ = flaky(StatusError(429, {"Retry-After": "1.5"}), "ok")
+        with patch("app.resilience.asyncio.sleep") as sleep:
+            await make_policy().run(call)
+        sleep.assert_called_once_with(1.5)
+
+    @pytest.mark.asyncio
+    async def test_retry_after_past_the_deadline_is_not_waited_for(self):
+        call, calls = flaky(StatusError(429, {"Retry-After": "30"}), "ok")
+        with pytest.raises(StatusError):
+            await make_policy(total_timeout=1.0).run(call)
+        assert len(calls) == 1
+
+    @pytest.mark.asyncio
+    async def test_open_breaker_fails_fast(self):
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+        policy = make_policy(max_retries=5, breaker=breaker)
+        call, calls = flaky(*[StatusError(503)] * 10)
+        with pytest.raises(CircuitOpen):
+            await policy.run(call)
+        assert len(calls) == 2
+        assert policy.stats()["breaker_state"] == "open"
+
+
+class TestAgainstMockUpstream:
+    def make_client(self, upstream, monkeypatch, **policy):
+        monkeypatch.setenv("OPENAI_BASE_URL", upstream.base_url)
+        return OpenAIClient(resilience=make_policy(**policy))
+
+    @pytest.mark.asyncio
+    async def test_recovers_from_injected_errors(self, monkeypatch):
+        faults = [{"status": 503}, {"status": 500}]
+        with MockUpstream(port=0, faults=faults) as upstream:
+            client = self.make_client(upstream, monkeypatch)
+            result = await client.agenerate_response("What is FastAPI?")
+            await client.aclose()
+        assert result == "Mock answer"
+        assert upstream.requests == 3
+
+    @pytest.mark.asyncio
+    async def test_slow_attempt_is_abandoned_and_retried(self, monkeypatch):
+        with MockUpstream(port=0, faults=[{"latency": 2.0}]) as upstream:
+            client = self.make_client(upstream, monkeypatch, attempt_timeout=0.3)
+            result = await client.agenerate_response("What is FastAPI?")
+            await client.aclose()
+        assert result == "Mock answer"
+        assert client.resilience.timeouts == 1
+
+    @pytest.mark.asyncio
+    async def test_rate_limit_surfaces_as_429(self, monkeypatch):
+        faults = [{"status": 429, "retry_after": 30}]
+        with MockUpstream(port=0, faults=faults) as upstream:
+            client = self.make_client(upstream, monkeypatch)
+            with pytest.raises(UpstreamError) as exc_info:
+                await client.agenerate_response("What is FastAPI?")
+            await client.aclose()
+        assert exc_info.value.status_code == 429
+        assert exc_info.value.retry_after == 30
+        assert upstream.requests == 1
+
+    @pytest.mark.asyncio
+    async def test_breaker_stops_calling_a_failing_upstream(self, monkeypatch):
+        with MockUpstream(port=0, error_rate=1.0) as upstream:
+            client = self.make_client(
+                upstream,
+                monkeypatch,
+                max_retries=0,
+                breaker=CircuitBreaker(failure_threshold=3, reset_timeout=60),
+            )
+            for _ in range(3):
+                with pytest.raises(UpstreamError):
+                    await client.agenerate_response("What is FastAPI?")
+            with pytest.raises(CircuitOpen):
+                await client.agenerate_response("What is FastAPI?")
+            await client.aclose()
+        assert upstream.requests == 3
@@ -0,0 +1,96 @@
+import hashlib
+import json
+from app.retrieval import (
+    DocumentIndex,
+    DocumentRetriever,
+    chunk_pages,
+    format_excerpts,
+)
+
+
+def store_text(file_store, pages, content=b"%PDF-1.4 doc", file_id="a"):
+    digest = hashlib.sha256(content).hexdigest()
+    path = file_store.temp_path()
+    with open(path, "wb") as f:
+        f.write(content)
+    file_store.add(file_id, "doc.pdf", digest, len(content), path)
+    file_store.save_text(digest, pages, chunk_pages(pages))
+    return digest
+
+
+class TestChunkPages:
+    def test_overlapping_windows_stay_within_a_page(self):
+        words = [f"w{i}" for i in range(10)]
+        chunks = chunk_pages([" ".join(words), "short page"], chunk_words=4, overlap=1)
+
+        assert chunks == [
+            {"page": 1, "text": "w0 w1 w2 w3"},
+            {"page": 1, "text": "w3 w4 w5 w6"},
+            {"page": 1, "text": "w6 w7 w8 w9"},
+            {"page": 2, "text": "short page"},
+        ]
+
+    def test_empty_pages_produce_no_chunks(self):
+        assert chunk_pages(["", "   "]) == []
+
+
+class TestDocumentIndex:
+    def test_top_k_returns_best_chunks_in_document_order(self):
+        index = DocumentIndex(
+            [
+                {"page": 1, "text": "FastAPI is a Python web framework"},
+                {"page": 2, "text": "Bread needs flour water and yeast"},
+                {"page": 3, "text": "FastAPI uses Python type hints everywhere"},
+            ]
+        )
+
+        chunks = index.top_k("python type hints", k=2)
+
+        assert [chunk["page"] for chunk in chunks] == [1, 3]
+        assert chunks[1]["score"] > chunks[0]["score"]
+
+    def test_no_matching_terms(self):
+        index = DocumentIndex([{"page": 1, "text": "FastAPI"}])
+
+        assert index.top_k("sourdough") == []
+
+
+class TestDocumentRetriever:
+    def test_retrieve_from_stored_chunks(self, file_store):
+        digest = store_text(
+            file_store, ["Intro to FastAPI.", "Routing uses path operations."]
+        )
+        retriever = DocumentRetriever(file_store)
+
+        chunks = retriever.retrieve(digest, "How does routing work?")
+
+        assert [chunk["page"] for chunk in chunks] == [2]
+
+    def test_not_extracted_yet(self, file_store):
+        assert DocumentRetriever(file_store).retrieve("0" * 64, "anything") is None
+
+    def test_keeps_recently_used_indexes(self, file_store):
+        first = store_text(file_store, ["alpha"], b"%PDF first", "a")
+        second = store_text(file_store, ["beta"], b"%PDF second", "b")
+        retriever = DocumentRetriever(file_store, max_documents=1)
+
+        index = retriever.index(first)
+        assert retriever.index(first) is index
+
+        retriever.index(second)
+        assert retriever.index(first) is not index
+
+    def test_chunks_text_extracted_before_retrieval(self, file_store):
+        digest = store_text(file_store, ["legacy text about FastAPI"])
+        with open(file_store.text_path(digest), "w", encoding="utf-8") as f:
+            json.dump({"pages": ["legacy text about FastAPI"]}, f)
+
+        chunks = DocumentRetriever(file_store).retrieve(digest, "fastapi")
+
+        assert chunks[0]["text"] == "legacy text about FastAPI"
+
+
+def test_format_excerpts_cites_pages():
+    text = format_excerpts("doc.pdf", [{"page": 3, "text": "Hello"}])
+
+    assert text == "Excerpts from doc.pdf:\n\n[page 3] Hello"
@@ -0,0 +1,89 @@
+from app.search import InvertedIndex, fts5_query, tokenize
+
+
+class TestTokenize:
+    def test_lowercases_and_splits_on_punctuation(self):
+        assert tokenize("What's FastAPI? A web-framework!") == [
+            "what",
+            "s",
+            "fastapi",
+            "a",
+            "web",
+            "framework",
+        ]
+
+    def test_empty(self):
+        assert tokenize("") == []
+        assert tokenize(None) == []
+
+    def test_fts5_query_quotes_tokens(self):
+        assert fts5_query('fastapi OR "drop" NEAR(x)') == (
+            '"fastapi" "or" "drop" "near" "x"'
+        )
+
+
+class TestInvertedIndex:
+    def build(self):
+        index = InvertedIndex()
+        index.add(1, "FastAPI is a Python web framework")
+        index.add(2, "Django is a Python web framework with batteries included")
+        index.add(3, "Bread needs flour, water, salt and yeast")
+        index.add(4, "FastAPI FastAPI FastAPI performance tips")
+        return index
+
+    def test_requires_every_term(self):
+        index = self.build()
+
+        assert [doc for doc, _ in index.search("python framework")] == [1, 2]
+        assert index.search("python bread") == []
+        assert index.search("unknown") == []
+        assert index.search("") == []
+
+    def test_match_any_term(self):
+        index = self.build()
+
+        results = index.search("python bread yeast", match_all=False)
+
+        # The document matching two rare terms outranks single-term matches
+        assert [doc for doc, _ in results] == [3, 1, 2]
+        assert index.search("unknown", match_all=False) == []
+
+    def test_ranks_by_bm25(self):
+        index = self.build()
+
+        results = index.search("fastapi")
+
+        assert [doc for doc, _ in results] == [4, 1]
+        assert results[0][1] > results[1][1] > 0
+
+    def test_rare_terms_weigh_more(self):
+        index = self.build()
+
+        results = index.search("web framework django")
+
+        assert [doc for doc, _ in results] == [2]
+
+    def test_pagination(self):
+        index = InvertedIndex()
+        for doc_id in range(10):
+            index.add(doc_id, "python " * (doc_id + 1))
+
+        first = index.search("python", limit=3)
+        second = index.search("python", limit=3, offset=3)
+
+        assert len(first) == 3
+        assert len(second) == 3
+        assert not {d for d, _ in first} & {d for d, _ in second}
+
+    def test_remove_and_clear(self):
+        index = self.build()
+
+        index.remove(4)
+        index.remove(99)
+
+        assert [doc for doc, _ in index.search("fastapi")] == [1]
+        assert len(index) == 3
+
+        index.clear()
+        assert index.search("python") == []
+        assert len(index) == 0
@@ -0,0 +1,200 @@
+import numpy as np
+import pytest
+from app.semantic_cache import HashingEmbedder, SemanticCache, VectorIndex
+
+
+def unit_vectors(n, dim, seed=0):
+    vectors = np.random.default_rng(seed).standard_normal((n, dim))
+    vectors = vectors.astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+class TestHashingEmbedder:
+    @pytest.mark.asyncio
+    async def test_embeddings_are_deterministic_unit_vectors(self):
+        embedder = HashingEmbedder(dim=64)
+
+        first = await embedder.embed(["What is FastAPI?"])
+        second = await HashingEmbedder(dim=64).embed(["What is FastAPI?"])
+
+        assert first.shape == (1, 64)
+        assert np.allclose(first, second)
+        assert np.isclose(np.linalg.norm(first[0]), 1.0)
+
+    @pytest.mark.asyncio
+    async def test_paraphrases_are_closer_than_unrelated_questions(self):
+        embedder = HashingEmbedder()
+
+        vectors = await embedder.embed(
+            ["What is FastAPI?", "what's fastapi", "How do I bake bread?"]
+        )
+        scores = vectors @ vectors[0]
+
+        assert scores[1] > 0.99
+        assert scores[2] < 0.5
+
+
+class TestVectorIndex:
+    def test_flat_search_finds_nearest_rows_in_batch(self):
+        vectors = unit_vectors(1000, 32)
+        index = VectorIndex(32, capacity=1000, chunk_size=128)
+        for vector in vectors:
+            index.add(vector)
+
+        slots, scores = index.search(vectors[[3, 500, 999]])
+
+        assert slots.tolist() == [3, 500, 999]
+        assert np.allclose(scores, 1.0)
+
+    def test_empty_index_returns_no_match(self):
+        index = VectorIndex(8, capacity=4)
+
+        slots, scores = index.search(unit_vectors(1, 8))
+
+        assert slots.tolist() == [-1]
+        assert scores[0] == -np.inf
+
+    def test_capacity_evicts_least_recently_used(self):
+        vectors = unit_vectors(4, 16)
+        index = VectorIndex(16, capacity=3)
+        for vector in vectors[:3]:
+            index.add(vector)
+
+        index.search(vectors[0])
+        slot, evicted = index.add(vectors[3])
+
+        assert evicted == 1
+        assert slot == 1
+        assert len(index) == 3
+
+    def test_removed_slots_are_skipped_and_reused(self):
+        vectors = unit_vectors(3, 16)
+        index = VectorIndex(16, capacity=3)
+        for vector in vectors:
+            index.add(vector)
+
+        index.remove(1)
+        slots, _ = index.search(vectors[1])
+
+        assert slots[0] != 1
+        assert len(index) == 2
+        assert index.add(vectors[1]) == (1, None)
+
+    def test_ivf_trains_and_keeps_recall(self):
+        vectors = unit_vectors(4000, 32)
+        index = VectorIndex(
+            32, capacity=4000, mode="ivf", n_lists=16, n_probe=4, train_size=2000
+        )
+        for vector in vectors:
+            index.add(vector)
+
+        assert index.trained
+
+        queries = vectors[:200] + 0.05 * unit_vectors(200, 32, seed=1)
+        slots, _ = index.search(queries)
+
+        assert np.mean(slots == np.arange(200)) > 0.9
+
+    def test_ivf_handles_eviction_after_training(self):
+        vectors = unit_vectors(600, 16)
+        index = VectorIndex(
+            16, capacity=400, mode="ivf", n_lists=8, n_probe=8, train_size=200
+        )
+        for vector in vectors:
+            index.add(vector)
+
+        slots, scores = index.search(vectors[-50:])
+
+        assert len(index) == 400
+        assert np.allclose(scores, 1.0, atol=1e-5)
+        assert all(
+            np.allclose(index._vectors[s], v) for s, v in zip(slots, vectors[-50:])
+        )
+
+    @pytest.mark.parametrize("mode", ["flat", "ivf"])
+    def test_search_is_restricted_to_label(self, mode):
+        vectors = unit_vectors(400, 16)
+        index = VectorIndex(
+            16, capacity=400, mode=mode, n_lists=4, n_probe=4, train_size=200
+        )
+        for i, vector in enumerate(vectors):
+            index.add(vector, label=i % 2)
+
+        slots, _ = index.search(vectors[[10, 11]], label=1)
+
+        assert slots[0] != 10
+        assert index._labels[slots[0]] == 1
+        assert slots[1] == 11
+        assert index.search(vectors[10], label=7)[0].tolist() == [-1]
+
+    def test_rejects_unknown_mode(self):
+        with pytest.raises(ValueError, match="Unknown index mode"):
+            VectorIndex(8, capacity=4, mode="hnsw")
+
+
+class TestSemanticCache:
+    @pytest.mark.asyncio
+    async def test_paraphrase_hits_cached_answer(self):
+        cache = SemanticCache(HashingEmbedder(), threshold=0.9, index_mode="flat")
+
+        await cache.set("gpt-3.5-turbo", "What is FastAPI?", None, {"text": "Web"})
+        hit = await cache.get("gpt-3.5-turbo", "what's fastapi")
+
+        assert hit == {"text": "Web", "model": "gpt-3.5-turbo"}
+        assert cache.stats()["hits"] == 1
+
+    @pytest.mark.asyncio
+    async def test_misses_below_threshold_or_for_other_model(self):
+        cache = SemanticCache(HashingEmbedder(), threshold=0.9, index_mode="flat")
+
+        assert await cache.get("gpt-3.5-turbo", "What is FastAPI?") is None
+
+        await cache.set("gpt-3.5-turbo", "What is FastAPI?", None, {"text": "Web"})
+
+        assert await cache.get("gpt-3.5-turbo", "How do I bake bread?") is None
+        assert await cache.get("gpt-4", "What is FastAPI?") is None
+        assert cache.stats()["misses"] == 3
+
+    @pytest.mark.asyncio
+    async def test_context_is_part_of_the_match(self):
+        cache = SemanticCache(HashingEmbedder(), threshold=0.9, index_mode="flat")
+
+        await cache.set(
+            "gpt-3.5-turbo", "What is it?", "Python web framework", {"text": "Web"}
+        )
+
+        assert await cache.get("gpt-3.5-turbo", "What is it?", "Baking") is None
+        assert await cache.get("gpt-3.5-turbo", "What is it?", "Python web framework")
+
+    @pytest.mark.asyncio
+    async def test_eviction_drops_cached_value(self):
+        cache = SemanticCache(
+            HashingEmbedder(), threshold=0.99, max_entries=1, index_mode="flat"
+        )
+
+        await cache.set("gpt-3.5-turbo", "What is FastAPI?", None, {"text": "A"})
+        await cache.set("gpt-3.5-turbo", "How do I bake bread?", None, {"text": "B"})
+
+        assert await cache.get("gpt-3.5-turbo", "What is FastAPI?") is None
+        assert await cache.get("gpt-3.5-turbo", "How do I bake bread?") is not None
+        assert cache.stats()["entries"] == 1
+
+    @pytest.mark.asyncio
+    async def test_different_question_with_same_context_misses(self):
+        cache = SemanticCache(HashingEmbedder(), threshold=0.9, index_mode="flat")
+        context = (
+            "FastAPI is a modern, fast web framework for building APIs with "
+            "Python based on standard type hints. It was created by Sebastian "
+            "Ramirez and is released under the MIT license."
+        )
+
+        await cache.set("gpt-3.5-turbo", "Who created it?", context, {"text": "A"})
+
+        assert (
+            await cache.get(
+                "gpt-3.5-turbo", "What license is it released under?", context
+            )
+            is None
+        )
+        assert await cache.get("gpt-3.5-turbo", "Is it safe?", context) is None
+        assert await cache.get("gpt-3.5-turbo", "Who created it?", context)
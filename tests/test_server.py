@@ -0,0 +1,109 @@
+import os
+import tempfile
+import time
+import httpx
+import pytest
+from app.server import (
+    cleanup_shared_state,
+    gunicorn_options,
+    prepare_shared_state,
+    shared_state_env,
+)
+from app.settings import get_settings, override_settings
+from benchmarks.loadtest import ServerProcess, api_env, free_port
+from benchmarks.mock_upstream import MockUpstream
+
+
+class TestSharedState:
+    def test_unset_backends_get_files_in_the_state_dir(self):
+        settings = get_settings()
+        with override_settings(database_url=None, shared_state_path=None):
+            env = shared_state_env(get_settings(), "/run/api")
+
+        assert env == {
+            "DATABASE_URL": "sqlite:////run/api/questions.db",
+            "SHARED_STATE_PATH": "/run/api/shared.db",
+        }
+        with override_settings(database_url="sqlite:///app.db"):
+            assert "DATABASE_URL" not in shared_state_env(get_settings(), "/run")
+        assert get_settings() is settings
+
+    def test_single_worker_keeps_state_in_process(self):
+        with override_settings(workers=1, database_url=None):
+            assert prepare_shared_state(get_settings()) is None
+            assert get_settings().database_url is None
+
+    def test_configured_backends_are_kept(self):
+        with override_settings(
+            workers=4, database_url="sqlite:///app.db", shared_state_path="s.db"
+        ):
+            assert prepare_shared_state(get_settings()) is None
+
+    def test_workers_inherit_the_shared_paths(self, monkeypatch):
+        monkeypatch.delenv("DATABASE_URL", raising=False)
+        monkeypatch.delenv("SHARED_STATE_PATH", raising=False)
+        with override_settings(workers=2, database_url=None, shared_state_path=None):
+            state_dir = prepare_shared_state(get_settings())
+            try:
+                settings = get_settings()
+                assert os.environ["SHARED_STATE_PATH"] == settings.shared_state_path
+                assert settings.shared_state_path.startswith(state_dir)
+                assert settings.database_url.startswith("sqlite:///" + state_dir)
+            finally:
+                cleanup_shared_state(state_dir)
+
+        assert not os.path.exists(state_dir)
+
+    def test_gunicorn_options(self):
+        with override_settings(
+            host="127.0.0.1", port=9000, workers=4, upstream_total_timeout=60
+        ):
+            options = gunicorn_options(get_settings())
+
+        assert options["bind"] == "127.0.0.1:9000"
+        assert options["workers"] == 4
+        assert options["worker_class"] == "uvicorn.workers.UvicornWorker"
+        assert options["preload_app"] is True
+        assert options["graceful_timeout"] == 60
+
+
+class TestWorkers:
+    @pytest.fixture
+    def upstream(self):
+        with MockUpstream(port=0) as upstream:
+            yield upstream
+
+    def test_workers_share_history_and_cache(self, upstream):
+        port = free_port()
+        with tempfile.TemporaryDirectory() as upload_dir:
+            env = api_env(f"http://127.0.0.1:{upstream.port}", upload_dir)
+            env.update(WORKERS="2", HOST="127.0.0.1", PORT=str(port))
+            for name in ("DATABASE_URL", "SHARED_STATE_PATH"):
+                env.pop(name, None)
+            with ServerProcess(["app.server"], port, env) as api:
+                # A new connection per request, so both workers answer
+                for i in range(6):
+                    response = httpx.post(
+                        api.base_url + "/api/v1/ask",
+                        json={"question": f"Question {i}"},
+                    )
+                    assert response.status_code == 200
+                # Rows are written in batches, so the newest can lag a moment
+                deadline = time.monotonic() + 5
+                while time.monotonic() < deadline:
+                    if len(httpx.get(api.base_url + "/api/v1/questions").json()) == 6:
+                        break
+                    time.sleep(0.05)
+                counts = {
+                    len(httpx.get(api.base_url + "/api/v1/questions").json())
+                    for _ in range(6)
+                }
+                before = upstream.requests
+                for _ in range(4):
+                    httpx.post(
+                        api.base_url + "/api/v1/ask", json={"question": "Question 0"}
+                    )
+
+        assert counts == {6}
+        # Answered from the shared cache by whichever worker took it
+        assert upstream.requests == before
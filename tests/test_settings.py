@@ -0,0 +1,118 @@
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import pytest
+from fastapi.testclient import TestClient
+from app.clients import registry
+from app.main import app
+from app.settings import Settings, get_settings, override_settings
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class TestSettings:
+    def test_defaults(self):
+        settings = Settings.from_env({})
+
+        assert settings.openai_model == "gpt-3.5-turbo"
+        assert settings.cache_enabled is True
+        assert settings.database_url is None
+        assert settings.startup_preload is False
+
+    def test_values_are_typed(self):
+        settings = Settings.from_env(
+            {
+                "OPENAI_MAX_TOKENS": "500",
+                "OPENAI_TEMPERATURE": "0.2",
+                "HEDGE_ENABLED": "true",
+                "CACHE_ENABLED": "0",
+                "UPLOAD_DIR": "/tmp/pdfs",
+            }
+        )
+
+        assert settings.openai_max_tokens == 500
+        assert settings.openai_temperature == 0.2
+        assert settings.hedge_enabled is True
+        assert settings.cache_enabled is False
+        assert settings.upload_dir == "/tmp/pdfs"
+
+    def test_empty_values_keep_the_default(self):
+        settings = Settings.from_env({"OPENAI_API_KEY": "", "PORT": " "})
+
+        assert settings.openai_api_key is None
+        assert settings.port == 8000
+
+    @pytest.mark.parametrize(
+        "name, value",
+        [("BATCH_MAX_ITEMS", "many"), ("HEDGE_ENABLED", "maybe"), ("PORT", "8.5")],
+    )
+    def test_invalid_values_name_the_variable(self, name, value):
+        with pytest.raises(ValueError, match=f"Invalid value for {name}"):
+            Settings.from_env({name: value})
+
+    def test_override_is_undone(self):
+        before = get_settings().batch_max_items
+
+        with override_settings(batch_max_items=3) as settings:
+            assert get_settings() is settings
+            assert settings.batch_max_items == 3
+
+        assert get_settings().batch_max_items == before
+
+
+class TestStartup:
+    def setup_method(self):
+        asyncio.run(registry.aclose())
+
+    def test_import_has_no_side_effects(self, tmp_path):
+        # A fresh interpreter: no API key needed, no SDK or numpy import,
+        # nothing written to disk
+        env = {k: v for k, v in os.environ.items() if k != "OPENAI_API_KEY"}
+        env["PYTHONPATH"] = ROOT
+        script = (
+            "import json, sys, app.main; "
+            "print(json.dumps([m in sys.modules for m in ('openai', 'numpy')]))"
+        )
+
+        result = subprocess.run(
+            [sys.executable, "-c", script],
+            cwd=tmp_path,
+            env=env,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+
+        assert json.loads(result.stdout) == [False, False]
+        assert os.listdir(tmp_path) == []
+
+    def test_clients_are_built_on_first_use(self):
+        with TestClient(app) as client:
+            assert client.get("/health").status_code == 200
+            # Only the upstream client is warmed, in the background
+            assert set(registry._clients) <= {"openai"}
+
+    def test_preload_builds_clients_at_startup(self, tmp_path):
+        with override_settings(startup_preload=True, upload_dir=str(tmp_path)):
+            with TestClient(app):
+                assert "openai" in registry._clients
+                assert "file_store" in registry._clients
+
+        assert registry._clients == {}
+
+    def test_startup_fails_without_api_key(self):
+        with override_settings(openai_api_key=None):
+            with pytest.raises(ValueError, match="OPENAI_API_KEY"):
+                with TestClient(app):
+                    pass
+
+    def test_app_metadata_comes_from_settings(self):
+        try:
+            with override_settings(app_name="Renamed API", app_version="2.0.0"):
+                with TestClient(app):
+                    assert app.title == "Renamed API"
+                    assert app.version == "2.0.0"
+        finally:
+            app.title, app.version = "Simple AI Question API", "1.0.0"
@@ -0,0 +1,76 @@
+import asyncio
+import pytest
+from app.singleflight import SingleFlight
+
+
+class TestSingleFlight:
+    @pytest.mark.asyncio
+    async def test_concurrent_callers_share_one_call(self):
+        flight = SingleFlight()
+        calls = 0
+
+        async def fetch():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.05)
+            return "answer"
+
+        results = await asyncio.gather(*[flight.do("key", fetch) for _ in range(10)])
+
+        assert results == ["answer"] * 10
+        assert calls == 1
+        assert flight.coalesced == 9
+        assert len(flight) == 0
+
+    @pytest.mark.asyncio
+    async def test_different_keys_do_not_share(self):
+        flight = SingleFlight()
+
+        async def fetch(value):
+            await asyncio.sleep(0.01)
+            return value
+
+        results = await asyncio.gather(
+            flight.do("a", lambda: fetch("A")), flight.do("b", lambda: fetch("B"))
+        )
+
+        assert results == ["A", "B"]
+        assert flight.coalesced == 0
+
+    @pytest.mark.asyncio
+    async def test_errors_propagate_to_all_waiters_and_are_not_remembered(self):
+        flight = SingleFlight()
+
+        async def failing():
+            await asyncio.sleep(0.01)
+            raise ValueError("upstream failed")
+
+        results = await asyncio.gather(
+            *[flight.do("key", failing) for _ in range(3)], return_exceptions=True
+        )
+
+        assert all(isinstance(r, ValueError) for r in results)
+
+        async def succeeding():
+            return "recovered"
+
+        assert await flight.do("key", succeeding) == "recovered"
+
+    @pytest.mark.asyncio
+    async def test_cancelled_caller_does_not_cancel_shared_call(self):
+        flight = SingleFlight()
+
+        async def fetch():
+            await asyncio.sleep(0.05)
+            return "answer"
+
+        leader = asyncio.ensure_future(flight.do("key", fetch))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(flight.do("key", fetch))
+        await asyncio.sleep(0)
+
+        leader.cancel()
+
+        assert await follower == "answer"
+        with pytest.raises(asyncio.CancelledError):
+            await leader
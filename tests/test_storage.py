@@ -0,0 +1,319 @@
+import sqlite3
+import sys
+import threading
+import time
+import pytest
+from unittest.mock import patch
+from app.settings import override_settings
+from app.storage import (
+    MemoryQuestionStore,
+    SQLiteQuestionStore,
+    create_question_store,
+    question_hash,
+)
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        yield MemoryQuestionStore()
+    else:
+        sqlite_store = SQLiteQuestionStore(str(tmp_path / "questions.db"))
+        yield sqlite_store
+        sqlite_store.close()
+
+
+class TestQuestionStores:
+    def test_add_and_list_in_insertion_order(self, store):
+        store.add("What is Python?", "A language.", "Programming")
+        store.add("What is FastAPI?", "A framework.")
+        store.flush()
+
+        rows = store.list_questions()
+
+        assert [row["question"] for row in rows] == [
+            "What is Python?",
+            "What is FastAPI?",
+        ]
+        assert rows[0]["answer"] == "A language."
+        assert rows[0]["context"] == "Programming"
+        assert rows[1]["context"] is None
+        assert rows[0]["id"] < rows[1]["id"]
+        assert rows[0]["created_at"] <= rows[1]["created_at"]
+        assert "question_hash" not in rows[0]
+        assert store.count() == 2
+
+    def test_find_by_question_hash(self, store):
+        store.add("What is Python?", "First", "Programming")
+        store.add("What is Python?", "Other context", "Snakes")
+        store.add("what  is python?", "Second", "Programming")
+        store.flush()
+
+        matches = store.find("What is Python?", "Programming")
+
+        assert [row["answer"] for row in matches] == ["Second", "First"]
+
+    def test_keyset_pagination(self, store):
+        for i in range(5):
+            store.add(f"Question {i}?", f"Answer {i}")
+        store.flush()
+
+        first = store.list_questions(limit=2)
+        second = store.list_questions(limit=2, after=first[-1]["id"])
+        last = store.list_questions(limit=2, after=second[-1]["id"])
+
+        assert [row["question"] for row in first + second + last] == [
+            f"Question {i}?" for i in range(5)
+        ]
+        assert len(last) == 1
+
+    def test_filters_by_time_range_and_context(self, store):
+        with patch("app.storage.time.time", side_effect=[100.0, 200.0, 300.0]):
+            store.add("Old?", "Answer", "A")
+            store.add("Middle?", "Answer", "B")
+            store.add("New?", "Answer", "A")
+        store.flush()
+
+        assert [r["question"] for r in store.list_questions(since=200.0)] == [
+            "Middle?",
+            "New?",
+        ]
+        assert [r["question"] for r in store.list_questions(until=200.0)] == ["Old?"]
+        assert [r["question"] for r in store.list_questions(context="A")] == [
+            "Old?",
+            "New?",
+        ]
+        assert store.list_questions(since=150.0, until=250.0, context="A") == []
+
+    def test_full_text_search_ranks_and_paginates(self, store):
+        store.add("What is FastAPI?", "FastAPI is a Python web framework.")
+        store.add("What is Django?", "Django is a Python web framework.", "Web")
+        store.add("How do I bake bread?", "Use flour, water and yeast.")
+        store.add("Why FastAPI?", "FastAPI is fast. FastAPI has great docs.")
+        store.flush()
+
+        results = store.search("fastapi")
+
+        assert [row["question"] for row in results] == [
+            "Why FastAPI?",
+            "What is FastAPI?",
+        ]
+        assert results[0]["score"] > results[1]["score"]
+        assert {row["question"] for row in store.search("python web")} == {
+            "What is FastAPI?",
+            "What is Django?",
+        }
+
+        first = store.search("python web", limit=1)
+        second = store.search("python web", limit=1, offset=1)
+        assert len(first) == len(second) == 1
+        assert first[0]["id"] != second[0]["id"]
+        assert store.search("python web", limit=1, offset=2) == []
+        assert store.search("bread python") == []
+        assert store.search("!!!") == []
+        assert [row["question"] for row in store.search('yeast" * (')] == [
+            "How do I bake bread?"
+        ]
+
+    def test_clear(self, store):
+        store.add("What is Python?", "A language.")
+        store.clear()
+
+        assert store.list_questions() == []
+        assert store.search("python") == []
+        assert store.count() == 0
+
+
+class TestMemoryQuestionStore:
+    def test_evicted_rows_leave_search_index(self):
+        store = MemoryQuestionStore(max_rows=2)
+        store.add("What is FastAPI?", "A framework.")
+        store.add("What is Django?", "A framework.")
+        store.add("What is Flask?", "A framework.")
+
+        assert [row["question"] for row in store.search("framework")] == [
+            "What is Django?",
+            "What is Flask?",
+        ]
+        assert store.search("fastapi") == []
+
+    def test_keeps_only_most_recent_rows(self):
+        store = MemoryQuestionStore(max_rows=3)
+        for i in range(5):
+            store.add(f"Question {i}?", f"Answer {i}")
+
+        assert [row["question"] for row in store.list_questions()] == [
+            "Question 2?",
+            "Question 3?",
+            "Question 4?",
+        ]
+
+    def test_reads_are_safe_during_concurrent_adds(self):
+        store = MemoryQuestionStore(max_rows=50)
+        errors = []
+        # Switch threads often so unguarded iteration would see mutations
+        interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+
+        def read():
+            try:
+                for _ in range(200):
+                    store.list_questions()
+                    store.search("answer")
+            except Exception as e:
+                errors.append(e)
+
+        try:
+            reader = threading.Thread(target=read)
+            reader.start()
+            for i in range(5000):
+                store.add(f"Question {i}?", "Answer")
+            reader.join()
+        finally:
+            sys.setswitchinterval(interval)
+
+        assert errors == []
+        assert store.count() == 50
+
+
+class TestSQLiteQuestionStore:
+    def test_uses_wal_and_indexes(self, tmp_path):
+        path = str(tmp_path / "questions.db")
+        store = SQLiteQuestionStore(path)
+        store.close()
+
+        conn = sqlite3.connect(path)
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        indexes = {row[1] for row in conn.execute("PRAGMA index_list(questions)")}
+        assert {"idx_questions_created_at", "idx_questions_hash"} <= indexes
+
+        plan = " ".join(
+            str(row)
+            for row in conn.execute(
+                "EXPLAIN QUERY PLAN SELECT * FROM questions WHERE question_hash = ?",
+                ("x",),
+            )
+        )
+        assert "idx_questions_hash" in plan
+        conn.close()
+
+    def test_search_backfills_rows_from_before_fts(self, tmp_path):
+        path = str(tmp_path / "questions.db")
+        store = SQLiteQuestionStore(path)
+        store.add("What is FastAPI?", "A framework.")
+        store.close()
+
+        conn = sqlite3.connect(path)
+        conn.executescript(
+            "DROP TRIGGER questions_fts_insert; DROP TRIGGER questions_fts_delete;"
+            "DROP TABLE questions_fts;"
+        )
+        conn.close()
+
+        reopened = SQLiteQuestionStore(path)
+        assert [row["question"] for row in reopened.search("fastapi")] == [
+            "What is FastAPI?"
+        ]
+        reopened.close()
+
+    def test_rows_survive_restart(self, tmp_path):
+        path = str(tmp_path / "questions.db")
+        store = SQLiteQuestionStore(path)
+        store.add("What is Python?", "A language.")
+        store.close()
+
+        reopened = SQLiteQuestionStore(path)
+        assert [row["question"] for row in reopened.list_questions()] == [
+            "What is Python?"
+        ]
+        reopened.close()
+
+    def test_concurrent_writers(self, tmp_path):
+        store = SQLiteQuestionStore(str(tmp_path / "questions.db"), batch_size=25)
+
+        def write(worker):
+            for i in range(100):
+                store.add(f"Worker {worker} question {i}?", "Answer")
+
+        threads = [threading.Thread(target=write, args=(w,)) for w in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        store.flush()
+        assert store.count() == 400
+        store.close()
+
+    def test_pages_follow_commit_order_across_workers(self, tmp_path):
+        path = str(tmp_path / "questions.db")
+        first, second = SQLiteQuestionStore(path), SQLiteQuestionStore(path)
+        # The first worker stamps its row, the second commits a newer one
+        # that a poller reads, and only then does the first one commit
+        stamped = time.time()
+        second.add("Newer?", "Answer")
+        second.flush()
+        (newer,) = first.list_questions()
+        first._queue.put(("Older?", "Answer", None, stamped, "h"))
+        first.flush()
+
+        assert [row["question"] for row in first.list_questions(after=newer["id"])] == [
+            "Older?"
+        ]
+        first.close()
+        second.close()
+
+    def test_failed_batch_keeps_the_good_rows(self, tmp_path):
+        store = SQLiteQuestionStore(str(tmp_path / "questions.db"))
+        store._queue.put(("Good 1?", "Answer", None, 1.0, "h1"))
+        # NOT NULL answer: fails the whole INSERT batch
+        store._queue.put(("Bad?", None, None, 2.0, "h2"))
+        store._queue.put(("Good 2?", "Answer", None, 3.0, "h3"))
+        store.flush()
+
+        assert [row["question"] for row in store.list_questions()] == [
+            "Good 1?",
+            "Good 2?",
+        ]
+        assert store.dropped == 1
+        # The writer is still running
+        store.add("Later?", "Answer")
+        store.flush()
+        assert store.count() == 3
+        store.close()
+
+    def test_fails_fast_once_the_writer_is_gone(self, tmp_path):
+        store = SQLiteQuestionStore(str(tmp_path / "questions.db"))
+        store.close()
+
+        with pytest.raises(RuntimeError, match="writer has stopped"):
+            store.add("What is Python?", "A language.")
+        with pytest.raises(RuntimeError, match="writer has stopped"):
+            store.flush()
+
+
+class TestCreateQuestionStore:
+    def test_defaults_to_memory(self):
+        with override_settings(database_url=None):
+            assert isinstance(create_question_store(), MemoryQuestionStore)
+
+    def test_sqlite_url(self, tmp_path):
+        url = f"sqlite:///{tmp_path / 'app.db'}"
+        with override_settings(database_url=url):
+            store = create_question_store()
+
+        assert isinstance(store, SQLiteQuestionStore)
+        assert store.path == str(tmp_path / "app.db")
+        store.close()
+
+    def test_unsupported_url(self):
+        with override_settings(database_url="postgresql://localhost/db"):
+            with pytest.raises(ValueError, match="Unsupported DATABASE_URL"):
+                create_question_store()
+
+
+def test_question_hash_normalizes_whitespace_and_case():
+    assert question_hash("What is  Python?", "ctx") == question_hash(
+        "what is python?", "ctx"
+    )
+    assert question_hash("What is Python?", "ctx") != question_hash("What is Python?")
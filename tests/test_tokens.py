@@ -0,0 +1,103 @@
+import pytest
+from app.settings import override_settings
+from app.tokens import (
+    ApproximateEncoding,
+    PromptTooLarge,
+    TokenBudget,
+    TokenUsage,
+    get_encoding,
+)
+
+
+def make_budget(strategy="relevant", window=200, max_tokens=50, **kwargs):
+    with override_settings(openai_context_window=window):
+        budget = TokenBudget("gpt-3.5-turbo", max_tokens, strategy, **kwargs)
+        limit = budget.context_budget("What is FastAPI?")
+    return budget, limit
+
+
+def filler(n):
+    return " ".join(f"Sentence {i} talks about nothing much." for i in range(n))
+
+
+class TestEncoding:
+    def test_encoder_is_loaded_once_per_model(self):
+        assert get_encoding("gpt-3.5-turbo") is get_encoding("gpt-3.5-turbo")
+
+    def test_approximate_encoding_round_trips(self):
+        encoding = ApproximateEncoding()
+        text = "Hello, world!  FastAPI\nrocks."
+
+        assert encoding.decode(encoding.encode(text)) == text
+        assert len(encoding.encode("What is FastAPI?")) == 5
+
+
+class TestTokenBudget:
+    def test_small_context_is_sent_verbatim(self):
+        budget, _ = make_budget()
+
+        with override_settings(openai_context_window=200):
+            assert budget.fit("What is FastAPI?", "A web framework.") == (
+                "A web framework."
+            )
+            assert budget.fit("What is FastAPI?", None) is None
+
+    @pytest.mark.parametrize("strategy", ["head", "middle", "relevant"])
+    def test_oversized_context_is_trimmed_to_budget(self, strategy):
+        budget, limit = make_budget(strategy)
+
+        with override_settings(openai_context_window=200):
+            context = budget.fit("What is FastAPI?", filler(100))
+
+        assert 0 < budget.count(context) <= limit
+
+    def test_head_and_middle_keep_the_ends(self):
+        head, _ = make_budget("head")
+        middle, _ = make_budget("middle")
+        text = filler(100)
+
+        with override_settings(openai_context_window=200):
+            assert head.fit("What is FastAPI?", text).startswith("Sentence 0 ")
+            trimmed = middle.fit("What is FastAPI?", text)
+
+        assert trimmed.startswith("Sentence 0 ")
+        assert trimmed.endswith("Sentence 99 talks about nothing much.")
+
+    def test_relevant_keeps_sentences_matching_the_question(self):
+        budget, _ = make_budget("relevant")
+        text = filler(50) + " FastAPI is a Python web framework. " + filler(50)
+
+        with override_settings(openai_context_window=200):
+            context = budget.fit("What is FastAPI?", text)
+
+        assert "FastAPI is a Python web framework." in context
+
+    def test_max_context_tokens_caps_the_budget(self):
+        _, limit = make_budget(max_context_tokens=10)
+
+        assert limit == 10
+
+    def test_reject_strategy_and_oversized_question_raise(self):
+        budget, _ = make_budget("reject")
+
+        with override_settings(openai_context_window=200):
+            with pytest.raises(PromptTooLarge):
+                budget.fit("What is FastAPI?", filler(100))
+            with pytest.raises(PromptTooLarge):
+                budget.fit(filler(100), None)
+
+    def test_context_over_the_character_cap_is_rejected(self):
+        budget, _ = make_budget("head", max_context_chars=100)
+
+        with override_settings(openai_context_window=200):
+            assert budget.fit("What is FastAPI?", "x" * 100) is not None
+            with pytest.raises(PromptTooLarge, match="the limit is 100"):
+                budget.fit("What is FastAPI?", "x" * 101)
+
+    def test_rejects_unknown_strategy(self):
+        with pytest.raises(ValueError, match="Unknown context trim strategy"):
+            TokenBudget("gpt-3.5-turbo", 100, "summarize-with-magic")
+
+
+def test_token_usage_totals():
+    assert TokenUsage(10, 5).total_tokens == 15
@@ -0,0 +1,284 @@
+import asyncio
+import io
+import json
+import random
+import pytest
+from unittest.mock import MagicMock
+from app import tracing
+from app.limiter import UpstreamLimiter
+from app.openai_client import OpenAIClient
+from app.providers import Backend, BackendHealth, BackendRouter
+from app.settings import override_settings
+from app.tracing import (
+    ConsoleExporter,
+    InMemoryExporter,
+    NoopExporter,
+    SpanContext,
+    Tracer,
+    format_traceparent,
+    parse_traceparent,
+)
+from benchmarks.mock_upstream import MockUpstream
+
+TRACE_ID = "4bf92f3577b34da6a3ce929d0e0e4736"
+PARENT_ID = "00f067aa0ba902b7"
+TRACEPARENT = f"00-{TRACE_ID}-{PARENT_ID}-01"
+
+
+@pytest.fixture
+def exporter(monkeypatch):
+    exporter = InMemoryExporter()
+    monkeypatch.setattr(tracing, "TRACER", Tracer(exporter, sample_rate=1.0))
+    return exporter
+
+
+def by_name(spans):
+    return {span.name: span for span in spans}
+
+
+class TestTraceparent:
+    def test_round_trip(self):
+        context = parse_traceparent(TRACEPARENT)
+
+        assert context == SpanContext(TRACE_ID, PARENT_ID, True, remote=True)
+        assert format_traceparent(context) == TRACEPARENT
+
+    def test_not_sampled_flag(self):
+        context = parse_traceparent(f"00-{TRACE_ID}-{PARENT_ID}-00")
+
+        assert context.sampled is False
+        assert format_traceparent(context).endswith("-00")
+
+    def test_keeps_tracestate(self):
+        context = parse_traceparent(TRACEPARENT, "vendor=abc")
+
+        assert context.tracestate == "vendor=abc"
+
+    @pytest.mark.parametrize(
+        "header",
+        [
+            None,
+            "",
+            "garbage",
+            f"00-{'0' * 32}-{PARENT_ID}-01",
+            f"00-{TRACE_ID}-{'0' * 16}-01",
+            f"ff-{TRACE_ID}-{PARENT_ID}-01",
+            f"00-{TRACE_ID.upper()}-{PARENT_ID}-01",
+            f"00-{TRACE_ID}-{PARENT_ID}-01-extra",
+        ],
+    )
+    def test_invalid_headers_are_ignored(self, header):
+        assert parse_traceparent(header) is None
+
+    def test_future_versions_may_add_fields(self):
+        context = parse_traceparent(f"01-{TRACE_ID}-{PARENT_ID}-01-extra")
+
+        assert context.trace_id == TRACE_ID
+
+
+class TestTracer:
+    def test_nested_spans_share_the_trace(self):
+        exporter = InMemoryExporter()
+        tracer = Tracer(exporter)
+
+        with tracer.span("outer") as outer:
+            with tracer.span("inner", attributes={"key": "value"}) as inner:
+                assert tracing.current_span() is inner
+            assert tracing.current_span() is outer
+
+        spans = by_name(exporter.spans())
+        assert spans["inner"].context.trace_id == spans["outer"].context.trace_id
+        assert spans["inner"].parent_id == spans["outer"].context.span_id
+        assert spans["outer"].parent_id is None
+        assert spans["inner"].attributes == {"key": "value"}
+        assert spans["outer"].duration >= spans["inner"].duration
+        assert tracing.current_span() is tracing.INVALID_SPAN
+
+    def test_continues_a_remote_parent(self):
+        exporter = InMemoryExporter()
+        tracer = Tracer(exporter)
+
+        with tracer.span("server", "server", parent=parse_traceparent(TRACEPARENT)):
+            pass
+
+        (span,) = exporter.spans()
+        assert span.context.trace_id == TRACE_ID
+        assert span.parent_id == PARENT_ID
+        assert span.kind == "server"
+
+    def test_exception_marks_the_span_as_failed(self):
+        exporter = InMemoryExporter()
+        tracer = Tracer(exporter)
+
+        with pytest.raises(ValueError):
+            with tracer.span("failing"):
+                raise ValueError("boom")
+
+        (span,) = exporter.spans()
+        assert span.status == "error"
+        assert span.events[0]["attributes"]["exception.type"] == "ValueError"
+
+    def test_noop_exporter_disables_recording(self):
+        tracer = Tracer(NoopExporter())
+
+        with tracer.span("ignored") as span:
+            assert span.recording is False
+            assert tracing.current_span() is tracing.INVALID_SPAN
+
+    def test_zero_sample_rate_records_nothing(self):
+        exporter = InMemoryExporter()
+        tracer = Tracer(exporter, sample_rate=0.0)
+
+        with tracer.span("ignored"):
+            pass
+
+        assert exporter.spans() == []
+
+    def test_partial_sampling_keeps_whole_traces(self):
+        exporter = InMemoryExporter()
+        tracer = Tracer(exporter, sample_rate=0.5, rng=random.Random(7))
+
+        for _ in range(200):
+            with tracer.span("root"):
+                with tracer.span("child"):
+                    pass
+
+        roots = [s for s in exporter.spans() if s.name == "root"]
+        children = [s for s in exporter.spans() if s.name == "child"]
+        assert 60 < len(roots) < 140
+        assert len(children) == len(roots)
+
+    def test_unsampled_remote_parent_is_still_propagated(self):
+        exporter = InMemoryExporter()
+        tracer = Tracer(exporter)
+        parent = parse_traceparent(f"00-{TRACE_ID}-{PARENT_ID}-00")
+
+        with tracer.span("server", "server", parent=parent) as span:
+            assert span.recording is False
+            with tracer.span("child"):
+                headers = tracing.inject({})
+
+        assert exporter.spans() == []
+        assert headers == {"traceparent": f"00-{TRACE_ID}-{PARENT_ID}-00"}
+
+    @pytest.mark.asyncio
+    async def test_tasks_inherit_the_current_span(self):
+        exporter = InMemoryExporter()
+        tracer = Tracer(exporter)
+
+        async def work(name):
+            with tracer.span(name):
+                await asyncio.sleep(0)
+
+        with tracer.span("parent") as parent:
+            await asyncio.gather(work("a"), work("b"))
+
+        spans = by_name(exporter.spans())
+        assert spans["a"].parent_id == parent.context.span_id
+        assert spans["b"].parent_id == parent.context.span_id
+
+    def test_unknown_exporter(self):
+        with override_settings(tracing_exporter="zipkin"):
+            with pytest.raises(ValueError):
+                tracing.create_tracer()
+
+
+class TestExporters:
+    def test_console_exporter_writes_json_lines(self):
+        out = io.StringIO()
+        tracer = Tracer(ConsoleExporter(out))
+
+        with tracer.span("work", attributes={"n": 1}):
+            pass
+
+        record = json.loads(out.getvalue())
+        assert record["name"] == "work"
+        assert record["attributes"] == {"n": 1}
+        assert len(record["traceId"]) == 32
+        assert record["endTimeUnixNano"] >= record["startTimeUnixNano"]
+
+    def test_in_memory_exporter_clear(self):
+        exporter = InMemoryExporter()
+        tracer = Tracer(exporter)
+        with tracer.span("work"):
+            pass
+
+        exporter.clear()
+
+        assert exporter.spans() == []
+
+
+class TestPropagation:
+    def test_upstream_headers_without_a_trace(self):
+        assert tracing.upstream_headers() == {}
+
+    def test_upstream_headers_carry_the_current_span(self, exporter):
+        with tracing.span("client", "client") as span:
+            headers = tracing.upstream_headers()["extra_headers"]
+
+        assert headers["traceparent"] == format_traceparent(span.context)
+
+
+class TestInstrumentation:
+    @pytest.mark.asyncio
+    async def test_router_attempts_get_client_spans(self, exporter):
+        backends = [
+            Backend("bad", "m1", client_factory=MagicMock(), health=BackendHealth()),
+            Backend("good", "m2", client_factory=MagicMock(), health=BackendHealth()),
+        ]
+
+        class Unavailable(Exception):
+            status_code = 503
+
+        async def call(backend):
+            if backend.name == "bad":
+                raise Unavailable("down")
+            return "ok"
+
+        await BackendRouter(backends, explore_rate=0).call(call)
+
+        spans = exporter.spans()
+        assert [s.name for s in spans] == ["chat m1", "chat m2"]
+        assert [s.status for s in spans] == ["error", "unset"]
+        assert spans[1].kind == "client"
+        assert spans[1].attributes["llm.backend"] == "good"
+
+    @pytest.mark.asyncio
+    async def test_limiter_wait_gets_a_span(self, exporter):
+        limiter = UpstreamLimiter(max_in_flight=1)
+        await limiter.acquire()
+
+        waiter = asyncio.ensure_future(limiter.acquire())
+        await asyncio.sleep(0)
+        limiter.release()
+        await waiter
+
+        (span,) = exporter.spans()
+        assert span.name == "limiter.wait"
+
+    @pytest.mark.asyncio
+    async def test_completion_trace_reaches_the_upstream(self, exporter, monkeypatch):
+        with MockUpstream(port=0) as upstream:
+            monkeypatch.setenv("OPENAI_BASE_URL", upstream.base_url)
+            client = OpenAIClient()
+            with tracing.span("request") as root:
+                await client.acomplete("What is FastAPI?")
+            await client.aclose()
+
+        spans = by_name(exporter.spans())
+        chat = spans["chat gpt-3.5-turbo"]
+        assert spans["cache.lookup"].parent_id == root.context.span_id
+        assert spans["llm.complete"].parent_id == root.context.span_id
+        assert chat.parent_id == spans["llm.complete"].context.span_id
+        assert spans["llm.complete"].attributes["gen_ai.usage.input_tokens"] == 10
+        assert upstream.traceparents == [format_traceparent(chat.context)]
+
+    @pytest.mark.asyncio
+    async def test_no_trace_headers_when_tracing_is_off(self, monkeypatch):
+        with MockUpstream(port=0) as upstream:
+            monkeypatch.setenv("OPENAI_BASE_URL", upstream.base_url)
+            client = OpenAIClient()
+            await client.acomplete("What is FastAPI?")
+            await client.aclose()
+
+        assert upstream.traceparents == [None]